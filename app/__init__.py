@@ -2,6 +2,12 @@ from flask import Flask
 from flask_cors import CORS
 import os
 from app.utils.database import init_app_db
+from app.utils.bulk_ingest import init_app_ingest
+from app.utils.story_jobs import init_app_story_jobs
+from app.utils.song_pipeline import init_app_songs
+from app.utils.corpus_stats import init_app_corpus
+from app.utils.jieba_warmup import init_app_jieba
+from app.benchmarks import init_app_benchmarks
 from app.config import Config
 
 
@@ -24,9 +30,19 @@ def create_app(test_config=None):
     except OSError:
         pass
 
-    # 初始化数据库
+    # 注册数据库连接回收和迁移命令，创建应用时不访问数据库，表结构由flask db-upgrade在部署时升级
     init_app_db(app)
 
+    # 注册歌曲维护、语料库统计、批量导入、故事任务和基准测试命令
+    init_app_songs(app)
+    init_app_corpus(app)
+    init_app_ingest(app)
+    init_app_story_jobs(app)
+    init_app_benchmarks(app)
+
+    # 预热分词词典，第一个请求不再承担加载词典的耗时
+    init_app_jieba(app)
+
     # 注册路由
     from app.routes import api_bp
     app.register_blueprint(api_bp)
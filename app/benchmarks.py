@@ -0,0 +1,212 @@
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+import click
+import jieba
+from flask import current_app
+from flask.cli import with_appcontext
+from app.utils.database import get_db
+from app.utils.keyword_extractor import DEFAULT_STOPWORDS, get_keyword_extractor
+from app.utils.lyrics_cache import LYRICS_NOT_FOUND
+from app.utils.lyrics_search import search_lyrics
+
+# 在全新的解释器中创建应用，输出创建应用和之后第一次分词的耗时(毫秒)，以及创建应用时是否建立了数据库连接池
+_STARTUP_SCRIPT = """
+import json, time
+start = time.perf_counter()
+from app import create_app
+create_app()
+elapsed = (time.perf_counter() - start) * 1000
+import jieba
+start = time.perf_counter()
+jieba.lcut('第一个请求的歌词分词')
+first_cut = (time.perf_counter() - start) * 1000
+from app.utils import database
+print(json.dumps({'ms': elapsed, 'first_cut_ms': first_cut, 'db_touched': database._pool is not None}))
+"""
+
+
+def _summary(timings):
+    return (f"最小 {min(timings):.1f}ms，中位数 {statistics.median(timings):.1f}ms，"
+            f"最大 {max(timings):.1f}ms")
+
+
+@click.command('bench-startup')
+@click.option('--runs', default=5, show_default=True, help='冷启动次数')
+@click.option('--budget-ms', default=2000.0, show_default=True, help='冷启动耗时中位数的上限(毫秒)')
+@click.option('--no-warmup', is_flag=True, help='关闭jieba预热，用于对比第一个请求的分词耗时')
+@with_appcontext
+def bench_startup_command(runs, budget_ms, no_warmup):
+    """
+    测量工作进程冷启动(导入+create_app)和之后第一次分词的耗时，并确认创建应用时没有访问数据库
+    数据库地址指向不可路由的TEST-NET地址，创建应用时一旦连接数据库就会卡住直到超时
+    """
+    env = dict(os.environ, DATABASE_HOST='203.0.113.1', JIEBA_WARMUP='0' if no_warmup else '1')
+    project_root = os.path.dirname(current_app.root_path)
+
+    timings = []
+    first_cuts = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', _STARTUP_SCRIPT],
+            cwd=project_root, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if result['db_touched']:
+            raise click.ClickException('create_app创建了数据库连接池，启动时不应访问数据库')
+        timings.append(result['ms'])
+        first_cuts.append(result['first_cut_ms'])
+
+    median = statistics.median(timings)
+    click.echo(f"冷启动 x{runs}: {_summary(timings)}")
+    click.echo(f"第一次分词: {_summary(first_cuts)}")
+    if median > budget_ms:
+        raise click.ClickException(f"冷启动耗时中位数 {median:.1f}ms 超过上限 {budget_ms:.0f}ms")
+
+
+def _legacy_extract(lyrics, top_n=5, min_length=2):
+    """KeywordExtractor之前的实现：默认HMM分词、生成完整的过滤列表后再用Counter计数，作为对比基线"""
+    words = jieba.cut(lyrics)
+    filtered_words = [
+        word for word in words
+        if len(word.strip()) >= min_length and
+           word.strip() not in DEFAULT_STOPWORDS and
+           not word.strip().isdigit() and
+           not all(ord(c) < 128 for c in word.strip())
+    ]
+    return Counter(filtered_words).most_common(top_n)
+
+
+def _throughput(fn, lyrics_list, repeat):
+    """重复执行repeat次，返回最好一次的每秒处理歌曲数"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(lyrics_list)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(lyrics_list) / best if best else float('inf')
+
+
+@click.command('bench-keywords')
+@click.option('--limit', default=500, show_default=True, help='从数据库读取的歌词数')
+@click.option('--repeat', default=3, show_default=True, help='每种方式的重复次数，取最好成绩')
+@click.option('--batch-size', default=100, show_default=True, help='批量接口每批的歌曲数')
+@with_appcontext
+def bench_keywords_command(limit, repeat, batch_size):
+    """对比旧实现、KeywordExtractor逐首提取和批量提取的吞吐量(首/秒)"""
+    db = get_db()
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT lyrics FROM songs WHERE lyrics IS NOT NULL AND lyrics != %s ORDER BY id LIMIT %s",
+                       (LYRICS_NOT_FOUND, limit))
+        lyrics_list = [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+        db.commit()
+
+    if not lyrics_list:
+        raise click.ClickException('数据库中没有可用的歌词')
+
+    extractor = get_keyword_extractor()
+    jieba.initialize()
+
+    def batched(items):
+        for i in range(0, len(items), batch_size):
+            extractor.extract_many(items[i:i + batch_size])
+
+    click.echo(f"歌词 {len(lyrics_list)} 首，平均 {sum(map(len, lyrics_list)) / len(lyrics_list):.0f} 字")
+    results = [
+        ('旧实现', _throughput(lambda items: [_legacy_extract(lyrics) for lyrics in items], lyrics_list, repeat)),
+        ('逐首提取', _throughput(lambda items: [extractor.extract(lyrics) for lyrics in items], lyrics_list, repeat)),
+        (f'批量提取(每批{batch_size}首)', _throughput(batched, lyrics_list, repeat))
+    ]
+    baseline = results[0][1]
+    for name, songs_per_second in results:
+        click.echo(f"{name}: {songs_per_second:.1f} 首/秒 ({songs_per_second / baseline:.2f}x)")
+
+
+def _sample_lyrics_queries(db, extractor, count, seed):
+    """随机抽取歌曲，从歌词中随机一行取出一到两个词作为查询，保证每个查询至少命中一首歌"""
+    rng = random.Random(seed)
+    cursor = db.cursor()
+    try:
+        # 只在主键索引上随机排序，避免把整表歌词读进排序缓冲区
+        cursor.execute("SELECT id FROM songs ORDER BY RAND() LIMIT %s", (count * 2,))
+        song_ids = [row[0] for row in cursor.fetchall()]
+        if not song_ids:
+            return []
+        placeholders = ', '.join(['%s'] * len(song_ids))
+        cursor.execute(f"SELECT lyrics FROM songs WHERE id IN ({placeholders}) AND lyrics IS NOT NULL "
+                       f"AND lyrics != %s", song_ids + [LYRICS_NOT_FOUND])
+        lyrics_list = [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+        db.commit()
+
+    queries = []
+    for lyrics in lyrics_list:
+        lines = [line for line in lyrics.splitlines() if line.strip()]
+        if not lines:
+            continue
+        words = list(extractor.count(rng.choice(lines)))
+        if words:
+            queries.append(rng.sample(words, min(len(words), rng.choice((1, 2)))))
+        if len(queries) == count:
+            break
+    return queries
+
+
+@click.command('bench-lyrics-search')
+@click.option('--queries', default=200, show_default=True, help='查询次数')
+@click.option('--limit', default=20, show_default=True, help='每次查询返回的歌曲数')
+@click.option('--budget-ms', default=50.0, show_default=True, help='p95耗时上限(毫秒)')
+@click.option('--seed', default=0, show_default=True, help='抽样查询的随机种子')
+@with_appcontext
+def bench_lyrics_search_command(queries, limit, budget_ms, seed):
+    """用从歌词中抽样的查询测量歌词全文搜索(含高亮片段)的延迟分布"""
+    db = get_db()
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*) FROM songs")
+        song_count = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+        db.commit()
+
+    query_list = _sample_lyrics_queries(db, get_keyword_extractor(), queries, seed)
+    if len(query_list) < 2:
+        raise click.ClickException('数据库中没有足够的歌词用于生成查询')
+
+    # 先把每个查询执行一遍，预热缓冲池和全文索引缓存
+    for terms in query_list:
+        search_lyrics(db, terms, limit)
+        db.commit()
+
+    timings = []
+    hits = 0
+    for terms in query_list:
+        start = time.perf_counter()
+        results = search_lyrics(db, terms, limit)
+        db.commit()
+        timings.append((time.perf_counter() - start) * 1000)
+        hits += bool(results)
+
+    percentiles = statistics.quantiles(timings, n=100)
+    p50, p95, p99 = percentiles[49], percentiles[94], percentiles[98]
+    click.echo(f"歌曲 {song_count} 首，查询 {len(timings)} 次，有结果 {hits} 次")
+    click.echo(f"p50 {p50:.1f}ms，p95 {p95:.1f}ms，p99 {p99:.1f}ms，最大 {max(timings):.1f}ms")
+    if p95 > budget_ms:
+        raise click.ClickException(f"p95耗时 {p95:.1f}ms 超过上限 {budget_ms:.0f}ms")
+
+
+def init_app_benchmarks(app):
+    """注册性能基准测试命令"""
+    app.cli.add_command(bench_startup_command)
+    app.cli.add_command(bench_keywords_command)
+    app.cli.add_command(bench_lyrics_search_command)
@@ -16,10 +16,108 @@ class Config:
     DATABASE_PASSWORD = os.environ.get('DATABASE_PASSWORD') or 'password'
     DATABASE_NAME = os.environ.get('DATABASE_NAME') or 'music_story_db'
     DATABASE_PORT = int(os.environ.get('DATABASE_PORT') or 3306)
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE') or 10)  # 每个进程的最大连接数
+    DATABASE_POOL_TIMEOUT = float(os.environ.get('DATABASE_POOL_TIMEOUT') or 5.0)  # 借连接的最长等待时间(秒)
+    DATABASE_POOL_RECYCLE = int(os.environ.get('DATABASE_POOL_RECYCLE') or 3600)  # 连接最长使用时间，超过后重建(秒)
+    DATABASE_POOL_PING_AFTER = float(os.environ.get('DATABASE_POOL_PING_AFTER') or 1.0)  # 空闲超过多久借出前先ping(秒)
 
     # 讯飞星火API配置
     SPARK_APP_ID = os.environ.get('SPARK_APP_ID') or '322c02e9'
     SPARK_API_KEY = os.environ.get('SPARK_API_KEY') or '2bb92aab75d460d926ab795bee8585eb'
     SPARK_API_SECRET = os.environ.get('SPARK_API_SECRET') or 'NjOyNmUwZjNiNzI2MmFiNGE3YTk5MTNm'
     SPARK_URL = os.environ.get('SPARK_URL') or 'wss://spark-api.xf-yun.com/v4.0/chat'
-    SPARK_DOMAIN = os.environ.get('SPARK_DOMAIN') or 'generalv4.0'
\ No newline at end of file
+    SPARK_DOMAIN = os.environ.get('SPARK_DOMAIN') or 'generalv4.0'
+
+    # 歌词搜索配置
+    LYRICS_SEARCH_MODE = os.environ.get('LYRICS_SEARCH_MODE') or 'parallel'  # parallel 或 sequential
+    LYRICS_SEARCH_DEADLINE = float(os.environ.get('LYRICS_SEARCH_DEADLINE') or 8.0)  # 整体搜索时限(秒)
+    # 并发模式下先请求排名最高的平台，超过它的p95耗时仍没有结果再请求下一个；没有统计数据时使用该值(秒)，设为0则同时请求所有平台
+    LYRICS_HEDGE_DELAY = float(os.environ.get('LYRICS_HEDGE_DELAY') or 0.5)
+    # 并发搜索线程数，按(平台数 x 同时搜索的调用方数)估算：process-songs和批量导入各8个线程，每次搜索4个平台
+    LYRICS_SEARCH_WORKERS = int(os.environ.get('LYRICS_SEARCH_WORKERS') or 64)
+
+    # 歌词平台HTTP连接池配置
+    LYRICS_HTTP_POOL_SIZE = int(os.environ.get('LYRICS_HTTP_POOL_SIZE') or 10)  # 每个平台主机的最大长连接数
+    LYRICS_HTTP_RETRIES = int(os.environ.get('LYRICS_HTTP_RETRIES') or 2)  # 连接失败或5xx时的重试次数
+    LYRICS_HTTP_BACKOFF = float(os.environ.get('LYRICS_HTTP_BACKOFF') or 0.3)  # 重试退避系数(秒)
+    LYRICS_CONNECT_TIMEOUT = float(os.environ.get('LYRICS_CONNECT_TIMEOUT') or 3.05)  # 连接超时(秒)
+    LYRICS_READ_TIMEOUT = float(os.environ.get('LYRICS_READ_TIMEOUT') or 10.0)  # 读取超时(秒)
+
+    # 歌词缓存配置
+    LYRICS_CACHE_ENABLED = os.environ.get('LYRICS_CACHE_ENABLED', '1') == '1'
+    LYRICS_CACHE_SIZE = int(os.environ.get('LYRICS_CACHE_SIZE') or 2048)  # 内存LRU条目数
+    LYRICS_CACHE_TTL = int(os.environ.get('LYRICS_CACHE_TTL') or 7 * 24 * 3600)  # 找到歌词的结果缓存时间(秒)
+    LYRICS_CACHE_NEGATIVE_TTL = int(os.environ.get('LYRICS_CACHE_NEGATIVE_TTL') or 3600)  # 未找到歌词的结果缓存时间(秒)
+    LYRICS_CACHE_PATH = os.environ.get('LYRICS_CACHE_PATH') or ''  # SQLite磁盘缓存文件路径，为空则不启用
+
+    # 歌词平台路由和熔断配置
+    PROVIDER_FAILURE_THRESHOLD = int(os.environ.get('PROVIDER_FAILURE_THRESHOLD') or 5)  # 连续失败多少次后熔断
+    PROVIDER_OPEN_SECONDS = float(os.environ.get('PROVIDER_OPEN_SECONDS') or 30.0)  # 熔断后多久允许半开探测(秒)
+    PROVIDER_STATS_WINDOW = int(os.environ.get('PROVIDER_STATS_WINDOW') or 100)  # 成功率和p95统计的滚动窗口大小
+    PROVIDER_EWMA_ALPHA = float(os.environ.get('PROVIDER_EWMA_ALPHA') or 0.2)  # 延迟EWMA平滑系数
+
+    # 批量导入配置
+    INGEST_LYRICS_WORKERS = int(os.environ.get('INGEST_LYRICS_WORKERS') or 8)  # 歌词获取并发数
+    INGEST_ANALYSIS_WORKERS = int(os.environ.get('INGEST_ANALYSIS_WORKERS') or 4)  # 关键词提取和入库并发数
+    INGEST_MAX_BATCH = int(os.environ.get('INGEST_MAX_BATCH') or 10000)  # 接口单次最多导入的文件数
+    INGEST_PROGRESS_INTERVAL = float(os.environ.get('INGEST_PROGRESS_INTERVAL') or 2.0)  # 导入进度写入数据库的间隔(秒)
+    INGEST_RUN_STALE_SECONDS = int(os.environ.get('INGEST_RUN_STALE_SECONDS') or 300)  # 超过多久没有刷新进度视为导入进程已退出(秒)
+
+    # 批量处理接口配置
+    PROCESS_SONGS_WORKERS = int(os.environ.get('PROCESS_SONGS_WORKERS') or 8)  # 单个请求内的并发数
+    PROCESS_SONGS_MAX_BATCH = int(os.environ.get('PROCESS_SONGS_MAX_BATCH') or 200)  # 单个请求最多处理的文件数
+
+    # jieba分词预热配置
+    JIEBA_WARMUP = os.environ.get('JIEBA_WARMUP', '1') == '1'  # 创建应用时加载词典
+    JIEBA_CACHE_FILE = os.environ.get('JIEBA_CACHE_FILE') or ''  # 词典缓存文件路径，为空时放在实例目录下
+
+    # 关键词提取配置
+    KEYWORD_STOPWORDS_FILE = os.environ.get('KEYWORD_STOPWORDS_FILE') or ''  # 追加的停用词文件，每行一个
+    KEYWORD_USER_DICT = os.environ.get('KEYWORD_USER_DICT') or ''  # jieba用户词典，为空时使用static/dict/lyrics_userdict.txt
+    KEYWORD_HMM = os.environ.get('KEYWORD_HMM') == '1'  # 是否用HMM识别未登录词
+    KEYWORD_RANKING = os.environ.get('KEYWORD_RANKING') or 'tfidf'  # 关键词排序方式: tfidf(语料库TF-IDF)或frequency(歌曲内词频)
+    CORPUS_STATS_CACHE_SIZE = int(os.environ.get('CORPUS_STATS_CACHE_SIZE') or 200000)  # 内存中缓存的文档频率词数
+    CORPUS_STATS_CACHE_TTL = int(os.environ.get('CORPUS_STATS_CACHE_TTL') or 300)  # 文档频率缓存时间(秒)
+
+    # 关键词倒排索引与搜索
+    KEYWORD_INDEX_REFRESH_INTERVAL = float(os.environ.get('KEYWORD_INDEX_REFRESH_INTERVAL') or 1.0)  # 增量读取新关键词的最短间隔(秒)
+    KEYWORD_INDEX_REBUILD_INTERVAL = int(os.environ.get('KEYWORD_INDEX_REBUILD_INTERVAL') or 600)  # 后台全量重建的间隔(秒)
+    SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE') or 20)  # 搜索结果默认每页数量
+    SEARCH_MAX_PAGE_SIZE = int(os.environ.get('SEARCH_MAX_PAGE_SIZE') or 100)  # 搜索结果每页数量上限
+    SEARCH_MAX_KEYWORDS = int(os.environ.get('SEARCH_MAX_KEYWORDS') or 10)  # 一次搜索最多的关键词数
+    LYRICS_SEARCH_SNIPPETS = int(os.environ.get('LYRICS_SEARCH_SNIPPETS') or 3)  # 歌词搜索每首歌返回的高亮片段数
+
+    # 同一首歌的跨进程处理锁(MySQL GET_LOCK)最长等待秒数
+    SONG_LOCK_TIMEOUT = int(os.environ.get('SONG_LOCK_TIMEOUT') or 15)
+
+    # 歌曲详情和列表的响应缓存配置(进程内，写入后失效，其他进程的旧条目按TTL过期)
+    RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', '1') == '1'
+    RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE') or 1024)  # 缓存的响应数
+    RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL') or 60)  # 缓存时间(秒)
+
+    # 歌曲列表分页配置
+    SONGS_PAGE_SIZE = int(os.environ.get('SONGS_PAGE_SIZE') or 50)  # 默认每页数量
+    SONGS_MAX_PAGE_SIZE = int(os.environ.get('SONGS_MAX_PAGE_SIZE') or 200)  # 每页数量上限
+
+    # 故事生成任务配置
+    STORY_JOBS_IN_PROCESS = os.environ.get('STORY_JOBS_IN_PROCESS', '1') == '1'  # Web进程内是否运行任务线程
+    STORY_JOB_WORKERS = int(os.environ.get('STORY_JOB_WORKERS') or 2)  # 每个进程的任务线程数
+    STORY_JOB_POLL_INTERVAL = float(os.environ.get('STORY_JOB_POLL_INTERVAL') or 2.0)  # 轮询数据库的间隔(秒)
+    STORY_JOB_MAX_ATTEMPTS = int(os.environ.get('STORY_JOB_MAX_ATTEMPTS') or 3)  # 最多尝试次数
+    STORY_JOB_STALE_SECONDS = int(os.environ.get('STORY_JOB_STALE_SECONDS') or 300)  # 运行超过多久视为工作进程已崩溃
+    STORY_JOB_RETRY_BACKOFF = float(os.environ.get('STORY_JOB_RETRY_BACKOFF') or 10.0)  # 第一次重试前的等待时间(秒)，之后每次翻倍
+    STORY_JOB_RETRY_MAX_BACKOFF = float(os.environ.get('STORY_JOB_RETRY_MAX_BACKOFF') or 600.0)  # 重试等待时间上限(秒)
+    STORY_JOB_MAX_WAIT = float(os.environ.get('STORY_JOB_MAX_WAIT') or 60.0)  # 长轮询最长等待时间(秒)
+
+    # 讯飞星火并发和限流配置
+    SPARK_MAX_CONCURRENCY = int(os.environ.get('SPARK_MAX_CONCURRENCY') or 4)  # 每个进程同时进行的会话数
+    SPARK_QPS = float(os.environ.get('SPARK_QPS') or 2.0)  # 每个进程每秒最多发起的请求数
+    SPARK_BURST = int(os.environ.get('SPARK_BURST') or 2)  # 令牌桶容量(允许的突发请求数)
+    SPARK_QUEUE_TIMEOUT = float(os.environ.get('SPARK_QUEUE_TIMEOUT') or 10.0)  # 排队最长等待时间，超时拒绝(秒)
+    SPARK_REQUEST_TIMEOUT = float(os.environ.get('SPARK_REQUEST_TIMEOUT') or 60.0)  # 单次生成超时(秒)
+    SPARK_MAX_RETRIES = int(os.environ.get('SPARK_MAX_RETRIES') or 2)  # 可重试错误的最大重试次数
+    SPARK_RETRY_BACKOFF = float(os.environ.get('SPARK_RETRY_BACKOFF') or 0.5)  # 重试退避基数(秒)
+
+    # 故事缓存配置
+    STORY_CACHE_ENABLED = os.environ.get('STORY_CACHE_ENABLED', '1') == '1'
+    STORY_CACHE_MAX_REUSE = int(os.environ.get('STORY_CACHE_MAX_REUSE') or 3)  # 同一篇故事最多被几首歌复用，0表示不复用
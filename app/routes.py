@@ -1,44 +1,41 @@
-from flask import Blueprint, request, jsonify, current_app
-import re
-import time
-from app.utils.database import get_db
-from app.utils.lyrics_finder import LyricsFinder
-from app.utils.story_generator import generate_story_with_keywords
-import jieba
-from collections import Counter
+from flask import Blueprint, request, jsonify, current_app, url_for, stream_with_context
+import json
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from app.utils.database import get_db, get_pool, PoolExhaustedError
+from app.utils.lyrics_cache import get_lyrics_cache
+from app.utils.lyrics_finder import LyricsSearchTimeout
+from app.utils.provider_router import get_provider_router
+from app.utils.story_generator import stream_story, get_spark_client, StoryGenerationError
+from app.utils.story_cache import story_prompt_key, find_cached_story, normalize_keywords, story_cache_stats
+from app.utils.song_pipeline import (
+    parse_song_file_name, prepare_song, find_existing_songs, load_song_summaries,
+    fetch_song_detail, save_song, save_song_keywords, save_story, song_identity_key, song_lock, is_stale_miss,
+    SONG_LIST_FIELDS, DEFAULT_SONG_LIST_FIELDS, decode_song_cursor, list_songs_page, load_songs_by_ids
+)
+from app.utils.story_jobs import (
+    JOB_PENDING, enqueue_story_job, notify_story_job, get_story_job, wait_for_story_job
+)
+from app.utils.bulk_ingest import start_ingest, get_ingest_run, is_valid_run_id
+from app.utils.single_flight import SingleFlight
+from app.utils.corpus_stats import get_corpus_stats
+from app.utils.keyword_index import MODE_AND, MODE_OR, get_keyword_index
+from app.utils.lyrics_search import parse_lyrics_query, search_lyrics
+from app.utils.response_cache import (
+    SONG_DETAIL, SONG_LIST, CachedResponse, get_response_cache, invalidate_song_responses
+)
 
 # 创建Blueprint
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
+# 合并本进程内对同一首新歌的并发处理
+_song_flight = SingleFlight()
 
-def analyze_lyrics_frequency(lyrics, top_n=5, min_length=2):
-    """分析歌词中词语出现的频率"""
-    # 过滤停用词（常见的无意义词语）
-    stopwords = set([
-        '的', '了', '和', '是', '在', '我', '有', '不', '这', '也', '你', '都',
-        '我们', '你们', '他们', '她们', '它们', '那', '就', '都', '还', '要', '人',
-        '啊', '哦', '呢', '吧', '呀', '哎', '噢', '喔', '哇', '嗯', '嘿', '哼',
-        'la', 'oh', 'yeah', 'hey', 'baby', 'ah', 'ooh', 'na'
-    ])
 
-    # 使用jieba分词
-    words = jieba.cut(lyrics)
-
-    # 过滤掉长度过短和停用词
-    filtered_words = [
-        word for word in words
-        if len(word.strip()) >= min_length and
-           word.strip() not in stopwords and
-           not word.strip().isdigit() and
-           not all(ord(c) < 128 for c in word.strip())  # 过滤纯英文单词
-    ]
-
-    # 统计词频
-    word_counts = Counter(filtered_words)
-
-    # 获取出现频率最高的词
-    most_common = word_counts.most_common(top_n)
-    return most_common
+@api_bp.errorhandler(PoolExhaustedError)
+def handle_pool_exhausted(e):
+    """数据库连接池已满时返回503，客户端可以稍后重试"""
+    current_app.logger.warning(f"Database pool exhausted: {e}")
+    return jsonify({'error': 'Server busy, please retry later'}), 503
 
 
 @api_bp.route('/process-song', methods=['POST'])
@@ -54,161 +51,610 @@ def process_song():
 
     # 从文件名提取歌手名和歌曲名
     # 假设格式为: "歌手名 - 歌曲名.mp3"
-    match = re.match(r'(.+?)\s*-\s*(.+?)\.mp3$', file_name)
+    parsed = parse_song_file_name(file_name)
 
-    if not match:
+    if not parsed:
         return jsonify({'error': 'File name format not recognized (expected: "Artist - Song.mp3")'}), 400
 
-    artist_name = match.group(1).strip()
-    song_name = match.group(2).strip()
+    artist_name, song_name = parsed
+    song_key = song_identity_key(artist_name, song_name)
 
     # 获取数据库连接
     db = get_db()
-    cursor = db.cursor(dictionary=True)
 
     try:
-        # 检查歌曲是否已存在
-        cursor.execute("SELECT id FROM songs WHERE artist_name = %s AND song_name = %s",
-                       (artist_name, song_name))
-        existing_song = cursor.fetchone()
-
-        if existing_song:
-            song_id = existing_song['id']
-
-            # 获取现有数据返回
-            cursor.execute("SELECT * FROM songs WHERE id = %s", (song_id,))
-            song_data = cursor.fetchone()
-
-            cursor.execute("SELECT keyword FROM keywords WHERE song_id = %s ORDER BY frequency DESC LIMIT 5",
-                           (song_id,))
-            keywords = [item['keyword'] for item in cursor.fetchall()]
-
-            cursor.execute("SELECT story_content FROM stories WHERE song_id = %s ORDER BY created_at DESC LIMIT 1",
-                           (song_id,))
-            story = cursor.fetchone()
-
-            return jsonify({
-                'song_id': song_id,
-                'song_name': song_data['song_name'],
-                'artist_name': song_data['artist_name'],
-                'lyrics': song_data['lyrics'],
-                'keywords': keywords,
-                'story': story['story_content'] if story else None
-            })
-
-        # 获取歌词
-        finder = LyricsFinder()
+        # 检查歌曲是否已存在，已存在时一次查询取回全部数据；很久以前没找到歌词的歌曲重新获取
+        existing_song = fetch_song_detail(db, song_key=song_key)
+        if existing_song and not is_stale_miss(db, existing_song, _refetch_misses_after()):
+            return jsonify(_existing_song_payload(existing_song))
+
+        # 结束读取用的事务，获取歌词和分词期间不占用数据库事务
+        db.commit()
+
+        # 同一首歌的并发请求在本进程内合并为一次处理
+        payload = _song_flight.do(song_key, lambda: _process_new_song(db, file_name, artist_name, song_name, song_key))
+        return jsonify(payload)
+
+    except LyricsSearchTimeout as e:
+        # 超时不代表没有歌词，不入库，客户端稍后重试
+        db.rollback()
+        current_app.logger.warning(f"Error processing song: {e}")
+        return jsonify({'error': 'Lyrics search timed out, please retry later'}), 504
+    except Exception as e:
+        db.rollback()
+        current_app.logger.error(f"Error processing song: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+def _refetch_misses_after():
+    """入库时没有找到歌词的歌曲，超过未找到歌词的缓存时间后重新获取"""
+    return current_app.config.get('LYRICS_CACHE_NEGATIVE_TTL', 3600)
+
+
+def _existing_song_payload(song):
+    """已入库歌曲的返回数据，故事还没有生成时返回最近的故事任务，客户端可以据此轮询"""
+    has_story = song['story'] is not None
+    return {
+        'song_id': song['id'],
+        'song_name': song['song_name'],
+        'artist_name': song['artist_name'],
+        'lyrics': song['lyrics'],
+        'keywords': song['keywords'][:5],
+        'story': song['story'],
+        'story_job_id': None if has_story else song['story_job_id'],
+        'story_status': None if has_story else song['story_status']
+    }
+
+
+def _process_new_song(db, file_name, artist_name, song_name, song_key):
+    """获取歌词、提取关键词并入库；持有跨进程的歌曲锁，同一首歌在所有工作进程中只处理一次"""
+    with song_lock(db, song_key, current_app.config['SONG_LOCK_TIMEOUT']) as locked:
+        if not locked:
+            current_app.logger.warning(f"Timed out waiting for song lock: {artist_name} - {song_name}")
+
+        # 等锁期间其他进程可能已经处理完这首歌
+        existing_song = fetch_song_detail(db, song_key=song_key)
+        stale_miss = existing_song is not None and is_stale_miss(db, existing_song, _refetch_misses_after())
+        db.commit()
+        if existing_song and not stale_miss:
+            return _existing_song_payload(existing_song)
+
+        # 获取歌词并提取关键词，都在写入之前完成
         current_app.logger.info(f"Searching lyrics for: {song_name} by {artist_name}")
-        lyrics_data = finder.search_lyrics(song_name, artist_name)
-
-        if lyrics_data['lyrics'] == "未找到歌词":
-            lyrics = "未找到歌词"
-        else:
-            lyrics = lyrics_data['lyrics']
-
-        # 插入歌曲信息
-        cursor.execute(
-            "INSERT INTO songs (file_name, song_name, artist_name, lyrics) VALUES (%s, %s, %s, %s)",
-            (file_name, song_name, artist_name, lyrics)
-        )
-        song_id = cursor.lastrowid
-
-        # 提取关键词
-        keywords = []
-        if lyrics != "未找到歌词":
-            current_app.logger.info(f"Analyzing keywords for song ID: {song_id}")
-            word_frequency = analyze_lyrics_frequency(lyrics)
-
-            for word, count in word_frequency:
-                keywords.append(word)
-                cursor.execute(
-                    "INSERT INTO keywords (song_id, keyword, frequency) VALUES (%s, %s, %s)",
-                    (song_id, word, count)
-                )
-
-        # 生成故事
+        lyrics_data, term_counts = prepare_song(song_name, artist_name)
+
+        # 歌曲、关键词和故事任务在一个短事务中写入
+        song_id, created = save_song(db, file_name, song_name, artist_name, lyrics_data)
+        if not created:
+            # 没拿到锁时可能被其他进程抢先写入，或者重新获取仍然没有找到歌词，以已有记录为准
+            db.commit()
+            return _existing_song_payload(fetch_song_detail(db, song_id=song_id))
+
+        keywords = save_song_keywords(db, song_id, term_counts)
+
+        # 故事由后台任务生成，接口不等待大模型
         story = "无法生成故事，因为没有足够的关键词"
+        story_job_id = None
         if keywords:
-            current_app.logger.info(f"Generating story for song ID: {song_id} with keywords: {keywords}")
-            try:
-                story = generate_story_with_keywords(keywords)
-                cursor.execute(
-                    "INSERT INTO stories (song_id, story_content) VALUES (%s, %s)",
-                    (song_id, story)
-                )
-            except Exception as e:
-                current_app.logger.error(f"Error generating story: {e}")
-                story = f"生成故事时出错: {str(e)}"
+            story = None
+            story_job_id = enqueue_story_job(db, song_id, keywords)
+            current_app.logger.info(f"Queued story job {story_job_id} for song ID: {song_id}")
 
         db.commit()
 
-        return jsonify({
-            'song_id': song_id,
-            'song_name': song_name,
-            'artist_name': artist_name,
-            'lyrics': lyrics,
-            'keywords': keywords,
-            'story': story
-        })
+    invalidate_song_responses(song_id, lists=True)
+    if story_job_id:
+        notify_story_job(story_job_id)
+
+    return {
+        'song_id': song_id,
+        'song_name': song_name,
+        'artist_name': artist_name,
+        'lyrics': lyrics_data['lyrics'],
+        'keywords': keywords,
+        'story': story,
+        'story_job_id': story_job_id,
+        'story_status': JOB_PENDING if story_job_id else None
+    }
+
+
+@api_bp.route('/process-songs', methods=['POST'])
+def process_songs():
+    """批量处理歌曲，每处理完一首就返回一行NDJSON，返回顺序与请求顺序无关"""
+    data = request.get_json()
 
+    if not data or not isinstance(data.get('file_names'), list):
+        return jsonify({'error': 'Missing file_names parameter'}), 400
+
+    file_names = data['file_names']
+    max_batch = current_app.config['PROCESS_SONGS_MAX_BATCH']
+    if len(file_names) > max_batch:
+        return jsonify({'error': f'Too many files (max {max_batch})'}), 400
+
+    app = current_app._get_current_object()
+
+    def line(payload):
+        return json.dumps(payload, ensure_ascii=False, default=str) + '\n'
+
+    def prepare(song_name, artist_name):
+        with app.app_context():
+            return prepare_song(song_name, artist_name)
+
+    def generate():
+        # 整个批次共用一个数据库连接，只在当前线程中访问
+        db = get_db()
+
+        # 同一首歌在批次中出现多次时只处理一次，结果发给所有对应的位置
+        groups = {}
+        for index, file_name in enumerate(file_names):
+            parsed = parse_song_file_name(file_name) if isinstance(file_name, str) else None
+            if not parsed:
+                yield line({'type': 'error', 'index': index, 'file_name': file_name,
+                            'error': 'File name format not recognized (expected: "Artist - Song.mp3")'})
+                continue
+            key = song_identity_key(*parsed)
+            groups.setdefault(key, {'file_name': file_name, 'artist_name': parsed[0],
+                                    'song_name': parsed[1], 'indexes': []})['indexes'].append(index)
+
+        # 已有的歌曲一次查出并立即返回
+        existing = find_existing_songs(db, list(groups), refetch_misses_after=_refetch_misses_after())
+        summaries = load_song_summaries(db, list(set(existing.values())))
+        db.commit()
+        for key, song_id in existing.items():
+            # 查询之间被删除的歌曲留在groups中，按新歌曲处理，保证每个输入位置都有一行结果
+            if key not in groups or song_id not in summaries:
+                continue
+            group = groups.pop(key)
+            for index in group['indexes']:
+                yield line({'type': 'song', 'index': index, 'file_name': file_names[index], **summaries[song_id]})
+
+        executor = ThreadPoolExecutor(app.config['PROCESS_SONGS_WORKERS'], thread_name_prefix='process-songs')
+        try:
+            pending = {executor.submit(prepare, group['song_name'], group['artist_name']): group
+                       for group in groups.values()}
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    group = pending.pop(future)
+                    error = future.exception()
+
+                    if error is not None:
+                        app.logger.error(f"Error processing {group['file_name']}: {error}")
+                        # 歌词搜索超时的歌曲没有入库，客户端可以单独重试
+                        retryable = isinstance(error, LyricsSearchTimeout)
+                        for index in group['indexes']:
+                            yield line({'type': 'error', 'index': index, 'file_name': file_names[index],
+                                        'error': str(error), 'retryable': retryable})
+                        continue
+
+                    # 歌曲、关键词和故事任务在一个短事务中写入，故事由后台任务生成
+                    lyrics_data, term_counts = future.result()
+                    story_job_id = None
+                    try:
+                        song_id, created = save_song(db, group['file_name'], group['song_name'],
+                                                     group['artist_name'], lyrics_data)
+                        keywords = []
+                        summary = None
+                        if created:
+                            keywords = save_song_keywords(db, song_id, term_counts)
+                            if keywords:
+                                story_job_id = enqueue_story_job(db, song_id, keywords)
+                        else:
+                            # 其他请求已经写入了这首歌，以已有记录为准
+                            summary = load_song_summaries(db, [song_id]).get(song_id)
+                            if summary is None:
+                                raise LookupError(f"Song {song_id} disappeared while processing")
+                        db.commit()
+                    except Exception as e:
+                        db.rollback()
+                        app.logger.error(f"Error saving {group['file_name']}: {e}")
+                        for index in group['indexes']:
+                            yield line({'type': 'error', 'index': index, 'file_name': file_names[index],
+                                        'error': str(e)})
+                        continue
+
+                    if created:
+                        invalidate_song_responses(song_id, lists=True)
+                    if story_job_id:
+                        notify_story_job(story_job_id)
+
+                    if summary is not None:
+                        for index in group['indexes']:
+                            yield line({'type': 'song', 'index': index, 'file_name': file_names[index], **summary})
+                        continue
+
+                    for index in group['indexes']:
+                        yield line({
+                            'type': 'song',
+                            'index': index,
+                            'file_name': file_names[index],
+                            'song_id': song_id,
+                            'song_name': group['song_name'],
+                            'artist_name': group['artist_name'],
+                            'lyrics': lyrics_data['lyrics'],
+                            'keywords': keywords,
+                            'story': None if story_job_id else "无法生成故事，因为没有足够的关键词",
+                            'story_job_id': story_job_id,
+                            'story_status': JOB_PENDING if story_job_id else None
+                        })
+        finally:
+            # 客户端断开时取消尚未开始的任务
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@api_bp.route('/stories/jobs/<int:job_id>', methods=['GET'])
+def get_story_job_status(job_id):
+    """获取故事生成任务的状态，完成后附带故事内容"""
+    try:
+        job = get_story_job(get_db(), job_id)
     except Exception as e:
-        db.rollback()
-        current_app.logger.error(f"Error processing song: {e}")
+        current_app.logger.error(f"Error fetching story job: {e}")
         return jsonify({'error': str(e)}), 500
-    finally:
-        cursor.close()
+
+    if not job:
+        return jsonify({'error': 'Story job not found'}), 404
+
+    return jsonify(job)
+
+
+@api_bp.route('/stories/jobs/<int:job_id>/wait', methods=['GET'])
+def wait_story_job(job_id):
+    """长轮询等待故事生成任务完成，超时后返回当前状态"""
+    timeout = min(request.args.get('timeout', 30, type=float), current_app.config['STORY_JOB_MAX_WAIT'])
+
+    try:
+        job = wait_for_story_job(job_id, max(timeout, 0))
+    except Exception as e:
+        current_app.logger.error(f"Error waiting for story job: {e}")
+        return jsonify({'error': str(e)}), 500
+
+    if not job:
+        return jsonify({'error': 'Story job not found'}), 404
+
+    return jsonify(job)
+
+
+@api_bp.route('/ingest', methods=['POST'])
+def ingest_songs():
+    """
+    批量导入歌曲，在后台运行并立即返回导入任务ID
+    可以传入ingest_id：进程崩溃或重启后用同一个ID重新提交，会从断点续跑
+    """
+    data = request.get_json()
+
+    if not data or not isinstance(data.get('file_names'), list):
+        return jsonify({'error': 'Missing file_names parameter'}), 400
+
+    file_names = [name for name in data['file_names'] if isinstance(name, str)]
+    max_batch = current_app.config['INGEST_MAX_BATCH']
+    if len(file_names) > max_batch:
+        return jsonify({'error': f'Too many files (max {max_batch})'}), 400
+
+    run_id = data.get('ingest_id')
+    if run_id is not None and not is_valid_run_id(run_id):
+        return jsonify({'error': 'Invalid ingest_id (1-64 characters: letters, digits, "_" or "-")'}), 400
+
+    try:
+        run_id = start_ingest(current_app._get_current_object(), file_names,
+                              generate_stories=bool(data.get('generate_stories', True)), run_id=run_id)
+    except Exception as e:
+        current_app.logger.error(f"Error starting ingest: {e}")
+        return jsonify({'error': str(e)}), 500
+
+    if run_id is None:
+        return jsonify({'error': 'Ingest run is already running',
+                        'status_url': url_for('api.get_ingest', run_id=data['ingest_id'])}), 409
+
+    return jsonify({
+        'ingest_id': run_id,
+        'status_url': url_for('api.get_ingest', run_id=run_id)
+    }), 202
+
+
+@api_bp.route('/ingest/<run_id>', methods=['GET'])
+def get_ingest(run_id):
+    """获取批量导入任务的进度，任务状态保存在数据库中，任何工作进程都可以查询"""
+    try:
+        run = get_ingest_run(get_db(), run_id, current_app.config['INGEST_RUN_STALE_SECONDS'])
+    except Exception as e:
+        current_app.logger.error(f"Error fetching ingest run: {e}")
+        return jsonify({'error': str(e)}), 500
+
+    if not run:
+        return jsonify({'error': 'Ingest run not found'}), 404
+
+    return jsonify(run)
+
+
+# 随缓存的响应体一起保存的响应头
+_CACHED_HEADERS = ('X-Next-Cursor', 'Link')
+
+
+def _cached_json_response(key, build):
+    """
+    读穿响应缓存：命中时直接返回序列化好的响应体，不访问数据库也不重新编码JSON
+    响应带强ETag，客户端用If-None-Match重新验证时返回不带响应体的304
+    只缓存200响应，build返回的错误响应原样返回
+    """
+    cache = get_response_cache() if current_app.config['RESPONSE_CACHE_ENABLED'] else None
+    cached = cache.get(key) if cache else None
+
+    if cached is None:
+        result = build()
+        if isinstance(result, tuple) or result.status_code != 200:
+            return result
+        cached = CachedResponse(result.get_data(),
+                                {name: result.headers[name] for name in _CACHED_HEADERS if name in result.headers})
+        if cache:
+            cache.set(key, cached)
+
+    response = current_app.response_class(cached.body, mimetype='application/json', headers=cached.headers)
+    response.set_etag(cached.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 
 @api_bp.route('/songs', methods=['GET'])
 def list_songs():
-    """获取所有歌曲列表"""
-    db = get_db()
-    cursor = db.cursor(dictionary=True)
+    """
+    按创建时间倒序分页获取歌曲列表
+    参数: limit 每页数量; cursor 上一页响应头X-Next-Cursor中的游标; fields 逗号分隔的返回字段
+    """
+    default_limit = current_app.config['SONGS_PAGE_SIZE']
+    max_limit = current_app.config['SONGS_MAX_PAGE_SIZE']
+    limit = min(max(request.args.get('limit', default_limit, type=int), 1), max_limit)
+
+    after = None
+    if request.args.get('cursor'):
+        try:
+            after = decode_song_cursor(request.args['cursor'])
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    fields = DEFAULT_SONG_LIST_FIELDS
+    if request.args.get('fields'):
+        fields = tuple(dict.fromkeys(field.strip() for field in request.args['fields'].split(',') if field.strip()))
+        unknown = [field for field in fields if field not in SONG_LIST_FIELDS]
+        if unknown or not fields:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}",
+                            'allowed_fields': list(SONG_LIST_FIELDS)}), 400
+
+    def build():
+        songs, next_cursor = list_songs_page(get_db(), limit, after, fields)
+        response = jsonify(songs)
+        # 响应体保持为数组，下一页游标放在响应头中
+        if next_cursor:
+            params = {'limit': limit, 'cursor': next_cursor}
+            if request.args.get('fields'):
+                params['fields'] = ','.join(fields)
+            response.headers['X-Next-Cursor'] = next_cursor
+            response.headers['Link'] = f'<{url_for("api.list_songs", **params)}>; rel="next"'
+        return response
 
     try:
-        cursor.execute("SELECT id, song_name, artist_name, file_name, created_at FROM songs ORDER BY created_at DESC")
-        songs = cursor.fetchall()
-        return jsonify(songs)
+        return _cached_json_response((SONG_LIST, limit, request.args.get('cursor'), fields), build)
     except Exception as e:
         current_app.logger.error(f"Error fetching songs: {e}")
         return jsonify({'error': str(e)}), 500
-    finally:
-        cursor.close()
 
 
 @api_bp.route('/songs/<int:song_id>', methods=['GET'])
 def get_song(song_id):
     """获取指定歌曲的详细信息"""
+    def build():
+        # 歌曲、关键词和最新故事一次查询取回，带时间轴的歌词通过单独的接口获取
+        song = fetch_song_detail(get_db(), song_id=song_id)
+
+        if not song:
+            return jsonify({'error': 'Song not found'}), 404
+
+        song.pop('story_job_id')
+        song.pop('story_status')
+        return jsonify(song)
+
+    try:
+        return _cached_json_response((SONG_DETAIL, song_id), build)
+    except Exception as e:
+        current_app.logger.error(f"Error fetching song details: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/search', methods=['GET'])
+def search_songs():
+    """
+    按关键词搜索歌曲，结果按命中关键词的权重之和倒序排列
+    参数: keyword 可重复的关键词; mode and(包含全部关键词)或or(包含任一关键词); limit/offset 分页
+    """
+    keywords = list(dict.fromkeys(keyword.strip() for keyword in request.args.getlist('keyword') if keyword.strip()))
+    if not keywords:
+        return jsonify({'error': 'Missing keyword'}), 400
+    if len(keywords) > current_app.config['SEARCH_MAX_KEYWORDS']:
+        return jsonify({'error': f"Too many keywords (max {current_app.config['SEARCH_MAX_KEYWORDS']})"}), 400
+
+    mode = request.args.get('mode', MODE_AND).lower()
+    if mode not in (MODE_AND, MODE_OR):
+        return jsonify({'error': f"Invalid mode: {mode}"}), 400
+
+    default_limit = current_app.config['SEARCH_PAGE_SIZE']
+    max_limit = current_app.config['SEARCH_MAX_PAGE_SIZE']
+    limit = min(max(request.args.get('limit', default_limit, type=int), 1), max_limit)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+
+    try:
+        db = get_db()
+        index = get_keyword_index()
+        index.refresh(db)
+
+        total, page = index.top(keywords, mode, limit, offset)
+        songs = load_songs_by_ids(db, [song_id for _, song_id, _ in page])
+        db.commit()
+
+        results = []
+        for score, song_id, matched in page:
+            # 倒排索引后台重建之前，已删除的歌曲可能仍在索引中
+            if song_id not in songs:
+                continue
+            results.append(dict(songs[song_id], score=round(score, 6), matched_keywords=matched))
+
+        return jsonify({
+            'keywords': keywords,
+            'mode': mode,
+            'total': total,
+            'offset': offset,
+            'limit': limit,
+            'results': results
+        })
+    except Exception as e:
+        current_app.logger.error(f"Error searching songs: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/search/lyrics', methods=['GET'])
+def search_songs_by_lyrics():
+    """
+    在歌词全文中搜索，返回同时包含所有查询词的歌曲(按相关度排序)和高亮的歌词行
+    参数: q 空格分隔的查询词(每个词至少2个字符，单个字符会被忽略); limit/offset 分页
+    """
+    terms = parse_lyrics_query(request.args.get('q'))
+    if not terms:
+        return jsonify({'error': 'Missing q: each term needs at least 2 characters'}), 400
+
+    default_limit = current_app.config['SEARCH_PAGE_SIZE']
+    max_limit = current_app.config['SEARCH_MAX_PAGE_SIZE']
+    limit = min(max(request.args.get('limit', default_limit, type=int), 1), max_limit)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+
+    try:
+        db = get_db()
+        results = search_lyrics(db, terms, limit, offset, current_app.config['LYRICS_SEARCH_SNIPPETS'])
+        db.commit()
+        return jsonify({'terms': terms, 'offset': offset, 'limit': limit, 'results': results})
+    except Exception as e:
+        current_app.logger.error(f"Error searching lyrics: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/songs/<int:song_id>/timed-lyrics', methods=['GET'])
+def get_timed_lyrics(song_id):
+    """获取带时间轴的歌词，直接返回数据库中保存的紧凑JSON，不重新解析"""
     db = get_db()
-    cursor = db.cursor(dictionary=True)
+    cursor = db.cursor()
 
     try:
-        # 获取歌曲基本信息
-        cursor.execute("SELECT * FROM songs WHERE id = %s", (song_id,))
-        song = cursor.fetchone()
+        cursor.execute("SELECT timed_lyrics FROM songs WHERE id = %s", (song_id,))
+        row = cursor.fetchone()
 
-        if not song:
+        if not row:
             return jsonify({'error': 'Song not found'}), 404
+        if row[0] is None:
+            return jsonify({'error': 'Timed lyrics not available'}), 404
 
-        # 获取关键词
-        cursor.execute("SELECT keyword FROM keywords WHERE song_id = %s ORDER BY frequency DESC", (song_id,))
-        keywords = [item['keyword'] for item in cursor.fetchall()]
+        return current_app.response_class(row[0], mimetype='application/json')
+    except Exception as e:
+        current_app.logger.error(f"Error fetching timed lyrics: {e}")
+        return jsonify({'error': str(e)}), 500
+    finally:
+        cursor.close()
 
-        # 获取故事
-        cursor.execute("SELECT story_content FROM stories WHERE song_id = %s ORDER BY created_at DESC LIMIT 1",
-                       (song_id,))
-        story = cursor.fetchone()
 
-        # 组合数据
-        result = {
-            **song,
-            'keywords': keywords,
-            'story': story['story_content'] if story else None
-        }
+@api_bp.route('/songs/<int:song_id>/story/stream', methods=['GET'])
+def stream_song_story(song_id):
+    """以SSE的形式实时推送故事生成的每一段内容，生成结束后保存故事"""
+    db = get_db()
+    cursor = db.cursor(dictionary=True)
+
+    try:
+        cursor.execute("SELECT id FROM songs WHERE id = %s", (song_id,))
+        if not cursor.fetchone():
+            return jsonify({'error': 'Song not found'}), 404
 
-        return jsonify(result)
+        cursor.execute("SELECT keyword FROM keywords WHERE song_id = %s ORDER BY weight DESC, frequency DESC LIMIT 5",
+                       (song_id,))
+        keywords = [item['keyword'] for item in cursor.fetchall()]
+
+        cursor.execute("SELECT id, story_content FROM stories WHERE song_id = %s ORDER BY created_at DESC LIMIT 1",
+                       (song_id,))
+        existing_story = cursor.fetchone()
+        # 结束只读事务，生成故事期间不占用事务
+        db.commit()
     except Exception as e:
-        current_app.logger.error(f"Error fetching song details: {e}")
+        current_app.logger.error(f"Error loading song for story stream: {e}")
         return jsonify({'error': str(e)}), 500
     finally:
-        cursor.close()
\ No newline at end of file
+        cursor.close()
+
+    if not keywords:
+        return jsonify({'error': 'Song has no keywords'}), 400
+
+    regenerate = request.args.get('regenerate') == '1'
+    prompt, prompt_key = story_prompt_key(keywords, current_app.config['SPARK_DOMAIN'])
+
+    def event(name, payload):
+        return f"event: {name}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    def generate():
+        # 已有故事且不要求重新生成时直接一次性返回
+        if existing_story and not regenerate:
+            yield event('chunk', {'content': existing_story['story_content']})
+            yield event('done', {'song_id': song_id, 'story_id': existing_story['id']})
+            return
+
+        # 相同关键词集合已有可复用的故事时直接返回
+        if not regenerate and current_app.config['STORY_CACHE_ENABLED']:
+            cached_story = find_cached_story(db, prompt_key, current_app.config['STORY_CACHE_MAX_REUSE'])
+            if cached_story is not None:
+                story_id = save_story(db, song_id, cached_story, prompt, prompt_key)
+                db.commit()
+                invalidate_song_responses(song_id)
+                yield event('chunk', {'content': cached_story})
+                yield event('done', {'song_id': song_id, 'story_id': story_id})
+                return
+
+        parts = []
+        try:
+            for content in stream_story(normalize_keywords(keywords)):
+                parts.append(content)
+                yield event('chunk', {'content': content})
+        except StoryGenerationError as e:
+            yield event('error', {'error': str(e)})
+            return
+
+        if not parts:
+            yield event('error', {'error': "无法生成故事，请检查API配置或网络连接"})
+            return
+
+        # 客户端断开时生成器被关闭，不会执行到这里，不完整的故事不会保存
+        try:
+            story_id = save_story(db, song_id, ''.join(parts), prompt, prompt_key)
+            db.commit()
+            invalidate_song_responses(song_id)
+        except Exception as e:
+            db.rollback()
+            current_app.logger.error(f"Error saving streamed story: {e}")
+            yield event('error', {'error': str(e)})
+            return
+
+        yield event('done', {'song_id': song_id, 'story_id': story_id})
+
+    response = current_app.response_class(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # 禁止Nginx缓冲，保证每段内容立即送达
+    return response
+
+
+@api_bp.route('/stats', methods=['GET'])
+def get_stats():
+    """获取缓存和歌词平台等运行时统计信息"""
+    return jsonify({
+        'lyrics_cache': get_lyrics_cache().stats(),
+        'lyrics_providers': get_provider_router().snapshot(),
+        'spark': get_spark_client().stats(),
+        'story_cache': story_cache_stats(),
+        'db_pool': get_pool().stats(),
+        'response_cache': get_response_cache().stats(),
+        'corpus_stats': get_corpus_stats().stats(),
+        'keyword_index': get_keyword_index().stats()
+    })
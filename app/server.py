@@ -1,10 +1,14 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import logging
+import os
+import threading
+import time
 import numpy as np
 import math
+import mysql.connector
 import uvicorn
 
 # Set up logging
@@ -46,6 +50,7 @@ class MusicItem(BaseModel):
 class MatchRequest(BaseModel):
     color_vector: ColorVector
     music_items: List[MusicItem]
+    top_k: Optional[int] = None  # Only return the best top_k items
 
 
 class MatchResult(BaseModel):
@@ -57,6 +62,11 @@ class MatchResponse(BaseModel):
     matched_items: List[MatchResult]
 
 
+class CatalogMatchRequest(BaseModel):
+    color_vector: ColorVector
+    top_k: int = 20
+
+
 # Color-keyword mapping (same as in the Android app)
 KEYWORD_COLOR_MAP = {
     "快乐": [1.0, 1.0, 0.0],  # 黄色
@@ -94,51 +104,93 @@ KEYWORD_COLOR_MAP = {
 }
 
 
-def calculate_color_similarity(color1: List[float], color2: List[float]) -> float:
+# Keyword vocabulary and its unit-normalized color matrix, built once at import.
+# Row i of KEYWORD_COLOR_MATRIX is KEYWORD_COLOR_MAP[KEYWORDS[i]] / ||color||.
+KEYWORDS = list(KEYWORD_COLOR_MAP)
+KEYWORD_INDEX = {keyword: i for i, keyword in enumerate(KEYWORDS)}
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    Scale each row to unit length, leaving all-zero rows as zeros
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+KEYWORD_COLOR_MATRIX = _normalize_rows(np.array([KEYWORD_COLOR_MAP[k] for k in KEYWORDS], dtype=np.float64))
+KEYWORD_COLOR_MATRIX.setflags(write=False)
+
+
+def unit_color(color_vector: List[float], dtype=np.float64) -> np.ndarray:
+    """
+    The first 3 values (RGB) of the color vector scaled to unit length; all zeros stays all zeros
+    """
+    if len(color_vector) < 3:
+        raise ValueError("color_vector must have at least 3 values (RGB)")
+
+    color = np.asarray(color_vector[:3], dtype=dtype)
+    norm = np.linalg.norm(color)
+    return color / norm if norm > 0 else color
+
+
+def keyword_similarities(color_vector: List[float]) -> np.ndarray:
     """
-    Calculate color similarity using cosine similarity
+    Cosine similarity between the color vector (first 3 values, RGB) and every keyword color
     """
-    # Make sure we're using the first 3 values (RGB)
-    c1 = np.array(color1[:3])
-    c2 = np.array(color2[:3])
+    return KEYWORD_COLOR_MATRIX @ unit_color(color_vector)
 
-    # Calculate dot product
-    dot_product = np.dot(c1, c2)
 
-    # Calculate norms
-    norm1 = np.linalg.norm(c1)
-    norm2 = np.linalg.norm(c2)
+def calculate_match_scores(keyword_lists: List[List[str]], color_vector: List[float]) -> np.ndarray:
+    """
+    Calculate match scores for many items at once: the mean similarity of each item's known keywords
 
-    # Avoid division by zero
-    if norm1 == 0 or norm2 == 0:
-        return 0
+    Keywords are mapped to vocabulary indices, scored with one matrix-vector product and averaged
+    per item with a segmented sum (bincount). Items without known keywords get a random score.
+    """
+    n = len(keyword_lists)
+    similarities = keyword_similarities(color_vector)
 
-    # Calculate cosine similarity
-    similarity = dot_product / (norm1 * norm2)
+    lengths = np.fromiter((len(keywords) for keywords in keyword_lists), dtype=np.intp, count=n)
+    lookup = KEYWORD_INDEX.get
+    flat = np.fromiter((lookup(keyword, -1) for keywords in keyword_lists for keyword in keywords),
+                       dtype=np.intp, count=int(lengths.sum()))
+    owners = np.repeat(np.arange(n), lengths)
 
-    return float(similarity)
+    known = flat >= 0
+    owners = owners[known]
+    counts = np.bincount(owners, minlength=n)
+    totals = np.bincount(owners, weights=similarities[flat[known]], minlength=n)
+
+    scores = np.empty(n)
+    matched = counts > 0
+    scores[matched] = totals[matched] / counts[matched]
+
+    # If no keywords matched, use a random value
+    unmatched = ~matched
+    scores[unmatched] = np.random.random(int(unmatched.sum()))
+    return scores
 
 
 def calculate_match_score(keywords: List[str], color_vector: List[float]) -> float:
     """
     Calculate match score between keywords and color vector
     """
-    total_score = 0
-    matched_keywords = 0
-
-    for keyword in keywords:
-        if keyword in KEYWORD_COLOR_MAP:
-            keyword_color = KEYWORD_COLOR_MAP[keyword]
-            similarity = calculate_color_similarity(keyword_color, color_vector)
-            total_score += similarity
-            matched_keywords += 1
+    return float(calculate_match_scores([keywords], color_vector)[0])
 
-    # If no keywords matched, return a random value
-    if matched_keywords == 0:
-        return np.random.random()
 
-    # Return average match score
-    return total_score / matched_keywords
+def rank_scores(scores: np.ndarray, top_k: Optional[int] = None) -> np.ndarray:
+    """
+    Indices of scores in descending order, ties kept in input order;
+    with top_k, only the best top_k are selected (argpartition) and sorted
+    """
+    if top_k is not None and top_k < len(scores):
+        if top_k <= 0:
+            return np.empty(0, dtype=np.intp)
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        # Sort the selected candidates by (score desc, index asc) for a stable order
+        return candidates[np.lexsort((candidates, -scores[candidates]))]
+    return np.argsort(-scores, kind="stable")
 
 
 @app.post("/match", response_model=MatchResponse)
@@ -149,35 +201,244 @@ async def match_music(request: MatchRequest):
     logger.info(f"Received match request for {len(request.music_items)} music items")
 
     try:
-        # Extract color vector
-        color_vector = request.color_vector.values
+        music_items = request.music_items
+        scores = calculate_match_scores([item.keywords for item in music_items], request.color_vector.values)
+        order = rank_scores(scores, request.top_k)
 
-        # Calculate match scores for each music item
-        results = []
-        for music_item in request.music_items:
-            match_score = calculate_match_score(music_item.keywords, color_vector)
-            results.append(MatchResult(
-                music_id=music_item.id,
-                match_score=match_score
-            ))
-
-        # Sort results by match score (descending)
-        results.sort(key=lambda x: x.match_score, reverse=True)
+        results = [MatchResult(music_id=music_items[i].id, match_score=float(scores[i])) for i in order]
 
         logger.info(f"Successfully matched {len(results)} items")
         return MatchResponse(matched_items=results)
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error processing match request: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
 
 
+# Song catalog: one color embedding per song, loaded from the keywords table.
+# A song's embedding is the mean of its normalized keyword colors, so embedding . unit(color)
+# equals the /match score computed from the same keywords.
+CATALOG_ENABLED = (os.environ.get("CATALOG_ENABLED") or "1") != "0"
+CATALOG_REFRESH_INTERVAL = float(os.environ.get("CATALOG_REFRESH_INTERVAL") or 30)  # seconds
+CATALOG_RELOAD_INTERVAL = float(os.environ.get("CATALOG_RELOAD_INTERVAL") or 3600)  # seconds
+CATALOG_MAX_TOP_K = int(os.environ.get("CATALOG_MAX_TOP_K") or 1000)
+# Auto-increment ids are not visible in commit order, so each refresh re-reads this many ids
+CATALOG_LOOKBACK = 1000
+
+_VOCABULARY_PLACEHOLDERS = ", ".join(["%s"] * len(KEYWORDS))
+
+
+def connect_catalog_db():
+    """
+    Connect to the music story database with the same environment variables as the Flask app
+    """
+    return mysql.connector.connect(
+        host=os.environ.get("DATABASE_HOST") or "localhost",
+        user=os.environ.get("DATABASE_USER") or "root",
+        password=os.environ.get("DATABASE_PASSWORD") or "password",
+        database=os.environ.get("DATABASE_NAME") or "music_story_db",
+        port=int(os.environ.get("DATABASE_PORT") or 3306)
+    )
+
+
+def song_embeddings(rows: List[Tuple[int, str]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Mean normalized keyword color for each song in (song_id, keyword) rows;
+    keywords outside the color vocabulary are ignored
+    """
+    pairs = [(song_id, KEYWORD_INDEX[keyword]) for song_id, keyword in rows if keyword in KEYWORD_INDEX]
+    song_ids = np.fromiter((song_id for song_id, _ in pairs), dtype=np.int64, count=len(pairs))
+    keyword_indices = np.fromiter((index for _, index in pairs), dtype=np.intp, count=len(pairs))
+
+    songs, owners = np.unique(song_ids, return_inverse=True)
+    colors = KEYWORD_COLOR_MATRIX[keyword_indices]
+    counts = np.bincount(owners, minlength=len(songs))
+
+    embeddings = np.empty((len(songs), 3), dtype=np.float32)
+    for dim in range(3):
+        embeddings[:, dim] = np.bincount(owners, weights=colors[:, dim], minlength=len(songs)) / counts
+    return songs, embeddings
+
+
+class SongCatalog:
+    """
+    Song ids and a contiguous (n, 3) float32 embedding matrix, replaced as a whole on every change
+    so readers always see a consistent pair without locking
+    """
+
+    def __init__(self):
+        self._snapshot = (np.empty(0, dtype=np.int64), np.empty((0, 3), dtype=np.float32))
+        self._last_keyword_id = 0
+        # Keyword ids within CATALOG_LOOKBACK of the watermark that are already applied
+        self._recent_keyword_ids = set()
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray]:
+        return self._snapshot
+
+    def load(self, db):
+        """
+        Rebuild the whole catalog from the keywords table
+        """
+        cursor = db.cursor()
+        try:
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM keywords")
+            max_id = cursor.fetchone()[0]
+            # Only vocabulary keywords matter; served by idx_keyword_song (keyword, song_id, weight)
+            cursor.execute(
+                f"SELECT song_id, keyword FROM keywords WHERE keyword IN ({_VOCABULARY_PLACEHOLDERS}) AND id <= %s",
+                KEYWORDS + [max_id]
+            )
+            songs, embeddings = song_embeddings(cursor.fetchall())
+            cursor.execute("SELECT id FROM keywords WHERE id > %s AND id <= %s",
+                           (max(0, max_id - CATALOG_LOOKBACK), max_id))
+            recent = {row[0] for row in cursor.fetchall()}
+        finally:
+            cursor.close()
+            db.commit()
+
+        self._snapshot = (songs, np.ascontiguousarray(embeddings))
+        self._last_keyword_id = max_id
+        self._recent_keyword_ids = recent
+        self._loaded_at = time.monotonic()
+        logger.info(f"Loaded color embeddings for {len(songs)} songs")
+
+    def refresh_incremental(self, db) -> int:
+        """
+        Recompute embeddings of songs with keyword rows not seen before; returns the number of songs recomputed.
+        Does nothing until a keyword id beyond the watermark appears; rows committed late below the
+        watermark are picked up with the next new row (within CATALOG_LOOKBACK) or the full reload
+        """
+        cursor = db.cursor()
+        try:
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM keywords")
+            max_id = cursor.fetchone()[0]
+            if max_id <= self._last_keyword_id:
+                return 0
+
+            cursor.execute("SELECT id, song_id FROM keywords WHERE id > %s AND id <= %s",
+                           (max(0, self._last_keyword_id - CATALOG_LOOKBACK), max_id))
+            window = cursor.fetchall()
+            changed_ids = sorted({song_id for keyword_id, song_id in window
+                                  if keyword_id not in self._recent_keyword_ids})
+
+            rows = []
+            for i in range(0, len(changed_ids), 1000):
+                batch = changed_ids[i:i + 1000]
+                cursor.execute(
+                    f"SELECT song_id, keyword FROM keywords WHERE keyword IN ({_VOCABULARY_PLACEHOLDERS}) "
+                    f"AND song_id IN ({', '.join(['%s'] * len(batch))})",
+                    KEYWORDS + batch
+                )
+                rows.extend(cursor.fetchall())
+        finally:
+            cursor.close()
+            db.commit()
+
+        self._last_keyword_id = max_id
+        self._recent_keyword_ids = {keyword_id for keyword_id, _ in window if keyword_id > max_id - CATALOG_LOOKBACK}
+        if not changed_ids:
+            return 0
+
+        songs, embeddings = song_embeddings(rows)
+        ids, matrix = self._snapshot
+        # Changed songs are dropped and re-appended; songs left without vocabulary keywords stay dropped
+        keep = ~np.isin(ids, np.asarray(changed_ids, dtype=np.int64))
+        self._snapshot = (np.concatenate([ids[keep], songs]),
+                          np.ascontiguousarray(np.concatenate([matrix[keep], embeddings])))
+        return len(changed_ids)
+
+    def refresh(self):
+        """
+        Load the catalog if needed (or when the full reload interval has passed), otherwise refresh incrementally
+        """
+        with self._lock:
+            db = connect_catalog_db()
+            try:
+                if not self.loaded or time.monotonic() - self._loaded_at >= CATALOG_RELOAD_INTERVAL:
+                    self.load(db)
+                else:
+                    self.refresh_incremental(db)
+            finally:
+                db.close()
+
+    def run(self, stop: threading.Event):
+        """
+        Background refresh loop; errors are logged and retried on the next interval
+        """
+        while not stop.wait(CATALOG_REFRESH_INTERVAL):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing song catalog: {str(e)}")
+
+    def stats(self) -> Dict[str, object]:
+        ids, matrix = self._snapshot
+        return {"loaded": self.loaded, "songs": len(ids), "bytes": int(matrix.nbytes),
+                "last_keyword_id": self._last_keyword_id}
+
+
+catalog = SongCatalog()
+_catalog_stop = threading.Event()
+
+
+@app.on_event("startup")
+def start_catalog():
+    """
+    Load the song catalog before serving and keep it fresh in a background thread
+    """
+    if not CATALOG_ENABLED:
+        return
+    try:
+        catalog.refresh()
+    except Exception as e:
+        # Serve /match without the catalog; the refresh loop keeps retrying
+        logger.error(f"Error loading song catalog: {str(e)}")
+    threading.Thread(target=catalog.run, args=(_catalog_stop,), name="catalog-refresh", daemon=True).start()
+
+
+@app.on_event("shutdown")
+def stop_catalog():
+    _catalog_stop.set()
+
+
+@app.post("/match/catalog", response_model=MatchResponse)
+async def match_catalog(request: CatalogMatchRequest):
+    """
+    Match the whole song catalog to a color vector and return the best top_k songs
+    """
+    if not catalog.loaded:
+        raise HTTPException(status_code=503, detail="Song catalog is not loaded")
+    if not 1 <= request.top_k <= CATALOG_MAX_TOP_K:
+        raise HTTPException(status_code=400, detail=f"top_k must be between 1 and {CATALOG_MAX_TOP_K}")
+
+    try:
+        color = unit_color(request.color_vector.values, dtype=np.float32)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    song_ids, embeddings = catalog.snapshot()
+    scores = embeddings @ color
+    order = rank_scores(scores, request.top_k)
+    return MatchResponse(matched_items=[
+        MatchResult(music_id=str(song_ids[i]), match_score=float(scores[i])) for i in order
+    ])
+
+
 @app.get("/")
 async def root():
     """
     Root endpoint for health check
     """
-    return {"status": "healthy", "message": "Music-Picture Color Matching API is running"}
+    return {"status": "healthy", "message": "Music-Picture Color Matching API is running",
+            "catalog": catalog.stats()}
 
 
 if __name__ == "__main__":
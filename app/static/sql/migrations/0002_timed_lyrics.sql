@@ -0,0 +1,2 @@
+-- 保存带时间轴的歌词(紧凑JSON：毫秒时间差分数组+歌词行)
+ALTER TABLE songs ADD COLUMN timed_lyrics MEDIUMTEXT AFTER lyrics;
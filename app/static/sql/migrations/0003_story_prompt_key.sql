@@ -0,0 +1,4 @@
+-- 故事缓存键(模型domain+规范化关键词提示词的SHA1)，相同关键词集合的歌曲复用故事
+ALTER TABLE stories
+    ADD COLUMN prompt_key CHAR(40) AFTER prompt,
+    ADD INDEX idx_prompt_key (prompt_key);
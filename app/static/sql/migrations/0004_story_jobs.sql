@@ -0,0 +1,17 @@
+-- 创建故事生成任务表 - 故事在后台生成，客户端通过任务ID查询进度
+CREATE TABLE IF NOT EXISTS story_jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    song_id INT NOT NULL,
+    keywords TEXT NOT NULL,                           -- 生成故事使用的关键词(JSON数组)
+    status ENUM('pending', 'running', 'done', 'failed') DEFAULT 'pending',
+    attempts INT DEFAULT 0,                           -- 已尝试次数
+    story_id INT,                                     -- 生成的故事ID
+    error TEXT,                                       -- 最近一次失败的原因
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP NULL,
+    finished_at TIMESTAMP NULL,
+    FOREIGN KEY (song_id) REFERENCES songs(id) ON DELETE CASCADE,
+    FOREIGN KEY (story_id) REFERENCES stories(id) ON DELETE SET NULL,
+    INDEX idx_status_id (status, id),
+    INDEX idx_song_id (song_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
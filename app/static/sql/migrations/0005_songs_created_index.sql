@@ -0,0 +1,2 @@
+-- 歌曲列表按(created_at, id)倒序分页
+ALTER TABLE songs ADD INDEX idx_created_id (created_at, id);
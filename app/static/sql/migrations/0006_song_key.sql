@@ -0,0 +1,5 @@
+-- 歌曲唯一键(归一化后歌手名+歌曲名的SHA1)，同一首歌只保存一条记录
+-- 已有的歌曲需要在升级后运行 flask backfill-song-keys 补写唯一键
+ALTER TABLE songs
+    ADD COLUMN song_key CHAR(40) AFTER id,
+    ADD UNIQUE KEY uk_song_key (song_key);
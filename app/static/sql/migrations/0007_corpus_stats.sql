@@ -0,0 +1,11 @@
+-- 语料库文档频率：每个词在多少首歌词中出现过，歌曲入库时增量更新
+CREATE TABLE IF NOT EXISTS token_document_frequency (
+    token VARCHAR(100) COLLATE utf8mb4_bin NOT NULL PRIMARY KEY,
+    df INT NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- 语料库汇总数据，如已统计的歌词数(documents)
+CREATE TABLE IF NOT EXISTS corpus_stats (
+    name VARCHAR(50) NOT NULL PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,2 @@
+-- 按关键词查找歌曲：关键词在前的覆盖索引，供倒排索引构建时顺序扫描
+ALTER TABLE keywords ADD INDEX idx_keyword_song (keyword, song_id, weight);
@@ -0,0 +1,3 @@
+-- 歌词全文搜索：ngram解析器按连续字符切分(长度由服务器参数ngram_token_size决定，默认2)，中文无需分词
+-- 表上的第一个全文索引需要重建表，大表上执行会比较耗时
+ALTER TABLE songs ADD FULLTEXT INDEX ft_lyrics (lyrics) WITH PARSER ngram;
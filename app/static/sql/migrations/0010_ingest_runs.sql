@@ -0,0 +1,10 @@
+-- 批量导入任务的状态，所有工作进程都能查询；同一个任务ID重新提交时从断点续跑
+CREATE TABLE IF NOT EXISTS ingest_runs (
+    id VARCHAR(64) PRIMARY KEY,                       -- 任务ID(客户端提供或自动生成)
+    status ENUM('running', 'completed', 'failed') NOT NULL DEFAULT 'running',
+    total INT NOT NULL DEFAULT 0,                     -- 提交的文件数
+    stats TEXT,                                       -- 最近一次的进度统计(JSON)
+    error TEXT,                                       -- 失败原因
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP    -- 运行中的任务定期刷新，长时间没有刷新说明进程已退出
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
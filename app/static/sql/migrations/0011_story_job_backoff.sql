@@ -0,0 +1,2 @@
+-- 故事任务失败后按指数退避重试，在not_before之前不会被领取
+ALTER TABLE story_jobs ADD COLUMN not_before TIMESTAMP NULL AFTER attempts;
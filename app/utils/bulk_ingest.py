@@ -0,0 +1,452 @@
+import json
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+import click
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from flask.cli import with_appcontext
+from app.utils.database import get_db
+from app.utils.lyrics_cache import LYRICS_NOT_FOUND
+from app.utils.song_pipeline import (
+    parse_song_file_name, song_identity_key, prepare_song, find_existing_songs, save_song, save_song_keywords
+)
+from app.utils.response_cache import invalidate_song_responses
+from app.utils.story_jobs import JOB_PENDING, JOB_RUNNING, enqueue_story_job, notify_story_job
+
+# 断点文件中的状态
+STATUS_SAVED = 'saved'  # 歌词和关键词已入库，故事任务尚未创建(旧版本的断点文件中还会出现)
+STATUS_DONE = 'done'  # 全部完成，需要生成的故事已创建后台任务
+STATUS_FAILED = 'failed'  # 处理失败，续跑时会重试：带song_id时只重试故事任务的创建，否则从头处理
+
+
+def collect_file_names(file_names=(), directory=None):
+    """收集待导入的文件名，目录只扫描当前层级的.mp3文件"""
+    names = list(file_names)
+    if directory:
+        with os.scandir(directory) as entries:
+            names.extend(sorted(entry.name for entry in entries
+                                if entry.is_file() and entry.name.lower().endswith('.mp3')))
+    return names
+
+
+class IngestCheckpoint:
+    """导入断点文件：每首歌处理到一个阶段就追加一行JSON，崩溃后重新运行会跳过已完成的部分"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}  # file_name -> {'status': ..., 'song_id': ...}
+        self._lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 崩溃时最后一行可能只写了一半
+                        continue
+                    self.entries[entry['file_name']] = entry
+
+    def get(self, file_name):
+        return self.entries.get(file_name)
+
+    def record(self, file_name, status, song_id=None):
+        entry = {'file_name': file_name, 'status': status, 'song_id': song_id}
+        with self._lock:
+            self.entries[file_name] = entry
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+class IngestItem:
+    """批量导入中的一首歌"""
+
+    __slots__ = ('file_name', 'artist_name', 'song_name', 'song_key', 'song_id', 'lyrics_data', 'term_counts', 'keywords',
+                 'story_job_id')
+
+    def __init__(self, file_name, artist_name, song_name, song_id=None):
+        self.file_name = file_name
+        self.artist_name = artist_name
+        self.song_name = song_name
+        self.song_key = song_identity_key(artist_name, song_name)
+        self.song_id = song_id
+        self.lyrics_data = None
+        self.term_counts = {}
+        self.keywords = []
+        self.story_job_id = None
+
+
+class BulkIngest:
+    """
+    批量导入：去重后依次经过歌词获取、关键词提取入库两个有界线程池
+    故事和接口一样交给后台故事任务生成，导入线程不会在等待大模型时占用数据库连接
+    """
+
+    def __init__(self, app, lyrics_workers=8, analysis_workers=4,
+                 generate_stories=True, checkpoint_path=None, progress=None):
+        self.app = app
+        self.lyrics_workers = lyrics_workers
+        self.analysis_workers = analysis_workers
+        self.generate_stories = generate_stories
+        self.checkpoint = IngestCheckpoint(checkpoint_path)
+        self.progress = progress
+
+        self.stats = {
+            'total': 0,
+            'invalid': 0,
+            'duplicates': 0,
+            'existing': 0,
+            'resumed': 0,
+            'lyrics_found': 0,
+            'lyrics_missing': 0,
+            'saved': 0,
+            'stories': 0,  # 创建的故事任务数
+            'done': 0,
+            'failed': 0,
+            'pending': 0,
+            'elapsed': 0.0
+        }
+        self._started = None
+
+    def _report(self):
+        self.stats['elapsed'] = round(time.monotonic() - self._started, 2)
+        if self.progress:
+            self.progress(dict(self.stats))
+
+    def _plan(self, file_names):
+        """解析文件名并去重，返回(需要完整处理的歌曲, 只需要生成故事的歌曲)"""
+        items = []
+        story_only = []
+        seen = set()
+
+        for file_name in file_names:
+            parsed = parse_song_file_name(file_name)
+            if not parsed:
+                self.stats['invalid'] += 1
+                continue
+
+            song_key = song_identity_key(*parsed)
+            if song_key in seen:
+                self.stats['duplicates'] += 1
+                continue
+            seen.add(song_key)
+
+            entry = self.checkpoint.get(file_name)
+            if entry and entry['status'] == STATUS_DONE:
+                self.stats['resumed'] += 1
+                continue
+            # 歌曲已入库、故事任务还没有创建或创建失败时只重跑故事阶段，关键词从数据库重新读取
+            if entry and entry['status'] in (STATUS_SAVED, STATUS_FAILED) and entry['song_id']:
+                self.stats['resumed'] += 1
+                story_only.append(IngestItem(file_name, *parsed, song_id=entry['song_id']))
+                continue
+
+            items.append(IngestItem(file_name, *parsed))
+
+        # 一次查询排除数据库中已有的歌曲
+        with self.app.app_context():
+            existing = find_existing_songs(get_db(), [item.song_key for item in items],
+                                           refetch_misses_after=self.app.config.get('LYRICS_CACHE_NEGATIVE_TTL', 3600))
+
+        new_items = []
+        for item in items:
+            if item.song_key in existing:
+                self.stats['existing'] += 1
+            else:
+                new_items.append(item)
+
+        return new_items, story_only
+
+    def _fetch_lyrics(self, item):
+        """阶段一：获取歌词并提取关键词"""
+        with self.app.app_context():
+            item.lyrics_data, item.term_counts = prepare_song(item.song_name, item.artist_name)
+        return item
+
+    def _save(self, item):
+        """阶段二：歌曲、关键词和故事任务在一个事务中入库"""
+        with self.app.app_context():
+            db = get_db()
+            try:
+                song_id, created = save_song(db, item.file_name, item.song_name, item.artist_name, item.lyrics_data)
+                # 导入期间其他请求已经写入了这首歌，或者重新获取仍然没有找到歌词时，不写关键词和故事
+                keywords = save_song_keywords(db, song_id, item.term_counts) if created else []
+                story_job_id = enqueue_story_job(db, song_id, keywords) if self.generate_stories and keywords else None
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            # 提交成功后才记下song_id：断点中带song_id的失败记录表示歌曲已入库，续跑时只补建故事任务
+            item.song_id, item.keywords, item.story_job_id = song_id, keywords, story_job_id
+            if created:
+                invalidate_song_responses(item.song_id, lists=True)
+            if story_job_id:
+                notify_story_job(story_job_id)
+        return item
+
+    def _enqueue_story(self, item):
+        """
+        续跑时的故事阶段：为已入库的歌曲补建故事任务
+        歌曲已经有故事，或者已有待处理、运行中的任务时不再创建，重复续跑不会生成第二个故事
+        """
+        if not self.generate_stories:
+            return item
+
+        with self.app.app_context():
+            db = get_db()
+            cursor = db.cursor()
+            try:
+                cursor.execute(
+                    "SELECT EXISTS(SELECT 1 FROM stories WHERE song_id = %s) "
+                    "OR EXISTS(SELECT 1 FROM story_jobs WHERE song_id = %s AND status IN (%s, %s))",
+                    (item.song_id, item.song_id, JOB_PENDING, JOB_RUNNING)
+                )
+                if cursor.fetchone()[0]:
+                    db.commit()
+                    return item
+
+                cursor.execute("SELECT keyword FROM keywords WHERE song_id = %s ORDER BY weight DESC, frequency DESC",
+                               (item.song_id,))
+                item.keywords = [row[0] for row in cursor.fetchall()]
+                if item.keywords:
+                    item.story_job_id = enqueue_story_job(db, item.song_id, item.keywords)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                cursor.close()
+            if item.story_job_id:
+                notify_story_job(item.story_job_id)
+        return item
+
+    def run(self, file_names):
+        """执行批量导入，返回统计信息"""
+        self._started = time.monotonic()
+        self.stats['total'] = len(file_names)
+        items, story_only = self._plan(file_names)
+        self.stats['pending'] = len(items) + len(story_only)
+        self._report()
+
+        # 完成的任务由回调放入队列，主线程逐个取出推进到下一阶段，不用每次在全部未完成任务上等待
+        completed = queue.SimpleQueue()
+        outstanding = 0
+
+        def submit(pool, fn, stage, item):
+            nonlocal outstanding
+            outstanding += 1
+            pool.submit(fn, item).add_done_callback(lambda future: completed.put((future, stage, item)))
+
+        # 只有入库线程池使用数据库连接，每个连接只在短事务中占用
+        with ThreadPoolExecutor(self.lyrics_workers, thread_name_prefix='ingest-lyrics') as lyrics_pool, \
+                ThreadPoolExecutor(self.analysis_workers, thread_name_prefix='ingest-save') as save_pool:
+            for item in items:
+                submit(lyrics_pool, self._fetch_lyrics, 'lyrics', item)
+            for item in story_only:
+                submit(save_pool, self._enqueue_story, 'story', item)
+
+            while outstanding:
+                future, stage, item = completed.get()
+                outstanding -= 1
+                error = future.exception()
+
+                if error is not None:
+                    self.app.logger.error(f"Ingest {stage} failed for {item.file_name}: {error}")
+                    self.checkpoint.record(item.file_name, STATUS_FAILED, item.song_id)
+                    self.stats['failed'] += 1
+                    self.stats['pending'] -= 1
+                elif stage == 'lyrics':
+                    found = item.lyrics_data['lyrics'] != LYRICS_NOT_FOUND
+                    self.stats['lyrics_found' if found else 'lyrics_missing'] += 1
+                    submit(save_pool, self._save, 'save', item)
+                else:
+                    if stage == 'save':
+                        self.stats['saved'] += 1
+                    if item.story_job_id:
+                        self.stats['stories'] += 1
+                    self.checkpoint.record(item.file_name, STATUS_DONE, item.song_id)
+                    self.stats['done'] += 1
+                    self.stats['pending'] -= 1
+
+                self._report()
+
+        return dict(self.stats)
+
+
+# 接口发起的导入任务状态
+RUN_RUNNING = 'running'
+RUN_COMPLETED = 'completed'
+RUN_FAILED = 'failed'
+RUN_INTERRUPTED = 'interrupted'  # 数据库中仍为running，但长时间没有刷新进度，进程已经退出
+
+# 任务ID会用在断点文件名中
+_RUN_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+
+def is_valid_run_id(run_id):
+    return isinstance(run_id, str) and _RUN_ID_PATTERN.fullmatch(run_id) is not None
+
+
+def claim_ingest_run(db, run_id, total, stale_after):
+    """
+    登记导入任务并标记为运行中，返回是否成功
+    同一个任务ID正在其他进程中运行(最近stale_after秒内刷新过进度)时返回False
+    """
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT status = %s AND updated_at >= NOW() - INTERVAL %s SECOND "
+                       "FROM ingest_runs WHERE id = %s FOR UPDATE", (RUN_RUNNING, stale_after, run_id))
+        row = cursor.fetchone()
+        if row and row[0]:
+            db.rollback()
+            return False
+
+        cursor.execute(
+            "INSERT INTO ingest_runs (id, status, total, stats) VALUES (%s, %s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE status = VALUES(status), total = VALUES(total), stats = VALUES(stats), "
+            "error = NULL, updated_at = CURRENT_TIMESTAMP",
+            (run_id, RUN_RUNNING, total, json.dumps({'total': total}))
+        )
+        db.commit()
+        return True
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def update_ingest_run(db, run_id, stats, status=RUN_RUNNING, error=None):
+    """保存导入任务的进度和状态，同时刷新updated_at"""
+    cursor = db.cursor()
+    try:
+        cursor.execute("UPDATE ingest_runs SET status = %s, stats = %s, error = %s, updated_at = CURRENT_TIMESTAMP "
+                       "WHERE id = %s", (status, json.dumps(stats), error, run_id))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def get_ingest_run(db, run_id, stale_after):
+    """从数据库读取导入任务，不存在时返回None"""
+    cursor = db.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT id, status, total, stats, error, created_at, updated_at, "
+                       "updated_at < NOW() - INTERVAL %s SECOND AS stale FROM ingest_runs WHERE id = %s",
+                       (stale_after, run_id))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+        db.commit()
+
+    if not row:
+        return None
+
+    status = row['status']
+    if status == RUN_RUNNING and row['stale']:
+        status = RUN_INTERRUPTED
+    return {
+        'ingest_id': row['id'],
+        'status': status,
+        'error': row['error'],
+        'stats': json.loads(row['stats']) if row['stats'] else {'total': row['total']},
+        'created_at': row['created_at'],
+        'updated_at': row['updated_at']
+    }
+
+
+def _create_ingest(app, checkpoint_path=None, progress=None, generate_stories=True):
+    """按应用配置创建导入器"""
+    return BulkIngest(
+        app,
+        lyrics_workers=app.config['INGEST_LYRICS_WORKERS'],
+        # 至少留一半连接给接口请求
+        analysis_workers=max(1, min(app.config['INGEST_ANALYSIS_WORKERS'], app.config['DATABASE_POOL_SIZE'] // 2)),
+        generate_stories=generate_stories,
+        checkpoint_path=checkpoint_path,
+        progress=progress
+    )
+
+
+def start_ingest(app, file_names, generate_stories=True, run_id=None):
+    """
+    在后台线程中执行导入，返回任务ID；同一个任务ID正在运行时返回None
+    断点文件按任务ID命名，进程崩溃后用同一个任务ID重新提交会跳过已完成的歌曲
+    """
+    run_id = run_id or uuid.uuid4().hex
+    if not claim_ingest_run(get_db(), run_id, len(file_names), app.config['INGEST_RUN_STALE_SECONDS']):
+        return None
+
+    checkpoint_path = os.path.join(app.instance_path, f'ingest-{run_id}.jsonl')
+    os.makedirs(app.instance_path, exist_ok=True)
+
+    def target():
+        with app.app_context():
+            db = get_db()
+            latest = {'stats': {'total': len(file_names)}, 'saved_at': 0.0}
+
+            # 进度按间隔写入数据库，同时作为任务仍在运行的心跳；写入失败不影响导入
+            def progress(stats):
+                latest['stats'] = stats
+                now = time.monotonic()
+                if now - latest['saved_at'] >= app.config['INGEST_PROGRESS_INTERVAL']:
+                    latest['saved_at'] = now
+                    try:
+                        update_ingest_run(db, run_id, stats)
+                    except Exception as e:
+                        app.logger.warning(f"Failed to save progress of ingest run {run_id}: {e}")
+
+            try:
+                stats = _create_ingest(app, checkpoint_path, progress, generate_stories).run(file_names)
+                update_ingest_run(db, run_id, stats, RUN_COMPLETED)
+            except Exception as e:
+                app.logger.error(f"Ingest run {run_id} failed: {e}")
+                update_ingest_run(db, run_id, latest['stats'], RUN_FAILED, str(e))
+
+    threading.Thread(target=target, name=f'ingest-{run_id[:8]}', daemon=True).start()
+    return run_id
+
+
+@click.command('ingest-songs')
+@click.argument('file_names', nargs=-1)
+@click.option('--dir', 'directory', type=click.Path(exists=True, file_okay=False), help='扫描目录中的.mp3文件')
+@click.option('--checkpoint', 'checkpoint_path', default=None, help='断点文件路径，重新运行时从断点续跑')
+@click.option('--no-stories', is_flag=True, help='只导入歌词和关键词，不生成故事')
+@with_appcontext
+def ingest_songs_command(file_names, directory, checkpoint_path, no_stories):
+    """命令行批量导入歌曲"""
+    app = current_app._get_current_object()
+    names = collect_file_names(file_names, directory)
+    if not names:
+        click.echo('没有需要导入的文件.')
+        return
+
+    if checkpoint_path is None:
+        checkpoint_path = os.path.join(app.instance_path, 'ingest-checkpoint.jsonl')
+
+    last_report = [0.0]
+
+    def progress(stats):
+        now = time.monotonic()
+        if now - last_report[0] >= 2 or stats['pending'] == 0:
+            last_report[0] = now
+            click.echo(
+                f"[{stats['elapsed']:.0f}s] 完成 {stats['done']}，失败 {stats['failed']}，"
+                f"进行中 {stats['pending']}，已有 {stats['existing']}，跳过 {stats['resumed']}"
+            )
+
+    stats = _create_ingest(app, checkpoint_path, progress, not no_stories).run(names)
+    click.echo(f"导入完成: {json.dumps(stats, ensure_ascii=False)}")
+
+
+def init_app_ingest(app):
+    """注册批量导入的命令行命令"""
+    app.cli.add_command(ingest_songs_command)
@@ -0,0 +1,345 @@
+import heapq
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from app.utils import keyword_extractor
+from app.utils.database import get_db
+from app.utils.lyrics_cache import LYRICS_NOT_FOUND
+
+# corpus_stats表中记录已统计歌词数的键
+DOCUMENTS = 'documents'
+
+
+def idf(df, documents):
+    """平滑的逆文档频率，所有歌词都包含的词也不会得到0或负数"""
+    return math.log((1 + documents) / (1 + df)) + 1
+
+
+def tf_idf(count, df, documents):
+    """对数词频乘以逆文档频率，削弱副歌反复出现带来的影响"""
+    return (1 + math.log(count)) * idf(df, documents)
+
+
+class CorpusStats:
+    """
+    语料库统计：每个词在多少首歌词中出现过(文档频率)和已统计的歌词总数
+    数据持久化在token_document_frequency和corpus_stats表中，内存中缓存最近使用的词
+    其他进程的写入在缓存过期后可见，对排序结果的影响可以忽略
+    """
+
+    def __init__(self, max_tokens=200000, ttl=300):
+        self.max_tokens = max_tokens
+        self.ttl = ttl
+
+        self._df = OrderedDict()  # token -> (过期时间, 文档频率)
+        self._documents = None  # (过期时间, 歌词总数)
+        self._lock = threading.Lock()
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'documents_added': 0
+        }
+
+    def document_count(self, db):
+        """已统计的歌词总数"""
+        now = time.monotonic()
+        with self._lock:
+            if self._documents is not None and self._documents[0] > now:
+                return self._documents[1]
+
+        cursor = db.cursor()
+        try:
+            cursor.execute("SELECT value FROM corpus_stats WHERE name = %s", (DOCUMENTS,))
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+
+        documents = row[0] if row else 0
+        with self._lock:
+            self._documents = (now + self.ttl, documents)
+        return documents
+
+    def document_frequencies(self, db, tokens):
+        """返回{词语: 文档频率}，缓存未命中的词一次查询补齐，没出现过的词为0"""
+        now = time.monotonic()
+        result = {}
+        missing = []
+        with self._lock:
+            for token in tokens:
+                entry = self._df.get(token)
+                if entry is not None and entry[0] > now:
+                    self._df.move_to_end(token)
+                    result[token] = entry[1]
+                else:
+                    missing.append(token)
+            self._counters['hits'] += len(result)
+            self._counters['misses'] += len(missing)
+
+        if missing:
+            loaded = dict.fromkeys(missing, 0)
+            cursor = db.cursor()
+            try:
+                placeholders = ', '.join(['%s'] * len(missing))
+                cursor.execute(f"SELECT token, df FROM token_document_frequency WHERE token IN ({placeholders})",
+                               missing)
+                loaded.update(cursor.fetchall())
+            finally:
+                cursor.close()
+
+            expires_at = now + self.ttl
+            with self._lock:
+                for token, df in loaded.items():
+                    self._df[token] = (expires_at, df)
+                    self._df.move_to_end(token)
+                while len(self._df) > self.max_tokens:
+                    self._df.popitem(last=False)
+            result.update(loaded)
+
+        return result
+
+    def add_document(self, db, tokens):
+        """
+        把一首歌词的词加入文档频率并把歌词总数加一，由调用方提交事务
+        按词排序后写入，并发写入相同的词时加锁顺序一致，不会互相死锁
+        """
+        tokens = sorted(set(tokens))
+        if not tokens:
+            return
+
+        cursor = db.cursor()
+        try:
+            cursor.executemany(
+                "INSERT INTO token_document_frequency (token, df) VALUES (%s, 1) "
+                "ON DUPLICATE KEY UPDATE df = df + 1",
+                [(token,) for token in tokens]
+            )
+            cursor.execute(
+                "INSERT INTO corpus_stats (name, value) VALUES (%s, 1) ON DUPLICATE KEY UPDATE value = value + 1",
+                (DOCUMENTS,)
+            )
+        finally:
+            cursor.close()
+
+        # 缓存中的旧值失效，下次读取时从数据库重新加载
+        with self._lock:
+            for token in tokens:
+                self._df.pop(token, None)
+            self._documents = None
+            self._counters['documents_added'] += 1
+
+    def rank(self, db, counts, top_n=5):
+        """按TF-IDF从一首歌的词频中选出关键词，返回[(词语, 次数, 得分)]"""
+        if not counts:
+            return []
+
+        documents = self.document_count(db)
+        frequencies = self.document_frequencies(db, list(counts))
+        scored = ((word, count, tf_idf(count, frequencies[word], documents)) for word, count in counts.items())
+        return heapq.nlargest(top_n, scored, key=lambda item: item[2])
+
+    def clear(self):
+        with self._lock:
+            self._df.clear()
+            self._documents = None
+
+    def stats(self):
+        """返回缓存命中统计"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['cached_tokens'] = len(self._df)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+_corpus_stats = None
+_corpus_stats_lock = threading.Lock()
+
+
+def get_corpus_stats():
+    """获取进程内共享的语料库统计，首次使用时按应用配置创建"""
+    global _corpus_stats
+    if _corpus_stats is None:
+        with _corpus_stats_lock:
+            if _corpus_stats is None:
+                config = current_app.config
+                _corpus_stats = CorpusStats(
+                    max_tokens=config.get('CORPUS_STATS_CACHE_SIZE', 200000),
+                    ttl=config.get('CORPUS_STATS_CACHE_TTL', 300)
+                )
+    return _corpus_stats
+
+
+def _init_tokenizer_process(config):
+    """重算任务的分词子进程：按应用配置创建关键词提取器"""
+    keyword_extractor._keyword_extractor = keyword_extractor.create_keyword_extractor(config)
+
+
+def _count_batch(lyrics_list):
+    return keyword_extractor._keyword_extractor.count_many(lyrics_list)
+
+
+def _iter_song_terms(db, after_id, max_id, batch_size=500, workers=1):
+    """
+    按ID顺序分批读取(after_id, max_id]之间的歌词并分词，产出(歌曲ID列表, 词频列表)
+    workers大于1时分词在子进程中进行，同时最多有workers*2批在处理，内存占用与歌曲总数无关
+    """
+    def batches():
+        last_id = after_id
+        cursor = db.cursor()
+        try:
+            while True:
+                cursor.execute(
+                    "SELECT id, lyrics FROM songs WHERE id > %s AND id <= %s "
+                    "AND lyrics IS NOT NULL AND lyrics != %s ORDER BY id LIMIT %s",
+                    (last_id, max_id, LYRICS_NOT_FOUND, batch_size)
+                )
+                rows = cursor.fetchall()
+                db.commit()
+                if not rows:
+                    return
+                last_id = rows[-1][0]
+                yield [row[0] for row in rows], [row[1] for row in rows]
+        finally:
+            cursor.close()
+
+    if workers <= 1:
+        extractor = keyword_extractor.get_keyword_extractor()
+        for song_ids, lyrics_list in batches():
+            yield song_ids, extractor.count_many(lyrics_list)
+        return
+
+    config = {key: current_app.config.get(key) for key in ('KEYWORD_STOPWORDS_FILE', 'KEYWORD_USER_DICT', 'KEYWORD_HMM')}
+    with ProcessPoolExecutor(workers, initializer=_init_tokenizer_process, initargs=(config,)) as executor:
+        pending = deque()
+        for song_ids, lyrics_list in batches():
+            pending.append((song_ids, executor.submit(_count_batch, lyrics_list)))
+            if len(pending) >= workers * 2:
+                song_ids, future = pending.popleft()
+                yield song_ids, future.result()
+        while pending:
+            song_ids, future = pending.popleft()
+            yield song_ids, future.result()
+
+
+def _max_song_id(db):
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM songs")
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+        db.commit()
+
+
+def recompute_document_frequencies(db, batch_size=500, workers=1, echo=None):
+    """
+    全量重算文档频率：流式分词统计后写入临时表，再用RENAME TABLE原子替换，返回(歌词数, 词数)
+    重算期间新入库的歌曲在替换后补算；替换前一瞬间入库的歌曲可能漏算，对排序结果的影响可以忽略
+    """
+    max_id = _max_song_id(db)
+    df = {}
+    documents = 0
+    for song_ids, counts_list in _iter_song_terms(db, 0, max_id, batch_size, workers):
+        for counts in counts_list:
+            if counts:
+                documents += 1
+                for token in counts:
+                    df[token] = df.get(token, 0) + 1
+        if echo:
+            echo(f'已统计 {documents} 首歌词，{len(df)} 个词 (歌曲ID {song_ids[-1]}/{max_id})')
+
+    cursor = db.cursor()
+    try:
+        cursor.execute("DROP TABLE IF EXISTS token_document_frequency_new")
+        cursor.execute("CREATE TABLE token_document_frequency_new LIKE token_document_frequency")
+        rows = sorted(df.items())
+        for i in range(0, len(rows), 5000):
+            cursor.executemany("INSERT INTO token_document_frequency_new (token, df) VALUES (%s, %s)",
+                               rows[i:i + 5000])
+            db.commit()
+
+        # 替换前记下最大歌曲ID，之后入库的歌曲已经计入新表，不需要补算
+        caught_up_to = _max_song_id(db)
+        cursor.execute(
+            "RENAME TABLE token_document_frequency TO token_document_frequency_old, "
+            "token_document_frequency_new TO token_document_frequency"
+        )
+        cursor.execute(
+            "INSERT INTO corpus_stats (name, value) VALUES (%s, %s) ON DUPLICATE KEY UPDATE value = VALUES(value)",
+            (DOCUMENTS, documents)
+        )
+        db.commit()
+        cursor.execute("DROP TABLE token_document_frequency_old")
+    finally:
+        cursor.close()
+
+    # 重算期间入库的歌曲只计入了被替换掉的旧表，补算到新表中
+    corpus = get_corpus_stats()
+    corpus.clear()
+    for _, counts_list in _iter_song_terms(db, max_id, caught_up_to, batch_size):
+        for counts in counts_list:
+            if counts:
+                corpus.add_document(db, counts)
+                documents += 1
+        db.commit()
+
+    return documents, len(df)
+
+
+def rerank_keywords(db, top_n=5, batch_size=500, workers=1, echo=None):
+    """按当前的文档频率为所有歌曲重新选出自动提取的关键词并写入TF-IDF权重，返回处理的歌曲数"""
+    corpus = get_corpus_stats()
+    max_id = _max_song_id(db)
+    processed = 0
+    cursor = db.cursor()
+    try:
+        for song_ids, counts_list in _iter_song_terms(db, 0, max_id, batch_size, workers):
+            rows = []
+            for song_id, counts in zip(song_ids, counts_list):
+                for word, count, score in corpus.rank(db, counts, top_n):
+                    rows.append((song_id, word, count, round(score, 4)))
+
+            placeholders = ', '.join(['%s'] * len(song_ids))
+            cursor.execute(f"DELETE FROM keywords WHERE source = 'auto' AND song_id IN ({placeholders})", song_ids)
+            if rows:
+                cursor.executemany(
+                    "INSERT INTO keywords (song_id, keyword, frequency, weight, source) VALUES (%s, %s, %s, %s, 'auto') "
+                    "ON DUPLICATE KEY UPDATE frequency = VALUES(frequency), weight = VALUES(weight)",
+                    rows
+                )
+            db.commit()
+            processed += len(song_ids)
+            if echo:
+                echo(f'已重新选取 {processed} 首歌的关键词 (歌曲ID {song_ids[-1]}/{max_id})')
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+    return processed
+
+
+@click.command('recompute-df')
+@click.option('--batch-size', default=500, show_default=True, help='每批读取和分词的歌曲数')
+@click.option('--workers', default=1, show_default=True, help='分词子进程数')
+@click.option('--rerank', is_flag=True, help='重算后按TF-IDF重新选取所有歌曲的关键词')
+@with_appcontext
+def recompute_df_command(batch_size, workers, rerank):
+    """命令行全量重算语料库文档频率，用于回填历史数据"""
+    db = get_db()
+    documents, tokens = recompute_document_frequencies(db, batch_size, workers, echo=click.echo)
+    click.echo(f'文档频率重算完成: {documents} 首歌词，{tokens} 个词')
+    if rerank:
+        processed = rerank_keywords(db, batch_size=batch_size, workers=workers, echo=click.echo)
+        click.echo(f'关键词重新选取完成: {processed} 首歌')
+
+
+def init_app_corpus(app):
+    """注册语料库统计的命令行命令"""
+    app.cli.add_command(recompute_df_command)
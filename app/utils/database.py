@@ -1,120 +1,305 @@
 import mysql.connector
-from mysql.connector import pooling
 import click
-from flask import current_app, g
 import os
-import pathlib
+import re
+import threading
+import time
+from collections import deque
+from flask import current_app, g
+from flask.cli import with_appcontext
+
+
+class PoolExhaustedError(Exception):
+    """在超时时间内没有借到数据库连接"""
+
+
+class ConnectionPool:
+    """有界MySQL连接池：借出时做健康检查，回收过旧的连接，并统计池的饱和情况"""
+
+    def __init__(self, connect_args, size=10, checkout_timeout=5.0, recycle_seconds=3600, ping_after=1.0):
+        self.connect_args = connect_args
+        self.size = size
+        self.checkout_timeout = checkout_timeout
+        self.recycle_seconds = recycle_seconds
+        self.ping_after = ping_after
+
+        self._slots = threading.BoundedSemaphore(size)  # 限制同时借出的连接数
+        self._idle = deque()  # (连接, 创建时间, 归还时间)，后进先出以保持热连接
+        self._created_at = {}  # id(连接) -> 创建时间
+        self._lock = threading.Lock()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'created': 0,
+            'recycled': 0,
+            'health_check_failures': 0,
+            'discarded': 0,
+            'total_wait_ms': 0.0,
+            'max_wait_ms': 0.0
+        }
+
+    def _connect(self):
+        conn = mysql.connector.connect(**self.connect_args)
+        # 设置自动提交
+        conn.autocommit = False
+        with self._lock:
+            self._stats['created'] += 1
+            self._created_at[id(conn)] = time.monotonic()
+        return conn
+
+    def _discard(self, conn, reason='discarded'):
+        with self._lock:
+            self._stats[reason] += 1
+            self._created_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """借出一个可用连接，池满时最多等待checkout_timeout秒"""
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise PoolExhaustedError(f"No database connection available within {self.checkout_timeout}s")
+
+        waited = (time.monotonic() - start) * 1000
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['total_wait_ms'] += waited
+            self._stats['max_wait_ms'] = max(self._stats['max_wait_ms'], waited)
+            if waited >= 1:
+                self._stats['waits'] += 1
+
+        try:
+            while True:
+                with self._lock:
+                    entry = self._idle.pop() if self._idle else None
+                if entry is None:
+                    return self._connect()
+
+                conn, created_at, returned_at = entry
+                now = time.monotonic()
+                if now - created_at > self.recycle_seconds:
+                    self._discard(conn, 'recycled')
+                    continue
+
+                # 空闲超过ping_after秒的连接先ping一下，失效的连接直接丢弃
+                if now - returned_at > self.ping_after:
+                    try:
+                        conn.ping(reconnect=False)
+                    except Exception:
+                        self._discard(conn, 'health_check_failures')
+                        continue
+                return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        """归还连接，未提交的事务会被回滚，出错的连接直接丢弃"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            created_at = self._created_at.get(id(conn), 0.0)
+            with self._lock:
+                self._idle.append((conn, created_at, time.monotonic()))
+        except Exception:
+            self._discard(conn)
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = len(self._idle)
+            stats['open'] = len(self._created_at)
+        stats['size'] = self.size
+        stats['in_use'] = stats['open'] - stats['idle']
+        stats['total_wait_ms'] = round(stats['total_wait_ms'], 1)
+        stats['max_wait_ms'] = round(stats['max_wait_ms'], 1)
+        return stats
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """获取本进程的连接池，首次使用时创建；fork出的子进程不复用父进程的连接"""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                config = current_app.config
+                _pool = ConnectionPool(
+                    {
+                        'host': config['DATABASE_HOST'],
+                        'user': config['DATABASE_USER'],
+                        'password': config['DATABASE_PASSWORD'],
+                        'database': config['DATABASE_NAME'],
+                        'port': config['DATABASE_PORT']
+                    },
+                    size=config['DATABASE_POOL_SIZE'],
+                    checkout_timeout=config['DATABASE_POOL_TIMEOUT'],
+                    recycle_seconds=config['DATABASE_POOL_RECYCLE'],
+                    ping_after=config['DATABASE_POOL_PING_AFTER']
+                )
+                _pool_pid = os.getpid()
+    return _pool
 
 
 def get_db():
-    """获取数据库连接"""
+    """获取数据库连接，从连接池借出，应用上下文结束时归还"""
     if 'db' not in g:
-        # 从应用配置获取数据库连接参数
-        g.db = mysql.connector.connect(
-            host=current_app.config['DATABASE_HOST'],
-            user=current_app.config['DATABASE_USER'],
-            password=current_app.config['DATABASE_PASSWORD'],
-            database=current_app.config['DATABASE_NAME'],
-            port=current_app.config['DATABASE_PORT']
-        )
-        # 设置自动提交
-        g.db.autocommit = False
+        g.db = get_pool().acquire()
 
     return g.db
 
 
 def close_db(e=None):
-    """关闭数据库连接"""
+    """归还数据库连接"""
     db = g.pop('db', None)
 
     if db is not None:
-        db.close()
+        get_pool().release(db)
+
+
+# 迁移文件目录(相对于应用根目录)和文件名格式: 0001_initial.sql
+MIGRATIONS_DIR = os.path.join('static', 'sql', 'migrations')
+_MIGRATION_FILE = re.compile(r'^(\d{4})_(\w+)\.sql$')
 
 
-def init_db():
-    """初始化数据库"""
+def list_migrations():
+    """按版本号返回所有迁移文件[(版本号, 名称, 路径)]"""
+    directory = os.path.join(current_app.root_path, MIGRATIONS_DIR)
+    migrations = []
+    for file_name in os.listdir(directory):
+        match = _MIGRATION_FILE.match(file_name)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(directory, file_name)))
+    return sorted(migrations)
+
+
+def split_sql(script):
+    """把迁移脚本按行尾的分号拆分为单条语句，去掉整行注释"""
+    statements = []
+    lines = []
+    for line in script.splitlines():
+        if not lines and (not line.strip() or line.lstrip().startswith('--')):
+            continue
+        lines.append(line)
+        if line.rstrip().endswith(';'):
+            statements.append('\n'.join(lines).rstrip().rstrip(';'))
+            lines = []
+    if ''.join(lines).strip():
+        statements.append('\n'.join(lines))
+    return statements
+
+
+def _ensure_database():
+    """数据库不存在时创建"""
+    config = current_app.config
+    conn = mysql.connector.connect(
+        host=config['DATABASE_HOST'],
+        user=config['DATABASE_USER'],
+        password=config['DATABASE_PASSWORD'],
+        port=config['DATABASE_PORT']
+    )
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"CREATE DATABASE IF NOT EXISTS `{config['DATABASE_NAME']}` "
+            f"CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci"
+        )
+        cursor.close()
+    finally:
+        conn.close()
+
+
+def get_schema_version(db):
+    """返回已应用的最高迁移版本，没有记录时返回0"""
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+        db.commit()
+
+
+def upgrade_database(target=None, echo=None):
+    """
+    依次执行尚未应用的迁移，每个迁移成功后记录到schema_version，返回本次应用的版本列表
+    MySQL的DDL会隐式提交，迁移中途失败时需要按报错手动修复后重新运行
+    """
+    _ensure_database()
     db = get_db()
     cursor = db.cursor()
+    try:
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS schema_version ("
+            "version INT PRIMARY KEY, "
+            "name VARCHAR(255) NOT NULL, "
+            "applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
+            ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
+        )
+        current = get_schema_version(db)
+
+        # 引入迁移之前由init-db创建的数据库已经有初始表结构，记为版本1
+        if current == 0:
+            cursor.execute("SHOW TABLES LIKE 'songs'")
+            if cursor.fetchone():
+                cursor.execute("INSERT INTO schema_version (version, name) VALUES (1, 'initial')")
+                db.commit()
+                current = 1
 
-    # 读取数据库初始化脚本
-    with current_app.open_resource('static/sql/schema.sql') as f:
-        cursor.execute(f.read().decode('utf8'))
+        applied = []
+        for version, name, path in list_migrations():
+            if version <= current or (target is not None and version > target):
+                continue
+            if echo:
+                echo(f'应用迁移 {version:04d}_{name}...')
+            with open(path, encoding='utf-8') as f:
+                for statement in split_sql(f.read()):
+                    cursor.execute(statement)
+            cursor.execute("INSERT INTO schema_version (version, name) VALUES (%s, %s)", (version, name))
+            db.commit()
+            applied.append(version)
+        return applied
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
 
-    db.commit()
-    cursor.close()
+
+@click.command('db-upgrade')
+@click.option('--target', type=int, default=None, help='只升级到指定版本')
+@with_appcontext
+def db_upgrade_command(target):
+    """命令行执行数据库迁移，部署时运行一次"""
+    applied = upgrade_database(target, echo=click.echo)
+    version = get_schema_version(get_db())
+    if applied:
+        click.echo(f'已应用 {len(applied)} 个迁移，当前版本: {version}')
+    else:
+        click.echo(f'数据库已是最新版本: {version}')
 
 
 @click.command('init-db')
+@with_appcontext
 def init_db_command():
-    """命令行初始化数据库"""
-    init_db()
+    """命令行初始化数据库，等同于db-upgrade"""
+    upgrade_database(echo=click.echo)
     click.echo('数据库初始化完成.')
 
 
 def init_app_db(app):
-    """初始化应用的数据库配置"""
-    # 注册关闭连接的回调
+    """注册关闭连接的回调和数据库命令；创建应用时不访问数据库，表结构由db-upgrade维护"""
     app.teardown_appcontext(close_db)
-
-    # 注册命令行命令
+    app.cli.add_command(db_upgrade_command)
     app.cli.add_command(init_db_command)
-
-    # 定义初始化数据库的函数
-    def initialize_database():
-        try:
-            # 尝试连接到MySQL服务器（不指定数据库）
-            conn = mysql.connector.connect(
-                host=app.config['DATABASE_HOST'],
-                user=app.config['DATABASE_USER'],
-                password=app.config['DATABASE_PASSWORD'],
-                port=app.config['DATABASE_PORT']
-            )
-            cursor = conn.cursor()
-
-            # 检查数据库是否存在
-            cursor.execute(f"SHOW DATABASES LIKE '{app.config['DATABASE_NAME']}'")
-            result = cursor.fetchone()
-
-            # 如果数据库不存在，创建它
-            if not result:
-                app.logger.info(f"Creating database {app.config['DATABASE_NAME']}...")
-                cursor.execute(
-                    f"CREATE DATABASE {app.config['DATABASE_NAME']} CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci")
-                conn.commit()
-
-                # 关闭当前连接
-                cursor.close()
-                conn.close()
-
-                # 初始化数据库表
-                with app.app_context():
-                    init_db()
-                app.logger.info("Database initialized successfully!")
-            else:
-                cursor.close()
-                conn.close()
-                app.logger.info(f"Database {app.config['DATABASE_NAME']} already exists.")
-
-                # 检查表是否存在
-                try:
-                    with app.app_context():
-                        db = get_db()
-                        cursor = db.cursor()
-                        cursor.execute("SHOW TABLES")
-                        tables = cursor.fetchall()
-                        cursor.close()
-
-                        if not tables:
-                            app.logger.info("Tables do not exist. Initializing database...")
-                            init_db()
-                except Exception as table_error:
-                    app.logger.error(f"Error checking tables: {table_error}")
-        except Exception as e:
-            app.logger.error(f"Database initialization error: {e}")
-
-    # 在应用上下文中执行初始化数据库的函数
-    with app.app_context():
-        try:
-            initialize_database()
-        except Exception as init_error:
-            app.logger.error(f"Error during database initialization: {init_error}")
\ No newline at end of file
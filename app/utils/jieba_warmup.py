@@ -0,0 +1,40 @@
+import os
+import time
+import jieba
+from app.utils.keyword_extractor import get_keyword_extractor
+
+# 预热时切分的样例文本，顺便加载HMM模型和正则
+_WARMUP_TEXT = '预热分词词典，让第一个请求不用等待'
+
+
+def warm_up_jieba(cache_file=None):
+    """
+    加载jieba前缀词典并做一次切分，返回耗时(秒)
+    cache_file为词典缓存文件路径：存在时直接反序列化，不存在时构建后写入，供之后启动的进程使用
+    """
+    start = time.perf_counter()
+    if cache_file:
+        directory = os.path.dirname(os.path.abspath(cache_file))
+        os.makedirs(directory, exist_ok=True)
+        jieba.dt.tmp_dir = directory
+        jieba.dt.cache_file = os.path.basename(cache_file)
+
+    jieba.initialize()
+    jieba.lcut(_WARMUP_TEXT)
+    return time.perf_counter() - start
+
+
+def init_app_jieba(app):
+    """
+    创建应用时预热jieba并创建关键词提取器(加载用户词典和停用词)；以gunicorn preload_app方式启动时在主进程中完成，
+    词典在fork后由各工作进程通过写时复制共享
+    """
+    # create_app(test_config)只传入部分配置时使用默认值
+    if not app.config.get('JIEBA_WARMUP', True):
+        return
+
+    cache_file = app.config.get('JIEBA_CACHE_FILE') or os.path.join(app.instance_path, 'jieba.cache')
+    elapsed = warm_up_jieba(cache_file)
+    with app.app_context():
+        get_keyword_extractor()
+    app.logger.info(f"jieba dictionary loaded in {elapsed * 1000:.0f}ms (cache: {cache_file})")
@@ -0,0 +1,117 @@
+import heapq
+import os
+import threading
+from operator import itemgetter
+import jieba
+from flask import current_app
+
+# 默认停用词（常见的无意义词语）
+DEFAULT_STOPWORDS = frozenset([
+    '的', '了', '和', '是', '在', '我', '有', '不', '这', '也', '你', '都',
+    '我们', '你们', '他们', '她们', '它们', '那', '就', '还', '要', '人',
+    '啊', '哦', '呢', '吧', '呀', '哎', '噢', '喔', '哇', '嗯', '嘿', '哼',
+    'la', 'oh', 'yeah', 'hey', 'baby', 'ah', 'ooh', 'na'
+])
+
+# 随项目提供的歌词常用词词典(jieba用户词典格式: 词语 词频 词性)
+DEFAULT_USER_DICT = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'dict', 'lyrics_userdict.txt')
+
+# 批量分词时拼接歌词使用的分隔符，jieba会把它作为单独的词输出
+_DOCUMENT_SEPARATOR = '\x1e'
+
+
+def load_stopwords(path):
+    """从文件读取停用词，每行一个，#开头的行是注释"""
+    with open(path, encoding='utf-8') as f:
+        return frozenset(line.strip() for line in f if line.strip() and not line.startswith('#'))
+
+
+class KeywordExtractor:
+    """歌词关键词提取：冻结的停用词表、可选的用户词典，逐词流式计数后用堆取出前top_n个"""
+
+    def __init__(self, stopwords=DEFAULT_STOPWORDS, user_dict=None, hmm=False, min_length=2, tokenizer=None):
+        self.stopwords = frozenset(stopwords)
+        self.hmm = hmm
+        self.min_length = min_length
+        # 默认使用jieba的全局分词器，与预热时加载的词典共享
+        self.tokenizer = tokenizer or jieba.dt
+        if user_dict:
+            self.tokenizer.load_userdict(user_dict)
+
+    def _keep(self, word):
+        """过滤掉长度过短、停用词、纯数字和纯英文单词，word已经去掉首尾空白"""
+        return (len(word) >= self.min_length and
+                word not in self.stopwords and
+                not word.isdigit() and
+                not word.isascii())
+
+    def count(self, lyrics):
+        """分词并统计词频，不生成中间列表，返回{词语: 次数}"""
+        counts = {}
+        keep = self._keep
+        for word in self.tokenizer.cut(lyrics, HMM=self.hmm):
+            word = word.strip()
+            if keep(word):
+                counts[word] = counts.get(word, 0) + 1
+        return counts
+
+    def top(self, counts, top_n=5):
+        """用堆取出出现次数最多的top_n个词，次数相同时保持首次出现的顺序"""
+        return heapq.nlargest(top_n, counts.items(), key=itemgetter(1))
+
+    def extract(self, lyrics, top_n=5):
+        """提取单首歌词的关键词，返回[(词语, 次数)]"""
+        return self.top(self.count(lyrics), top_n)
+
+    def count_many(self, lyrics_list):
+        """
+        批量分词并统计词频，返回与输入顺序一致的[{词语: 次数}]
+        所有歌词用分隔符拼接后一次分词，省去每首歌单独调用分词器的开销
+        """
+        if not lyrics_list:
+            return []
+
+        text = _DOCUMENT_SEPARATOR.join(lyrics.replace(_DOCUMENT_SEPARATOR, ' ') for lyrics in lyrics_list)
+        results = []
+        counts = {}
+        keep = self._keep
+        for word in self.tokenizer.cut(text, HMM=self.hmm):
+            if word == _DOCUMENT_SEPARATOR:
+                results.append(counts)
+                counts = {}
+                continue
+            word = word.strip()
+            if keep(word):
+                counts[word] = counts.get(word, 0) + 1
+        results.append(counts)
+        return results
+
+    def extract_many(self, lyrics_list, top_n=5):
+        """批量提取关键词，返回与输入顺序一致的[[(词语, 次数)]]"""
+        return [self.top(counts, top_n) for counts in self.count_many(lyrics_list)]
+
+
+_keyword_extractor = None
+_keyword_extractor_lock = threading.Lock()
+
+
+def create_keyword_extractor(config):
+    """按应用配置创建关键词提取器"""
+    stopwords = DEFAULT_STOPWORDS
+    if config.get('KEYWORD_STOPWORDS_FILE'):
+        stopwords = stopwords | load_stopwords(config['KEYWORD_STOPWORDS_FILE'])
+    return KeywordExtractor(
+        stopwords=stopwords,
+        user_dict=config.get('KEYWORD_USER_DICT') or DEFAULT_USER_DICT,
+        hmm=config.get('KEYWORD_HMM', False)
+    )
+
+
+def get_keyword_extractor():
+    """获取进程内共享的关键词提取器，首次使用时按应用配置创建"""
+    global _keyword_extractor
+    if _keyword_extractor is None:
+        with _keyword_extractor_lock:
+            if _keyword_extractor is None:
+                _keyword_extractor = create_keyword_extractor(current_app.config)
+    return _keyword_extractor
@@ -0,0 +1,207 @@
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from flask import current_app
+from app.utils.database import get_db
+
+# 搜索模式
+MODE_AND = 'and'
+MODE_OR = 'or'
+
+
+def _load_postings(db):
+    """按(keyword, song_id)顺序扫描idx_keyword_song索引，返回({关键词: (歌曲ID数组, 权重数组)}, 最大关键词ID)"""
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM keywords")
+        max_id = cursor.fetchone()[0]
+
+        cursor.execute("SELECT keyword, song_id, weight FROM keywords WHERE id <= %s ORDER BY keyword, song_id",
+                       (max_id,))
+        postings = {}
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            for keyword, song_id, weight in rows:
+                entry = postings.get(keyword)
+                if entry is None:
+                    entry = postings[keyword] = (array('i'), array('f'))
+                entry[0].append(song_id)
+                entry[1].append(weight)
+        return postings, max_id
+    finally:
+        cursor.close()
+        db.commit()
+
+
+class KeywordIndex:
+    """
+    关键词倒排索引：关键词 -> 按歌曲ID升序排列的歌曲ID数组和对应的权重数组
+    第一次搜索时从数据库全量构建，之后按关键词ID增量读取新写入的关键词，并定期在后台全量重建以反映删除和重新选取
+    """
+
+    def __init__(self, refresh_interval=1.0, rebuild_interval=600, lookback=1000):
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        # 自增ID不保证按提交顺序可见，增量读取时回看最近lookback个ID，重复读到的记录只更新权重
+        self.lookback = lookback
+
+        self._postings = {}
+        self._last_id = 0
+        self._built_at = None
+        self._refreshed_at = 0.0
+        self._rebuilding = False
+        self._lock = threading.RLock()
+
+    def _add(self, keyword, song_id, weight):
+        """把一条关键词记录加入倒排表，调用方持有锁"""
+        entry = self._postings.get(keyword)
+        if entry is None:
+            entry = self._postings[keyword] = (array('i'), array('f'))
+        song_ids, weights = entry
+
+        # 新歌曲的ID最大，通常直接追加
+        if not song_ids or song_ids[-1] < song_id:
+            song_ids.append(song_id)
+            weights.append(weight)
+            return
+
+        i = bisect_left(song_ids, song_id)
+        if i < len(song_ids) and song_ids[i] == song_id:
+            weights[i] = weight
+        else:
+            song_ids.insert(i, song_id)
+            weights.insert(i, weight)
+
+    def build(self, db):
+        """从数据库全量构建并替换当前索引"""
+        postings, max_id = _load_postings(db)
+        with self._lock:
+            self._postings = postings
+            self._last_id = max_id
+            self._built_at = time.monotonic()
+            self._refreshed_at = self._built_at
+
+    def refresh(self, db):
+        """搜索前调用：尚未构建时全量构建，否则按间隔增量读取新关键词，到期时在后台全量重建"""
+        if self._built_at is None:
+            with self._lock:
+                if self._built_at is None:
+                    self.build(db)
+            return
+
+        now = time.monotonic()
+        if now - self._refreshed_at >= self.refresh_interval:
+            self._refresh_incremental(db, now)
+
+        if now - self._built_at >= self.rebuild_interval and not self._rebuilding:
+            self._start_rebuild(current_app._get_current_object())
+
+    def _refresh_incremental(self, db, now):
+        cursor = db.cursor()
+        try:
+            cursor.execute("SELECT id, keyword, song_id, weight FROM keywords WHERE id > %s ORDER BY id",
+                           (max(0, self._last_id - self.lookback),))
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+            db.commit()
+
+        with self._lock:
+            for keyword_id, keyword, song_id, weight in rows:
+                self._add(keyword, song_id, weight)
+                self._last_id = max(self._last_id, keyword_id)
+            self._refreshed_at = now
+
+    def _start_rebuild(self, app):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+
+        def target():
+            try:
+                with app.app_context():
+                    self.build(get_db())
+            except Exception as e:
+                app.logger.error(f"Keyword index rebuild failed: {e}")
+                # 失败后等到下一个周期再重试
+                with self._lock:
+                    self._built_at = time.monotonic()
+            finally:
+                self._rebuilding = False
+
+        threading.Thread(target=target, name='keyword-index-rebuild', daemon=True).start()
+
+    def search(self, keywords, mode=MODE_AND):
+        """
+        查找包含关键词的歌曲，返回[(得分, 歌曲ID, 命中的关键词)]，得分为命中关键词的权重之和
+        AND模式从最短的倒排表出发，在其余倒排表中二分查找求交集
+        """
+        with self._lock:
+            entries = [(keyword, self._postings.get(keyword)) for keyword in keywords]
+
+            if mode == MODE_AND:
+                if any(entry is None for _, entry in entries):
+                    return []
+                entries.sort(key=lambda item: len(item[1][0]))
+                (_, (base_ids, base_weights)), others = entries[0], entries[1:]
+                matched = [keyword for keyword, _ in entries]
+
+                results = []
+                for song_id, score in zip(base_ids, base_weights):
+                    for _, (song_ids, weights) in others:
+                        i = bisect_left(song_ids, song_id)
+                        if i == len(song_ids) or song_ids[i] != song_id:
+                            break
+                        score += weights[i]
+                    else:
+                        results.append((score, song_id, matched))
+                return results
+
+            scores = {}
+            hits = {}
+            for keyword, entry in entries:
+                if entry is None:
+                    continue
+                for song_id, weight in zip(*entry):
+                    scores[song_id] = scores.get(song_id, 0.0) + weight
+                    hits.setdefault(song_id, []).append(keyword)
+            return [(score, song_id, hits[song_id]) for song_id, score in scores.items()]
+
+    def top(self, keywords, mode=MODE_AND, limit=20, offset=0):
+        """按得分从高到低返回(命中总数, 当前页结果)，得分相同时新歌曲在前"""
+        results = self.search(keywords, mode)
+        page = heapq.nlargest(offset + limit, results, key=lambda item: (item[0], item[1]))[offset:]
+        return len(results), page
+
+    def stats(self):
+        with self._lock:
+            return {
+                'built': self._built_at is not None,
+                'keywords': len(self._postings),
+                'postings': sum(len(song_ids) for song_ids, _ in self._postings.values()),
+                'last_keyword_id': self._last_id,
+                'rebuilding': self._rebuilding
+            }
+
+
+_keyword_index = None
+_keyword_index_lock = threading.Lock()
+
+
+def get_keyword_index():
+    """获取进程内共享的关键词倒排索引，首次使用时按应用配置创建(尚未从数据库加载)"""
+    global _keyword_index
+    if _keyword_index is None:
+        with _keyword_index_lock:
+            if _keyword_index is None:
+                config = current_app.config
+                _keyword_index = KeywordIndex(
+                    refresh_interval=config.get('KEYWORD_INDEX_REFRESH_INTERVAL', 1.0),
+                    rebuild_interval=config.get('KEYWORD_INDEX_REBUILD_INTERVAL', 600)
+                )
+    return _keyword_index
@@ -0,0 +1,156 @@
+import html
+import json
+import re
+from array import array
+
+# 时间标签：[mm:ss]、[mm:ss.x]、[mm:ss.xx]、[mm:ss.xxx]，部分平台用冒号分隔毫秒
+_TIME_TAG = re.compile(r'\[(\d{1,3}):(\d{1,2})(?:[.:](\d{1,3}))?\]')
+# 元信息标签：[ti:歌名]、[ar:歌手]、[al:专辑]、[by:制作]、[offset:+500] 等
+_META_TAG = re.compile(r'^\[([A-Za-z#]+):([^\]]*)\]$')
+# 逐字歌词里的时间标签 <mm:ss.xx>
+_WORD_TAG = re.compile(r'<\d{1,3}:\d{1,2}(?:[.:]\d{1,3})?>')
+
+# 紧凑格式版本号
+COMPACT_VERSION = 1
+
+
+class TimedLyrics:
+    """解析后的歌词：毫秒时间和歌词文本两个平行数组，外加元信息标签"""
+
+    __slots__ = ('times', 'lines', 'tags')
+
+    def __init__(self, times=None, lines=None, tags=None):
+        self.times = times if times is not None else array('i')
+        self.lines = lines if lines is not None else []
+        self.tags = tags if tags is not None else {}
+
+    @property
+    def timed(self):
+        """是否带有时间信息"""
+        return len(self.times) > 0
+
+    def plain_text(self):
+        """按时间顺序输出去掉标签后的歌词文本，空行(间奏)不输出"""
+        return '\n'.join(line for line in self.lines if line)
+
+    def to_compact(self):
+        """
+        序列化为紧凑JSON：{"v": 版本, "t": [时间差分(毫秒)], "l": "按换行拼接的歌词"}
+        t[0]是第一行的绝对时间，之后每项是与上一行的差值
+        """
+        deltas = []
+        previous = 0
+        for ms in self.times:
+            deltas.append(ms - previous)
+            previous = ms
+        return json.dumps({'v': COMPACT_VERSION, 't': deltas, 'l': '\n'.join(self.lines)},
+                          ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def from_compact(cls, data):
+        """从紧凑JSON还原"""
+        payload = json.loads(data)
+        times = array('i')
+        current = 0
+        for delta in payload['t']:
+            current += delta
+            times.append(current)
+        # 歌词行数和时间数一一对应，只有一行空歌词(间奏)时'l'也是空字符串，不能据此判断
+        lines = payload['l'].split('\n') if payload['t'] else []
+        return cls(times, lines)
+
+
+def _parse_time(minutes, seconds, fraction):
+    """把时间标签转换为毫秒，小数部分按位数区分十分之一秒、百分之一秒和毫秒"""
+    ms = (int(minutes) * 60 + int(seconds)) * 1000
+    if fraction:
+        ms += int(fraction) * 10 ** (3 - len(fraction))
+    return ms
+
+
+def _parse_json_line(line):
+    """网易云在歌词开头用JSON行表示作词作曲信息，如 {"t":0,"c":[{"tx":"作词: "},{"tx":"某人"}]}"""
+    try:
+        data = json.loads(line)
+        return int(data.get('t', 0)), ''.join(part.get('tx', '') for part in data.get('c', []))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def parse_lrc(source):
+    """
+    逐行解析LRC歌词，source可以是字符串或按行迭代的对象
+    支持一行多个时间标签、元信息标签、offset偏移、HTML实体、逐字时间标签和无时间标签的纯文本歌词
+    """
+    if isinstance(source, str):
+        source = source.splitlines()
+
+    times = array('i')
+    lines = []
+    tags = {}
+    untimed = []
+    in_order = True
+    last_ms = 0
+
+    for raw_line in source:
+        # QQ音乐返回的歌词中冒号、句点等以HTML实体形式出现
+        line = html.unescape(raw_line).strip()
+        if not line:
+            continue
+
+        if line.startswith('{'):
+            parsed = _parse_json_line(line)
+            if parsed is not None:
+                ms, text = parsed
+                if ms < last_ms:
+                    in_order = False
+                times.append(ms)
+                lines.append(text.strip())
+                last_ms = ms
+                continue
+
+        # 读取行首的所有时间标签
+        stamps = []
+        pos = 0
+        while True:
+            match = _TIME_TAG.match(line, pos)
+            if not match:
+                break
+            stamps.append(_parse_time(*match.groups()))
+            pos = match.end()
+
+        if not stamps:
+            meta = _META_TAG.match(line)
+            if meta:
+                tags[meta.group(1).lower()] = meta.group(2).strip()
+            else:
+                untimed.append(_WORD_TAG.sub('', line).strip())
+            continue
+
+        text = _WORD_TAG.sub('', _TIME_TAG.sub('', line[pos:])).strip()
+        for ms in stamps:
+            if ms < last_ms:
+                in_order = False
+            times.append(ms)
+            lines.append(text)
+            last_ms = ms
+
+    # 完全没有时间标签的歌词按纯文本保存
+    if not times:
+        return TimedLyrics(array('i'), untimed, tags)
+
+    # 多时间标签的行(如副歌)会打乱顺序，需要按时间稳定排序
+    if not in_order:
+        order = sorted(range(len(times)), key=times.__getitem__)
+        times = array('i', (times[i] for i in order))
+        lines = [lines[i] for i in order]
+
+    # offset为正表示歌词整体提前显示
+    try:
+        offset = int(tags.get('offset', 0))
+    except ValueError:
+        offset = 0
+    if offset:
+        times = array('i', (max(0, ms - offset) for ms in times))
+
+    return TimedLyrics(times, lines, tags)
@@ -0,0 +1,182 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from flask import current_app
+
+# 所有平台都查不到歌词时返回的占位文本
+LYRICS_NOT_FOUND = "未找到歌词"
+
+# 归一化时去掉括号里的版本信息，如 "(Live)"、"（伴奏版）"、"[Remix]"
+_BRACKET_PATTERN = re.compile(r'[(\[（【][^)\]）】]*[)\]）】]')
+# 去掉空白、标点和下划线，只保留文字和数字
+_SEPARATOR_PATTERN = re.compile(r'[\W_]+')
+
+
+def _normalize_text(text):
+    """归一化单个字段：全半角统一、大小写折叠、去掉版本括号和标点"""
+    text = unicodedata.normalize('NFKC', text or '').casefold()
+    stripped = _BRACKET_PATTERN.sub('', text)
+    # 整个名字都在括号里时保留括号内容
+    if _SEPARATOR_PATTERN.sub('', stripped):
+        text = stripped
+    return _SEPARATOR_PATTERN.sub('', text)
+
+
+def normalize_song_identity(artist_name, song_name):
+    """归一化(歌手, 歌名)，让不同写法、大小写的同一首歌得到相同结果"""
+    return _normalize_text(artist_name), _normalize_text(song_name)
+
+
+def lyrics_cache_key(song_name, artist_name=None):
+    """生成歌词缓存键"""
+    artist, title = normalize_song_identity(artist_name, song_name)
+    return f"{artist}\x1f{title}"
+
+
+class LyricsCache:
+    """歌词查询缓存：内存LRU + 可选的SQLite磁盘层，未找到歌词的结果使用更短的TTL"""
+
+    # 每写入多少次清理一次磁盘上的过期记录
+    PURGE_INTERVAL = 1000
+
+    def __init__(self, max_entries=2048, ttl=7 * 24 * 3600, negative_ttl=3600, disk_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.disk_path = disk_path
+
+        self._entries = OrderedDict()  # key -> (过期时间, 歌词数据)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        self._counters = {
+            'hits': 0,
+            'disk_hits': 0,
+            'negative_hits': 0,
+            'misses': 0,
+            'sets': 0,
+            'evictions': 0,
+            'disk_errors': 0
+        }
+
+        if self.disk_path:
+            self._disk_execute(
+                "CREATE TABLE IF NOT EXISTS lyrics_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _disk_connection(self):
+        """每个线程使用独立的SQLite连接，WAL模式允许多个worker进程同时读写"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.disk_path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _disk_execute(self, sql, params=()):
+        """执行磁盘层SQL，出错时只记录日志，不影响歌词查询"""
+        try:
+            conn = self._disk_connection()
+            with conn:
+                return conn.execute(sql, params).fetchone()
+        except sqlite3.Error as e:
+            self._count('disk_errors')
+            current_app.logger.error(f"Lyrics cache disk error: {e}")
+            return None
+
+    def _put_memory(self, key, expires_at, value):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def get(self, key):
+        """查询缓存，未命中或已过期时返回None"""
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._counters['hits'] += 1
+                    if entry[1]['lyrics'] == LYRICS_NOT_FOUND:
+                        self._counters['negative_hits'] += 1
+                    return dict(entry[1])
+                del self._entries[key]
+
+        if self.disk_path:
+            row = self._disk_execute("SELECT value, expires_at FROM lyrics_cache WHERE key = ?", (key,))
+            if row is not None and row[1] > now:
+                value = json.loads(row[0])
+                self._put_memory(key, row[1], value)
+                with self._lock:
+                    self._counters['disk_hits'] += 1
+                    if value['lyrics'] == LYRICS_NOT_FOUND:
+                        self._counters['negative_hits'] += 1
+                return dict(value)
+
+        self._count('misses')
+        return None
+
+    def set(self, key, value):
+        """写入缓存，未找到歌词的结果按negative_ttl过期"""
+        ttl = self.negative_ttl if value['lyrics'] == LYRICS_NOT_FOUND else self.ttl
+        expires_at = time.time() + ttl
+        value = dict(value)
+
+        self._put_memory(key, expires_at, value)
+        with self._lock:
+            self._counters['sets'] += 1
+            self._writes += 1
+            purge = self._writes % self.PURGE_INTERVAL == 0
+
+        if self.disk_path:
+            self._disk_execute(
+                "INSERT OR REPLACE INTO lyrics_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires_at)
+            )
+            if purge:
+                self._disk_execute("DELETE FROM lyrics_cache WHERE expires_at <= ?", (time.time(),))
+
+    def stats(self):
+        """返回命中/未命中计数"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        stats['disk_enabled'] = bool(self.disk_path)
+        return stats
+
+
+_lyrics_cache = None
+_lyrics_cache_lock = threading.Lock()
+
+
+def get_lyrics_cache():
+    """获取进程内共享的歌词缓存，首次使用时按应用配置创建"""
+    global _lyrics_cache
+    if _lyrics_cache is None:
+        with _lyrics_cache_lock:
+            if _lyrics_cache is None:
+                config = current_app.config
+                _lyrics_cache = LyricsCache(
+                    max_entries=config.get('LYRICS_CACHE_SIZE', 2048),
+                    ttl=config.get('LYRICS_CACHE_TTL', 7 * 24 * 3600),
+                    negative_ttl=config.get('LYRICS_CACHE_NEGATIVE_TTL', 3600),
+                    disk_path=config.get('LYRICS_CACHE_PATH') or None
+                )
+    return _lyrics_cache
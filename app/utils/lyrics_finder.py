@@ -1,9 +1,81 @@
 import requests
 import json
-import re
-import random
-from urllib.parse import quote
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import quote, urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from flask import current_app
+from app.utils.lyrics_cache import LYRICS_NOT_FOUND, get_lyrics_cache, lyrics_cache_key
+from app.utils.provider_router import get_provider_router
+from app.utils.lrc_parser import parse_lrc
+
+class LyricsSearchTimeout(Exception):
+    """整体时限内没有等到所有平台的结果；不同于未找到歌词，不写入缓存也不入库，调用方可以跳过或重试"""
+
+
+# 进程内共享的并发搜索线程池和同时进行的搜索数上限，首次使用时创建
+_search_executor = None
+_search_slots = None
+_search_executor_lock = threading.Lock()
+
+
+def _get_search_executor(max_workers, fan_out):
+    """
+    获取并发搜索使用的线程池和搜索名额
+    每次搜索同时占用fan_out个线程，名额数为max_workers // fan_out，保证拿到名额的搜索不会在线程池里排队
+    """
+    global _search_executor, _search_slots
+    if _search_executor is None:
+        with _search_executor_lock:
+            if _search_executor is None:
+                _search_slots = threading.BoundedSemaphore(max(1, max_workers // max(1, fan_out)))
+                _search_executor = ThreadPoolExecutor(max_workers=max_workers,
+                                                      thread_name_prefix='lyrics-search')
+    return _search_executor, _search_slots
+
+
+# 进程内共享的HTTP会话，每个平台主机一个，复用TCP/TLS长连接
+_provider_sessions = {}
+_provider_sessions_lock = threading.Lock()
+
+
+def _create_provider_session():
+    """创建带连接池和重试策略的HTTP会话"""
+    config = current_app.config
+    retry = Retry(
+        total=config.get('LYRICS_HTTP_RETRIES', 2),
+        connect=config.get('LYRICS_HTTP_RETRIES', 2),
+        read=1,
+        backoff_factor=config.get('LYRICS_HTTP_BACKOFF', 0.3),
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=config.get('LYRICS_HTTP_POOL_SIZE', 10),
+        max_retries=retry
+    )
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_provider_session(host):
+    """获取指定主机的共享HTTP会话，首次使用时创建"""
+    session = _provider_sessions.get(host)
+    if session is None:
+        with _provider_sessions_lock:
+            session = _provider_sessions.get(host)
+            if session is None:
+                session = _create_provider_session()
+                _provider_sessions[host] = session
+    return session
+
 
 class LyricsFinder:
     def __init__(self):
@@ -13,250 +85,392 @@ class LyricsFinder:
             'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
             'Connection': 'keep-alive'
         }
+        # 平台名称到搜索方法的映射，名称用于路由统计
+        self.providers = {
+            'netease': self.search_netease,
+            'qq_music': self.search_qq_music,
+            'kugou': self.search_kugou,
+            'migu': self.search_migu
+        }
+
+    def _get(self, url, headers=None):
+        """通过目标主机的共享会话发送GET请求，连接和读取分别超时"""
+        session = get_provider_session(urlparse(url).netloc)
+        timeout = (current_app.config.get('LYRICS_CONNECT_TIMEOUT', 3.05),
+                   current_app.config.get('LYRICS_READ_TIMEOUT', 10.0))
+        return session.get(url, headers=headers or self.headers, timeout=timeout)
+
+    def _call_provider(self, name, label, fetch, song_name, artist_name=None):
+        """调用单个平台并把耗时和成败记录到路由器，熔断中的平台直接跳过"""
+        router = get_provider_router()
+        if not router.allow(name):
+            current_app.logger.info(f"{label} skipped: circuit open")
+            return None
+
+        start = time.monotonic()
+        try:
+            result = fetch(song_name, artist_name)
+        except Exception as e:
+            router.record(name, False, time.monotonic() - start)
+            current_app.logger.error(f"{label} error: {e}")
+            return None
+
+        router.record(name, True, time.monotonic() - start, found=result is not None)
+        return result
 
     def search_netease(self, song_name, artist_name=None):
         """从网易云音乐搜索歌词"""
-        try:
-            current_app.logger.info("Searching Netease Music...")
-            query = song_name
-            if artist_name:
-                query = f"{song_name} {artist_name}"
+        return self._call_provider('netease', 'Netease Music', self._fetch_netease, song_name, artist_name)
 
-            # 先搜索歌曲ID
-            search_url = f"https://music.163.com/api/search/get?s={quote(query)}&type=1&limit=10"
-            response = requests.get(search_url, headers=self.headers, timeout=10)
-            search_data = response.json()
+    def _fetch_netease(self, song_name, artist_name=None):
+        current_app.logger.info("Searching Netease Music...")
+        query = song_name
+        if artist_name:
+            query = f"{song_name} {artist_name}"
 
-            if 'result' not in search_data or 'songs' not in search_data['result'] or not search_data['result']['songs']:
-                return None
+        # 先搜索歌曲ID
+        search_url = f"https://music.163.com/api/search/get?s={quote(query)}&type=1&limit=10"
+        response = self._get(search_url)
+        search_data = response.json()
 
-            songs = search_data['result']['songs']
-            song_id = songs[0]['id']  # 获取第一首歌的ID
+        if 'result' not in search_data or 'songs' not in search_data['result'] or not search_data['result']['songs']:
+            return None
 
-            # 获取歌词
-            lyric_url = f"https://music.163.com/api/song/lyric?id={song_id}&lv=1&kv=1&tv=-1"
-            response = requests.get(lyric_url, headers=self.headers, timeout=10)
-            lyric_data = response.json()
+        songs = search_data['result']['songs']
+        song_id = songs[0]['id']  # 获取第一首歌的ID
 
-            if 'lrc' not in lyric_data or 'lyric' not in lyric_data['lrc']:
-                return None
+        # 获取歌词
+        lyric_url = f"https://music.163.com/api/song/lyric?id={song_id}&lv=1&kv=1&tv=-1"
+        response = self._get(lyric_url)
+        lyric_data = response.json()
 
-            lyrics = lyric_data['lrc']['lyric']
+        if 'lrc' not in lyric_data or 'lyric' not in lyric_data['lrc']:
+            return None
 
-            # 处理歌词格式 - 移除时间标签 [00:00.000]
-            cleaned_lyrics = re.sub(r'\[\d{2}:\d{2}.\d{2,3}\]', '', lyrics)
+        lyrics = lyric_data['lrc']['lyric']
 
-            # 添加标题和来源信息
-            song_title = songs[0]['name']
-            artist = songs[0]['artists'][0]['name']
+        # 处理歌词格式 - 解析时间标签 [00:00.000]，保留时间信息
+        timed = parse_lrc(lyrics)
+        cleaned_lyrics = timed.plain_text()
 
-            result = f"《{song_title}》 - {artist}\n"
-            result += f"来源: 网易云音乐\n\n"
-            result += cleaned_lyrics.strip()
+        # 添加标题和来源信息
+        song_title = songs[0]['name']
+        artist = songs[0]['artists'][0]['name']
 
-            return {
-                'title': song_title,
-                'artist': artist,
-                'source': '网易云音乐',
-                'lyrics': cleaned_lyrics.strip(),
-                'formatted': result
-            }
+        result = f"《{song_title}》 - {artist}\n"
+        result += f"来源: 网易云音乐\n\n"
+        result += cleaned_lyrics.strip()
 
-        except Exception as e:
-            current_app.logger.error(f"Netease Music error: {e}")
-            return None
+        return {
+            'title': song_title,
+            'artist': artist,
+            'source': '网易云音乐',
+            'lyrics': cleaned_lyrics.strip(),
+            'timed_lyrics': timed.to_compact() if timed.timed else None,
+            'formatted': result
+        }
 
     def search_qq_music(self, song_name, artist_name=None):
         """从QQ音乐搜索歌词"""
-        try:
-            current_app.logger.info("Searching QQ Music...")
-            query = song_name
-            if artist_name:
-                query = f"{song_name} {artist_name}"
+        return self._call_provider('qq_music', 'QQ Music', self._fetch_qq_music, song_name, artist_name)
 
-            # 搜索歌曲
-            search_url = f"https://c.y.qq.com/soso/fcgi-bin/client_search_cp?w={quote(query)}&format=json&p=1&n=10"
-            response = requests.get(search_url, headers=self.headers, timeout=10)
-            search_data = response.json()
+    def _fetch_qq_music(self, song_name, artist_name=None):
+        current_app.logger.info("Searching QQ Music...")
+        query = song_name
+        if artist_name:
+            query = f"{song_name} {artist_name}"
 
-            if 'data' not in search_data or 'song' not in search_data['data'] or 'list' not in search_data['data']['song'] or not search_data['data']['song']['list']:
-                return None
+        # 搜索歌曲
+        search_url = f"https://c.y.qq.com/soso/fcgi-bin/client_search_cp?w={quote(query)}&format=json&p=1&n=10"
+        response = self._get(search_url)
+        search_data = response.json()
 
-            song_list = search_data['data']['song']['list']
-            song = song_list[0]  # 获取第一首歌
+        if 'data' not in search_data or 'song' not in search_data['data'] or 'list' not in search_data['data']['song'] or not search_data['data']['song']['list']:
+            return None
 
-            song_mid = song['songmid']
+        song_list = search_data['data']['song']['list']
+        song = song_list[0]  # 获取第一首歌
 
-            # 获取歌词
-            lyric_url = f"https://c.y.qq.com/lyric/fcgi-bin/fcg_query_lyric_new.fcg?songmid={song_mid}&format=json&nobase64=1"
-            headers = self.headers.copy()
-            headers['Referer'] = 'https://y.qq.com/'  # QQ音乐需要Referer
+        song_mid = song['songmid']
 
-            response = requests.get(lyric_url, headers=headers, timeout=10)
-            lyric_data = response.json()
+        # 获取歌词
+        lyric_url = f"https://c.y.qq.com/lyric/fcgi-bin/fcg_query_lyric_new.fcg?songmid={song_mid}&format=json&nobase64=1"
+        headers = self.headers.copy()
+        headers['Referer'] = 'https://y.qq.com/'  # QQ音乐需要Referer
 
-            if 'lyric' not in lyric_data:
-                return None
+        response = self._get(lyric_url, headers=headers)
+        lyric_data = response.json()
 
-            lyrics = lyric_data['lyric']
+        if 'lyric' not in lyric_data:
+            return None
 
-            # 处理歌词格式 - 移除HTML实体和时间标签
-            lyrics = lyrics.replace('&#58;', ':').replace('&#46;', '.')
-            cleaned_lyrics = re.sub(r'\[\d{2}:\d{2}.\d{2,3}\]', '', lyrics)
-            cleaned_lyrics = re.sub(r'&#\d+;', '', cleaned_lyrics)
+        lyrics = lyric_data['lyric']
 
-            # 添加标题和来源信息
-            song_title = song['songname']
-            artist = song['singer'][0]['name']
+        # 处理歌词格式 - 解码HTML实体并解析时间标签
+        timed = parse_lrc(lyrics)
+        cleaned_lyrics = timed.plain_text()
 
-            result = f"《{song_title}》 - {artist}\n"
-            result += f"来源: QQ音乐\n\n"
-            result += cleaned_lyrics.strip()
+        # 添加标题和来源信息
+        song_title = song['songname']
+        artist = song['singer'][0]['name']
 
-            return {
-                'title': song_title,
-                'artist': artist,
-                'source': 'QQ音乐',
-                'lyrics': cleaned_lyrics.strip(),
-                'formatted': result
-            }
+        result = f"《{song_title}》 - {artist}\n"
+        result += f"来源: QQ音乐\n\n"
+        result += cleaned_lyrics.strip()
 
-        except Exception as e:
-            current_app.logger.error(f"QQ Music error: {e}")
-            return None
+        return {
+            'title': song_title,
+            'artist': artist,
+            'source': 'QQ音乐',
+            'lyrics': cleaned_lyrics.strip(),
+            'timed_lyrics': timed.to_compact() if timed.timed else None,
+            'formatted': result
+        }
 
     def search_kugou(self, song_name, artist_name=None):
         """从酷狗音乐搜索歌词"""
-        try:
-            current_app.logger.info("Searching Kugou Music...")
-            query = song_name
-            if artist_name:
-                query = f"{song_name} {artist_name}"
+        return self._call_provider('kugou', 'Kugou Music', self._fetch_kugou, song_name, artist_name)
 
-            # 搜索歌曲
-            search_url = f"https://songsearch.kugou.com/song_search_v2?keyword={quote(query)}&page=1&pagesize=10"
-            response = requests.get(search_url, headers=self.headers, timeout=10)
-            search_data = response.json()
+    def _fetch_kugou(self, song_name, artist_name=None):
+        current_app.logger.info("Searching Kugou Music...")
+        query = song_name
+        if artist_name:
+            query = f"{song_name} {artist_name}"
 
-            if ('data' not in search_data or 'lists' not in search_data['data'] or
-                    not search_data['data']['lists']):
-                return None
+        # 搜索歌曲
+        search_url = f"https://songsearch.kugou.com/song_search_v2?keyword={quote(query)}&page=1&pagesize=10"
+        response = self._get(search_url)
+        search_data = response.json()
 
-            song_list = search_data['data']['lists']
-            song = song_list[0]  # 获取第一首歌
+        if ('data' not in search_data or 'lists' not in search_data['data'] or
+                not search_data['data']['lists']):
+            return None
 
-            # 酷狗的API需要几个参数
-            hash_value = song['FileHash']
-            album_id = song.get('AlbumID', '')
+        song_list = search_data['data']['lists']
+        song = song_list[0]  # 获取第一首歌
 
-            # 获取歌曲信息和歌词
-            song_info_url = f"https://wwwapi.kugou.com/yy/index.php?r=play/getdata&hash={hash_value}&album_id={album_id}"
-            response = requests.get(song_info_url, headers=self.headers, timeout=10)
-            song_data = response.json()
+        # 酷狗的API需要几个参数
+        hash_value = song['FileHash']
+        album_id = song.get('AlbumID', '')
 
-            if ('data' not in song_data or 'lyrics' not in song_data['data'] or
-                    not song_data['data']['lyrics']):
-                return None
+        # 获取歌曲信息和歌词
+        song_info_url = f"https://wwwapi.kugou.com/yy/index.php?r=play/getdata&hash={hash_value}&album_id={album_id}"
+        response = self._get(song_info_url)
+        song_data = response.json()
 
-            lyrics = song_data['data']['lyrics']
+        if ('data' not in song_data or 'lyrics' not in song_data['data'] or
+                not song_data['data']['lyrics']):
+            return None
 
-            # 处理歌词格式 - 移除时间标签
-            cleaned_lyrics = re.sub(r'\[\d{2}:\d{2}.\d{2,3}\]', '', lyrics)
+        lyrics = song_data['data']['lyrics']
 
-            # 添加标题和来源信息
-            song_title = song_data['data']['song_name']
-            artist = song_data['data']['author_name']
+        # 处理歌词格式 - 解析时间标签
+        timed = parse_lrc(lyrics)
+        cleaned_lyrics = timed.plain_text()
 
-            result = f"《{song_title}》 - {artist}\n"
-            result += f"来源: 酷狗音乐\n\n"
-            result += cleaned_lyrics.strip()
+        # 添加标题和来源信息
+        song_title = song_data['data']['song_name']
+        artist = song_data['data']['author_name']
 
-            return {
-                'title': song_title,
-                'artist': artist,
-                'source': '酷狗音乐',
-                'lyrics': cleaned_lyrics.strip(),
-                'formatted': result
-            }
+        result = f"《{song_title}》 - {artist}\n"
+        result += f"来源: 酷狗音乐\n\n"
+        result += cleaned_lyrics.strip()
 
-        except Exception as e:
-            current_app.logger.error(f"Kugou Music error: {e}")
-            return None
+        return {
+            'title': song_title,
+            'artist': artist,
+            'source': '酷狗音乐',
+            'lyrics': cleaned_lyrics.strip(),
+            'timed_lyrics': timed.to_compact() if timed.timed else None,
+            'formatted': result
+        }
 
     def search_migu(self, song_name, artist_name=None):
         """从咪咕音乐搜索歌词"""
-        try:
-            current_app.logger.info("Searching Migu Music...")
-            query = song_name
-            if artist_name:
-                query = f"{song_name} {artist_name}"
+        return self._call_provider('migu', 'Migu Music', self._fetch_migu, song_name, artist_name)
 
-            # 搜索歌曲
-            search_url = f"https://m.music.migu.cn/migu/remoting/scr_search_tag?keyword={quote(query)}&type=2&rows=20&pgc=1"
-            response = requests.get(search_url, headers=self.headers, timeout=10)
-            search_data = response.json()
+    def _fetch_migu(self, song_name, artist_name=None):
+        current_app.logger.info("Searching Migu Music...")
+        query = song_name
+        if artist_name:
+            query = f"{song_name} {artist_name}"
 
-            if 'musics' not in search_data or not search_data['musics']:
-                return None
+        # 搜索歌曲
+        search_url = f"https://m.music.migu.cn/migu/remoting/scr_search_tag?keyword={quote(query)}&type=2&rows=20&pgc=1"
+        response = self._get(search_url)
+        search_data = response.json()
 
-            song = search_data['musics'][0]  # 获取第一首歌
-            song_id = song['copyrightId']
+        if 'musics' not in search_data or not search_data['musics']:
+            return None
 
-            # 获取歌词
-            lyric_url = f"https://music.migu.cn/v3/api/music/audioPlayer/getLyric?copyrightId={song_id}"
-            response = requests.get(lyric_url, headers=self.headers, timeout=10)
-            lyric_data = response.json()
+        song = search_data['musics'][0]  # 获取第一首歌
+        song_id = song['copyrightId']
 
-            if 'lyric' not in lyric_data or not lyric_data['lyric']:
-                return None
+        # 获取歌词
+        lyric_url = f"https://music.migu.cn/v3/api/music/audioPlayer/getLyric?copyrightId={song_id}"
+        response = self._get(lyric_url)
+        lyric_data = response.json()
 
-            lyrics = lyric_data['lyric']
+        if 'lyric' not in lyric_data or not lyric_data['lyric']:
+            return None
 
-            # 处理歌词格式 - 移除时间标签
-            cleaned_lyrics = re.sub(r'\[\d{2}:\d{2}.\d{2,3}\]', '', lyrics)
+        lyrics = lyric_data['lyric']
 
-            # 添加标题和来源信息
-            song_title = song['title']
-            artist = song['singer']
+        # 处理歌词格式 - 解析时间标签
+        timed = parse_lrc(lyrics)
+        cleaned_lyrics = timed.plain_text()
 
-            result = f"《{song_title}》 - {artist}\n"
-            result += f"来源: 咪咕音乐\n\n"
-            result += cleaned_lyrics.strip()
+        # 添加标题和来源信息
+        song_title = song['title']
+        artist = song['singer']
 
-            return {
-                'title': song_title,
-                'artist': artist,
-                'source': '咪咕音乐',
-                'lyrics': cleaned_lyrics.strip(),
-                'formatted': result
-            }
+        result = f"《{song_title}》 - {artist}\n"
+        result += f"来源: 咪咕音乐\n\n"
+        result += cleaned_lyrics.strip()
 
-        except Exception as e:
-            current_app.logger.error(f"Migu Music error: {e}")
-            return None
+        return {
+            'title': song_title,
+            'artist': artist,
+            'source': '咪咕音乐',
+            'lyrics': cleaned_lyrics.strip(),
+            'timed_lyrics': timed.to_compact() if timed.timed else None,
+            'formatted': result
+        }
 
     def search_lyrics(self, song_name, artist_name=None):
-        """搜索所有平台获取歌词"""
-        # 随机选择搜索顺序，避免总是请求同一个平台
-        platforms = [
-            self.search_netease,
-            self.search_qq_music,
-            self.search_kugou,
-            self.search_migu
-        ]
-        random.shuffle(platforms)
-
-        # 尝试每个平台
-        for platform in platforms:
-            lyrics_data = platform(song_name, artist_name)
-            if lyrics_data:
+        """
+        搜索所有平台获取歌词，结果按归一化的(歌手, 歌名)缓存
+        总时限内没有等到结果时抛出LyricsSearchTimeout，超时不当作未找到歌词缓存
+        """
+        cache = None
+        if current_app.config.get('LYRICS_CACHE_ENABLED', True):
+            cache = get_lyrics_cache()
+            key = lyrics_cache_key(song_name, artist_name)
+            lyrics_data = cache.get(key)
+            if lyrics_data is not None:
+                current_app.logger.info(f"Lyrics cache hit for: {song_name} by {artist_name}")
                 return lyrics_data
 
-        # 所有平台都失败了
+        # 按各平台的成功率和延迟排序，熔断中的平台会被跳过
+        names = get_provider_router().order(list(self.providers))
+        if not names:
+            # 没有真正请求任何平台，结果不写入缓存
+            current_app.logger.warning("All lyrics providers are unavailable")
+            return self._not_found(song_name, artist_name)
+
+        # 并发模式下按排名对冲请求各平台，顺序模式下逐个尝试
+        if current_app.config.get('LYRICS_SEARCH_MODE', 'parallel') == 'parallel':
+            lyrics_data = self._search_parallel(names, song_name, artist_name)
+        else:
+            lyrics_data = self._search_sequential([self.providers[name] for name in names], song_name, artist_name)
+
+        # 所有平台都给出了结果但都没有找到；超时的情况已经以LyricsSearchTimeout抛出，不会写入缓存
+        if not lyrics_data:
+            lyrics_data = self._not_found(song_name, artist_name)
+
+        if cache is not None:
+            cache.set(key, lyrics_data)
+        return lyrics_data
+
+    def _not_found(self, song_name, artist_name=None):
+        """所有平台都找不到歌词时的返回结果"""
         return {
             'title': song_name,
             'artist': artist_name if artist_name else "未知",
             'source': '未知',
-            'lyrics': "未找到歌词",
+            'lyrics': LYRICS_NOT_FOUND,
+            'timed_lyrics': None,
             'formatted': "未找到歌词。请尝试提供歌手名称以获得更准确的结果。"
-        }
\ No newline at end of file
+        }
+
+    def _search_sequential(self, platforms, song_name, artist_name=None):
+        """依次尝试每个平台，超过总时限时还有平台没有尝试则抛出LyricsSearchTimeout"""
+        deadline = time.monotonic() + current_app.config.get('LYRICS_SEARCH_DEADLINE', 8.0)
+
+        for platform in platforms:
+            if time.monotonic() >= deadline:
+                current_app.logger.warning(f"Lyrics search deadline exceeded for: {song_name}")
+                raise LyricsSearchTimeout(f"Lyrics search timed out for: {song_name}")
+            lyrics_data = platform(song_name, artist_name)
+            if lyrics_data:
+                return lyrics_data
+
+        return None
+
+    def _search_parallel(self, names, song_name, artist_name=None):
+        """
+        按路由器给出的顺序对冲请求各平台：先请求排名最高的平台，超过它的p95耗时仍没有结果
+        (或它已经返回但没有找到)时再启动下一个，返回最先得到的有效结果，忽略较慢的平台
+        总时限内(包括等待搜索名额的时间)还有平台没有返回时抛出LyricsSearchTimeout
+        """
+        app = current_app._get_current_object()
+        router = get_provider_router()
+        hedge_default = app.config.get('LYRICS_HEDGE_DELAY', 0.5)
+        executor, slots = _get_search_executor(app.config.get('LYRICS_SEARCH_WORKERS', 64), len(self.providers))
+        deadline = time.monotonic() + app.config.get('LYRICS_SEARCH_DEADLINE', 8.0)
+
+        if not slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            app.logger.warning(f"No lyrics search slot available before deadline for: {song_name}")
+            raise LyricsSearchTimeout(f"Lyrics search timed out for: {song_name}")
+
+        # 名额在本次搜索结束且已发出的请求都结束后才归还，落后平台的请求仍在占用线程
+        # 计数中的1代表搜索本身，在finally中减去
+        outstanding = [1]
+        outstanding_lock = threading.Lock()
+
+        def release(_):
+            with outstanding_lock:
+                outstanding[0] -= 1
+                finished = outstanding[0] == 0
+            if finished:
+                slots.release()
+
+        # 工作线程没有应用上下文，需要手动推入以便使用current_app
+        def run(platform):
+            with app.app_context():
+                return platform(song_name, artist_name)
+
+        waiting = list(names)
+        pending = set()
+        next_launch_at = 0.0
+
+        def launch():
+            name = waiting.pop(0)
+            with outstanding_lock:
+                outstanding[0] += 1
+            future = executor.submit(run, self.providers[name])
+            future.add_done_callback(release)
+            pending.add(future)
+            delay = router.hedge_delay(name, hedge_default) if hedge_default > 0 else 0.0
+            return time.monotonic() + delay
+
+        try:
+            while pending or waiting:
+                now = time.monotonic()
+                if now >= deadline:
+                    app.logger.warning(f"Lyrics search deadline exceeded for: {song_name}")
+                    raise LyricsSearchTimeout(f"Lyrics search timed out for: {song_name}")
+
+                # 没有进行中的请求，或排名更高的平台已超过对冲等待时间
+                if waiting and (not pending or now >= next_launch_at):
+                    next_launch_at = launch()
+                    continue
+
+                timeout = deadline - now
+                if waiting:
+                    timeout = min(timeout, next_launch_at - now)
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is not None:
+                        app.logger.error(f"Lyrics provider error: {future.exception()}")
+                        continue
+                    lyrics_data = future.result()
+                    if lyrics_data:
+                        return lyrics_data
+        finally:
+            # 尚未开始的请求直接取消，已在进行中的请求结果会被忽略
+            for future in pending:
+                future.cancel()
+            release(None)
+
+        return None
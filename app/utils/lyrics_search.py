@@ -0,0 +1,91 @@
+import re
+from app.utils.lyrics_cache import LYRICS_NOT_FOUND
+
+# 一次搜索最多使用的词数
+MAX_QUERY_TERMS = 5
+# 查询词的最短长度，与ngram全文解析器的ngram_token_size(默认2)一致，单个字符在索引中不存在，作为必须出现的词时什么也搜不到
+MIN_TERM_LENGTH = 2
+
+# 布尔模式中有特殊含义的字符，查询词里出现时当作分隔符
+_BOOLEAN_OPERATORS = re.compile(r'[+\-<>()~*"@]+')
+
+# 先在ft_lyrics全文索引上按相关度取出一页歌曲ID，再回表读取歌词生成片段
+# 没有找到歌词的歌曲保存的是占位文本，ngram会把它切成"未找""找到""歌词"等词，需要排除
+LYRICS_SEARCH_SQL = """
+SELECT s.id, s.song_name, s.artist_name, s.lyrics, hits.score
+FROM (
+    SELECT id, MATCH(lyrics) AGAINST (%s IN BOOLEAN MODE) AS score
+    FROM songs
+    WHERE MATCH(lyrics) AGAINST (%s IN BOOLEAN MODE) AND lyrics <> %s
+    ORDER BY score DESC, id DESC
+    LIMIT %s OFFSET %s
+) hits
+JOIN songs s ON s.id = hits.id
+ORDER BY hits.score DESC, s.id DESC
+"""
+
+
+def parse_lyrics_query(text):
+    """把用户输入拆成去重后的查询词，去掉布尔模式的操作符和过短的词"""
+    terms = [term for term in _BOOLEAN_OPERATORS.sub(' ', text or '').split() if len(term) >= MIN_TERM_LENGTH]
+    return list(dict.fromkeys(terms))[:MAX_QUERY_TERMS]
+
+
+def build_boolean_query(terms):
+    """
+    每个词都必须出现：+"词语"
+    ngram解析器会把引号中的词切成连续的n-gram按短语匹配，中文不需要事先分词
+    """
+    return ' '.join(f'+"{term}"' for term in terms)
+
+
+def highlight_snippets(lyrics, terms, max_snippets=3):
+    """
+    找出包含查询词的歌词行，返回[{'line': 行号, 'text': 行内容, 'highlights': [[开始, 结束]]}]
+    命中不同查询词越多的行越靠前，选中的行按在歌词中的顺序返回
+    """
+    if not lyrics or not terms:
+        return []
+
+    pattern = re.compile('|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    candidates = []
+    for number, line in enumerate(lyrics.splitlines(), 1):
+        matches = list(pattern.finditer(line))
+        if not matches:
+            continue
+        distinct = len({match.group().lower() for match in matches})
+        candidates.append((distinct, number, line, [[match.start(), match.end()] for match in matches]))
+
+    candidates.sort(key=lambda item: (-item[0], item[1]))
+    return [
+        {'line': number, 'text': line.strip('\r'), 'highlights': highlights}
+        for _, number, line, highlights in sorted(candidates[:max_snippets], key=lambda item: item[1])
+    ]
+
+
+def search_lyrics(db, terms, limit=20, offset=0, max_snippets=3):
+    """
+    在歌词全文索引中搜索同时包含所有查询词的歌曲，按相关度排序
+    返回[{'song_id', 'song_name', 'artist_name', 'score', 'snippets'}]
+    """
+    if not terms:
+        return []
+
+    query = build_boolean_query(terms)
+    cursor = db.cursor(dictionary=True)
+    try:
+        cursor.execute(LYRICS_SEARCH_SQL, (query, query, LYRICS_NOT_FOUND, limit, offset))
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    return [
+        {
+            'song_id': row['id'],
+            'song_name': row['song_name'],
+            'artist_name': row['artist_name'],
+            'score': round(float(row['score']), 6),
+            'snippets': highlight_snippets(row['lyrics'], terms, max_snippets)
+        }
+        for row in rows
+    ]
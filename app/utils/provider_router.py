@@ -0,0 +1,167 @@
+import random
+import threading
+import time
+from collections import deque
+from flask import current_app
+
+# 熔断器状态
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half_open'
+
+
+class ProviderStats:
+    """单个歌词平台的滚动统计和熔断状态"""
+
+    def __init__(self, name, window):
+        self.name = name
+        self.latencies = deque(maxlen=window)  # 最近的耗时(秒)
+        self.outcomes = deque(maxlen=window)  # 最近的成败
+        self.ewma_latency = None
+        self.consecutive_failures = 0
+        self.state = CIRCUIT_CLOSED
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.calls = 0
+        self.failures = 0
+        self.found = 0
+
+    def success_rate(self):
+        if not self.outcomes:
+            return 1.0
+        return sum(self.outcomes) / len(self.outcomes)
+
+    def p95_latency(self):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def to_dict(self):
+        p95 = self.p95_latency()
+        return {
+            'state': self.state,
+            'calls': self.calls,
+            'failures': self.failures,
+            'found': self.found,
+            'consecutive_failures': self.consecutive_failures,
+            'success_rate': round(self.success_rate(), 4),
+            'ewma_latency_ms': round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+            'p95_latency_ms': round(p95 * 1000, 1) if p95 is not None else None
+        }
+
+
+class ProviderRouter:
+    """根据各平台的成功率和延迟决定请求顺序，连续失败的平台由熔断器暂时跳过"""
+
+    def __init__(self, failure_threshold=5, open_seconds=30.0, window=100, ewma_alpha=0.2):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.window = window
+        self.ewma_alpha = ewma_alpha
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _get_stats(self, name):
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = ProviderStats(name, self.window)
+        return stats
+
+    def _score(self, stats):
+        """预期耗时越短、成功率越高，得分越低；没有数据的平台优先尝试"""
+        if stats.ewma_latency is None:
+            return 0.0
+        return stats.ewma_latency / max(stats.success_rate(), 0.05)
+
+    def order(self, names):
+        """返回可用平台按优先级排序的列表，熔断中的平台不在其中"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = []
+            for name in names:
+                stats = self._get_stats(name)
+                if stats.state == CIRCUIT_OPEN and now - stats.opened_at < self.open_seconds:
+                    continue
+                if stats.state == CIRCUIT_HALF_OPEN and stats.probe_in_flight:
+                    continue
+                candidates.append((self._score(stats), random.random(), name))
+
+        candidates.sort()
+        return [name for _, _, name in candidates]
+
+    def hedge_delay(self, name, default):
+        """并发搜索中启动下一个平台前等待的时间：该平台的p95耗时，没有数据时使用default"""
+        with self._lock:
+            stats = self._stats.get(name)
+            p95 = stats.p95_latency() if stats is not None else None
+        return default if p95 is None else p95
+
+    def allow(self, name):
+        """调用平台前检查熔断器，半开状态下只放行一个探测请求"""
+        now = time.monotonic()
+        with self._lock:
+            stats = self._get_stats(name)
+            if stats.state == CIRCUIT_CLOSED:
+                return True
+            if stats.state == CIRCUIT_OPEN:
+                if now - stats.opened_at < self.open_seconds:
+                    return False
+                stats.state = CIRCUIT_HALF_OPEN
+            if stats.probe_in_flight:
+                return False
+            stats.probe_in_flight = True
+            return True
+
+    def record(self, name, success, latency, found=False):
+        """记录一次调用结果并更新熔断状态"""
+        with self._lock:
+            stats = self._get_stats(name)
+            stats.calls += 1
+            stats.latencies.append(latency)
+            stats.outcomes.append(success)
+            if stats.ewma_latency is None:
+                stats.ewma_latency = latency
+            else:
+                stats.ewma_latency += self.ewma_alpha * (latency - stats.ewma_latency)
+
+            if stats.state == CIRCUIT_HALF_OPEN:
+                stats.probe_in_flight = False
+
+            if success:
+                stats.consecutive_failures = 0
+                stats.state = CIRCUIT_CLOSED
+                if found:
+                    stats.found += 1
+                return
+
+            stats.failures += 1
+            stats.consecutive_failures += 1
+            if stats.state == CIRCUIT_HALF_OPEN or stats.consecutive_failures >= self.failure_threshold:
+                stats.state = CIRCUIT_OPEN
+                stats.opened_at = time.monotonic()
+
+    def snapshot(self):
+        """返回所有平台的统计信息"""
+        with self._lock:
+            return {name: stats.to_dict() for name, stats in self._stats.items()}
+
+
+_provider_router = None
+_provider_router_lock = threading.Lock()
+
+
+def get_provider_router():
+    """获取进程内共享的平台路由器，首次使用时按应用配置创建"""
+    global _provider_router
+    if _provider_router is None:
+        with _provider_router_lock:
+            if _provider_router is None:
+                config = current_app.config
+                _provider_router = ProviderRouter(
+                    failure_threshold=config.get('PROVIDER_FAILURE_THRESHOLD', 5),
+                    open_seconds=config.get('PROVIDER_OPEN_SECONDS', 30.0),
+                    window=config.get('PROVIDER_STATS_WINDOW', 100),
+                    ewma_alpha=config.get('PROVIDER_EWMA_ALPHA', 0.2)
+                )
+    return _provider_router
@@ -0,0 +1,110 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+# 缓存键的类型：歌曲详情和歌曲列表
+SONG_DETAIL = 'song'
+SONG_LIST = 'songs'
+
+
+class CachedResponse:
+    """序列化好的响应：响应体、强ETag和需要一并返回的响应头"""
+
+    __slots__ = ('body', 'etag', 'headers')
+
+    def __init__(self, body, headers=None):
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.headers = headers or {}
+
+
+class ResponseCache:
+    """进程内的读穿响应缓存：有界LRU + TTL，写入歌曲、关键词或故事后按歌曲失效"""
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._entries = OrderedDict()  # key -> (过期时间, CachedResponse)
+        self._lock = threading.Lock()
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'sets': 0,
+            'evictions': 0,
+            'invalidations': 0
+        }
+
+    def get(self, key):
+        """查询缓存，未命中或已过期时返回None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._counters['hits'] += 1
+                    return entry[1]
+                del self._entries[key]
+            self._counters['misses'] += 1
+            return None
+
+    def set(self, key, cached):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, cached)
+            self._entries.move_to_end(key)
+            self._counters['sets'] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def invalidate_song(self, song_id=None, lists=True):
+        """删除指定歌曲的详情缓存；lists为True时同时删除所有歌曲列表缓存"""
+        with self._lock:
+            keys = [key for key in self._entries
+                    if (key[0] == SONG_DETAIL and key[1] == song_id) or (lists and key[0] == SONG_LIST)]
+            for key in keys:
+                del self._entries[key]
+            self._counters['invalidations'] += len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """返回命中/未命中计数"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """获取进程内共享的响应缓存，首次使用时按应用配置创建"""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                config = current_app.config
+                _response_cache = ResponseCache(
+                    max_entries=config.get('RESPONSE_CACHE_SIZE', 1024),
+                    ttl=config.get('RESPONSE_CACHE_TTL', 60)
+                )
+    return _response_cache
+
+
+def invalidate_song_responses(song_id=None, lists=False):
+    """
+    提交写入后调用：新增歌曲时lists为True，只修改关键词或故事时只失效歌曲详情
+    缓存只在本进程内，其他工作进程中的旧条目在TTL到期后失效
+    """
+    get_response_cache().invalidate_song(song_id, lists)
@@ -0,0 +1,380 @@
+import base64
+import hashlib
+import re
+import click
+from contextlib import contextmanager
+from datetime import datetime
+from flask import current_app
+from flask.cli import with_appcontext
+from app.utils.corpus_stats import get_corpus_stats
+from app.utils.database import get_db
+from app.utils.keyword_extractor import get_keyword_extractor
+from app.utils.lyrics_cache import LYRICS_NOT_FOUND, normalize_song_identity
+from app.utils.lyrics_finder import LyricsFinder
+
+# 文件名格式: "歌手名 - 歌曲名.mp3"
+SONG_FILE_PATTERN = re.compile(r'(.+?)\s*-\s*(.+?)\.mp3$')
+
+
+def parse_song_file_name(file_name):
+    """从文件名提取(歌手名, 歌曲名)，格式不符合时返回None"""
+    match = SONG_FILE_PATTERN.match(file_name)
+    if not match:
+        return None
+    return match.group(1).strip(), match.group(2).strip()
+
+
+def song_identity_key(artist_name, song_name):
+    """歌曲唯一键：归一化后(歌手名, 歌曲名)的SHA1，对应songs.song_key唯一索引"""
+    artist, title = normalize_song_identity(artist_name, song_name)
+    return hashlib.sha1(f"{artist}\x1f{title}".encode('utf-8')).hexdigest()
+
+
+@contextmanager
+def song_lock(db, song_key, timeout):
+    """
+    跨进程的歌曲处理锁(MySQL GET_LOCK)，产出是否拿到锁
+    锁属于数据库会话而不是事务，提交事务不会释放，退出时显式释放后连接才能还回连接池
+    """
+    name = f"music_story:song:{song_key}"
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (name, timeout))
+        acquired = cursor.fetchone()[0] == 1
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (name,))
+                cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+def analyze_lyrics_frequency(lyrics, top_n=5):
+    """分析歌词中词语出现的频率，返回出现次数最多的[(词语, 次数)]"""
+    return get_keyword_extractor().extract(lyrics, top_n)
+
+
+def prepare_song(song_name, artist_name):
+    """获取歌词并分词统计，不访问数据库，返回(歌词数据, {词语: 次数})"""
+    lyrics_data = LyricsFinder().search_lyrics(song_name, artist_name)
+
+    term_counts = {}
+    if lyrics_data['lyrics'] != LYRICS_NOT_FOUND:
+        term_counts = get_keyword_extractor().count(lyrics_data['lyrics'])
+
+    return lyrics_data, term_counts
+
+
+def find_existing_songs(db, song_keys, refetch_misses_after=None):
+    """
+    一次查询找出已经入库的歌曲，返回{歌曲唯一键: song_id}
+    refetch_misses_after为秒数时，未找到歌词且超过这么久没有更新的歌曲不算已入库，调用方会重新获取歌词
+    """
+    if not song_keys:
+        return {}
+
+    placeholders = ', '.join(['%s'] * len(song_keys))
+    where = f"song_key IN ({placeholders})"
+    params = list(song_keys)
+    if refetch_misses_after is not None:
+        where += " AND NOT (lyrics = %s AND updated_at < NOW() - INTERVAL %s SECOND)"
+        params += [LYRICS_NOT_FOUND, refetch_misses_after]
+
+    cursor = db.cursor()
+    try:
+        cursor.execute(f"SELECT id, song_key FROM songs WHERE {where}", params)
+        return {song_key: song_id for song_id, song_key in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+
+def is_stale_miss(db, song, refetch_misses_after):
+    """已入库的歌曲没有找到歌词，且超过refetch_misses_after秒没有更新，需要重新获取歌词"""
+    if song['lyrics'] != LYRICS_NOT_FOUND:
+        return False
+
+    cursor = db.cursor()
+    try:
+        # 用数据库时间比较，避免应用服务器与数据库的时区、时钟差异
+        cursor.execute("SELECT updated_at < NOW() - INTERVAL %s SECOND FROM songs WHERE id = %s",
+                       (refetch_misses_after, song['id']))
+        row = cursor.fetchone()
+        return bool(row and row[0])
+    finally:
+        cursor.close()
+
+
+def save_song(db, file_name, song_name, artist_name, lyrics_data):
+    """
+    插入歌曲信息，由调用方提交事务，返回(song_id, 是否写入了新歌词)
+    同一首歌已被其他请求写入时只通过LAST_INSERT_ID取回它的ID；
+    原记录没有找到歌词而这次找到了时用新歌词替换，调用方像新歌曲一样补写关键词和故事
+    """
+    cursor = db.cursor()
+    try:
+        # timed_lyrics要在lyrics之前赋值，赋值时看到的是原来的lyrics
+        cursor.execute(
+            "INSERT INTO songs (song_key, file_name, song_name, artist_name, lyrics, timed_lyrics) "
+            "VALUES (%s, %s, %s, %s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id), "
+            "timed_lyrics = IF(lyrics = %s AND VALUES(lyrics) != %s, VALUES(timed_lyrics), timed_lyrics), "
+            "lyrics = IF(lyrics = %s AND VALUES(lyrics) != %s, VALUES(lyrics), lyrics)",
+            (song_identity_key(artist_name, song_name), file_name, song_name, artist_name,
+             lyrics_data['lyrics'], lyrics_data.get('timed_lyrics'),
+             LYRICS_NOT_FOUND, LYRICS_NOT_FOUND, LYRICS_NOT_FOUND, LYRICS_NOT_FOUND)
+        )
+        # 新插入时影响行数为1，替换了原来的未找到歌词时为2，命中唯一键且没有修改任何列时为0
+        return cursor.lastrowid, cursor.rowcount in (1, 2)
+    finally:
+        cursor.close()
+
+
+def rank_by_frequency(term_counts, top_n=5):
+    """按歌曲内词频选出关键词，返回[(词语, 次数, 得分)]，得分为相对于最高词频的比例"""
+    top = get_keyword_extractor().top(term_counts, top_n)
+    top_count = top[0][1] if top else 1
+    return [(word, count, count / top_count) for word, count in top]
+
+
+def save_keywords(db, song_id, ranked, source='auto'):
+    """
+    一条多行INSERT批量插入歌曲关键词，ranked为[(词语, 次数, 得分)]，得分写入weight
+    返回关键词列表，由调用方提交事务
+    """
+    if not ranked:
+        return []
+
+    rows = [(song_id, word, count, round(score, 4), source) for word, count, score in ranked]
+
+    cursor = db.cursor()
+    try:
+        # mysql-connector会把INSERT的executemany改写为一条多行INSERT语句
+        # 重复写入同一首歌的关键词时覆盖词频和权重，重试是幂等的
+        cursor.executemany(
+            "INSERT INTO keywords (song_id, keyword, frequency, weight, source) VALUES (%s, %s, %s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE frequency = VALUES(frequency), weight = VALUES(weight)",
+            rows
+        )
+        return [word for word, _, _ in ranked]
+    finally:
+        cursor.close()
+
+
+def save_song_keywords(db, song_id, term_counts, top_n=5):
+    """
+    把歌词计入语料库文档频率，再按配置的方式(TF-IDF或词频)选出关键词入库
+    返回关键词列表，由调用方在写入歌曲的同一个事务中提交
+    """
+    if not term_counts:
+        return []
+
+    corpus = get_corpus_stats()
+    corpus.add_document(db, term_counts)
+
+    if current_app.config['KEYWORD_RANKING'] == 'tfidf':
+        ranked = corpus.rank(db, term_counts, top_n)
+    else:
+        ranked = rank_by_frequency(term_counts, top_n)
+    return save_keywords(db, song_id, ranked)
+
+
+def save_story(db, song_id, story, prompt=None, prompt_key=None):
+    """插入歌曲故事，记录生成时使用的提示词和缓存键，由调用方提交事务"""
+    cursor = db.cursor()
+    try:
+        cursor.execute(
+            "INSERT INTO stories (song_id, story_content, prompt, prompt_key) VALUES (%s, %s, %s, %s)",
+            (song_id, story, prompt, prompt_key)
+        )
+        return cursor.lastrowid
+    finally:
+        cursor.close()
+
+
+# 拼接关键词时使用的分隔符(ASCII单元分隔符)，不会出现在分词结果中
+KEYWORD_SEPARATOR = '\x1f'
+
+# 歌曲详情：歌曲、按权重排序的关键词、最新故事和最近的故事任务在一次查询中取回
+# 每首歌的关键词很少，不会超过group_concat_max_len的默认值1024字节
+SONG_DETAIL_SQL = (
+    "SELECT s.id, s.file_name, s.song_name, s.artist_name, s.lyrics, s.lyrics_source, s.lyrics_language, "
+    "s.duration, s.created_at, s.updated_at, s.timed_lyrics IS NOT NULL AS has_timed_lyrics, "
+    "(SELECT GROUP_CONCAT(k.keyword ORDER BY k.weight DESC, k.frequency DESC, k.id SEPARATOR '" + KEYWORD_SEPARATOR + "') "
+    " FROM keywords k WHERE k.song_id = s.id) AS keyword_list, "
+    "(SELECT st.story_content FROM stories st WHERE st.song_id = s.id "
+    " ORDER BY st.created_at DESC, st.id DESC LIMIT 1) AS story, "
+    "(SELECT j.id FROM story_jobs j WHERE j.song_id = s.id ORDER BY j.id DESC LIMIT 1) AS story_job_id, "
+    "(SELECT j.status FROM story_jobs j WHERE j.song_id = s.id ORDER BY j.id DESC LIMIT 1) AS story_status "
+    "FROM songs s WHERE {where}"
+)
+
+
+def _song_detail_row(row):
+    """把查询结果中的聚合字段转换为列表和布尔值"""
+    row['has_timed_lyrics'] = bool(row['has_timed_lyrics'])
+    keyword_list = row.pop('keyword_list')
+    row['keywords'] = keyword_list.split(KEYWORD_SEPARATOR) if keyword_list else []
+    return row
+
+
+def fetch_song_detail(db, song_id=None, song_key=None):
+    """按ID或歌曲唯一键一次查询取回歌曲详情，不存在时返回None"""
+    if song_id is not None:
+        where, params = "s.id = %s", (song_id,)
+    else:
+        where, params = "s.song_key = %s", (song_key,)
+
+    cursor = db.cursor(dictionary=True)
+    try:
+        cursor.execute(SONG_DETAIL_SQL.format(where=where), params)
+        row = cursor.fetchone()
+        return _song_detail_row(row) if row else None
+    finally:
+        cursor.close()
+
+
+def load_song_summaries(db, song_ids):
+    """一次查询批量读取歌曲、前5个关键词和最新故事，返回{song_id: 歌曲数据}"""
+    if not song_ids:
+        return {}
+
+    placeholders = ', '.join(['%s'] * len(song_ids))
+    cursor = db.cursor(dictionary=True)
+    try:
+        cursor.execute(SONG_DETAIL_SQL.format(where=f"s.id IN ({placeholders})"), list(song_ids))
+        summaries = {}
+        for row in cursor.fetchall():
+            row = _song_detail_row(row)
+            summaries[row['id']] = {
+                'song_id': row['id'],
+                'song_name': row['song_name'],
+                'artist_name': row['artist_name'],
+                'lyrics': row['lyrics'],
+                'keywords': row['keywords'][:5],
+                'story': row['story']
+            }
+        return summaries
+    finally:
+        cursor.close()
+
+
+# 歌曲列表可以选择返回的字段
+SONG_LIST_FIELDS = ('id', 'song_name', 'artist_name', 'file_name', 'created_at', 'updated_at',
+                    'lyrics_source', 'lyrics_language', 'duration')
+DEFAULT_SONG_LIST_FIELDS = ('id', 'song_name', 'artist_name', 'file_name', 'created_at')
+
+
+def encode_song_cursor(created_at, song_id):
+    """把最后一行的(created_at, id)编码为不透明的分页游标"""
+    raw = f"{created_at.isoformat()}|{song_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_song_cursor(cursor_value):
+    """解析分页游标，格式不正确时抛出ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor_value + '=' * (-len(cursor_value) % 4)).decode()
+        created_at, song_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(song_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor_value}") from e
+
+
+def list_songs_page(db, limit, after=None, fields=DEFAULT_SONG_LIST_FIELDS):
+    """
+    按(created_at, id)倒序分页读取歌曲，after为上一页最后一行的(created_at, id)
+    先在idx_created_id索引上定位一页的ID，再回表读取字段，耗时与表大小无关
+    返回(歌曲列表, 下一页游标)，没有下一页时游标为None
+    """
+    where = ""
+    params = []
+    if after is not None:
+        where = "WHERE created_at < %s OR (created_at = %s AND id < %s)"
+        params = [after[0], after[0], after[1]]
+
+    # 多取一行用来判断是否还有下一页
+    columns = ', '.join(f"s.{field}" for field in fields)
+    cursor = db.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            f"SELECT {columns}, s.id AS _id, s.created_at AS _created_at FROM ("
+            f"SELECT id FROM songs {where} ORDER BY created_at DESC, id DESC LIMIT %s"
+            f") page JOIN songs s ON s.id = page.id ORDER BY s.created_at DESC, s.id DESC",
+            params + [limit + 1]
+        )
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_song_cursor(rows[-1]['_created_at'], rows[-1]['_id'])
+
+    for row in rows:
+        del row['_id'], row['_created_at']
+    return rows, next_cursor
+
+
+def load_songs_by_ids(db, song_ids, fields=DEFAULT_SONG_LIST_FIELDS):
+    """按ID批量读取歌曲列表字段，返回{song_id: 歌曲数据}"""
+    if not song_ids:
+        return {}
+
+    placeholders = ', '.join(['%s'] * len(song_ids))
+    columns = ', '.join(fields)
+    cursor = db.cursor(dictionary=True)
+    try:
+        cursor.execute(f"SELECT {columns}, id AS _id FROM songs WHERE id IN ({placeholders})", list(song_ids))
+        return {row.pop('_id'): row for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+
+def backfill_song_keys(db, batch_size=1000):
+    """
+    为song_key为空的旧记录补写唯一键，按ID分批处理，返回(补写数, 重复数)
+    归一化后重复的旧记录只给ID最小的一条写入，其余保持为空并记录日志
+    """
+    updated = duplicates = 0
+    last_id = 0
+    cursor = db.cursor()
+    try:
+        while True:
+            cursor.execute(
+                "SELECT id, artist_name, song_name FROM songs WHERE song_key IS NULL AND id > %s ORDER BY id LIMIT %s",
+                (last_id, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return updated, duplicates
+            last_id = rows[-1][0]
+
+            keys = {}
+            for song_id, artist_name, song_name in rows:
+                keys.setdefault(song_identity_key(artist_name, song_name), song_id)
+            existing = find_existing_songs(db, list(keys))
+
+            pending = [(key, song_id) for key, song_id in keys.items() if key not in existing]
+            duplicates += len(rows) - len(pending)
+            if pending:
+                cursor.executemany("UPDATE songs SET song_key = %s WHERE id = %s", pending)
+                updated += len(pending)
+            db.commit()
+    finally:
+        cursor.close()
+
+
+@click.command('backfill-song-keys')
+@with_appcontext
+def backfill_song_keys_command():
+    """命令行为旧歌曲记录补写song_key"""
+    updated, duplicates = backfill_song_keys(get_db())
+    click.echo(f'已补写 {updated} 条，重复 {duplicates} 条(保持为空).')
+
+
+def init_app_songs(app):
+    """注册歌曲相关的命令行命令"""
+    app.cli.add_command(backfill_song_keys_command)
@@ -0,0 +1,76 @@
+import hashlib
+from flask import current_app
+from app.utils.single_flight import SingleFlight
+from app.utils.story_generator import build_story_prompt, generate_story
+
+# 相同关键词集合的并发生成请求只调用一次大模型
+_story_flights = SingleFlight()
+
+
+def normalize_keywords(keywords):
+    """关键词去重、去空白并排序，顺序不同的同一组关键词得到相同结果"""
+    return sorted({keyword.strip() for keyword in keywords if keyword and keyword.strip()})
+
+
+def story_prompt_key(keywords, domain):
+    """返回(提示词, 缓存键)，缓存键由模型domain和规范化关键词生成的提示词决定，提示词模板变化时自动失效"""
+    prompt = build_story_prompt(normalize_keywords(keywords))
+    prompt_key = hashlib.sha1(f"{domain}\n{prompt}".encode('utf-8')).hexdigest()
+    return prompt, prompt_key
+
+
+def find_cached_story(db, prompt_key, max_reuse):
+    """查找可以复用的故事：最新的一篇在被max_reuse首歌使用之前都可以复用"""
+    if max_reuse <= 0:
+        return None
+
+    cursor = db.cursor()
+    try:
+        cursor.execute(
+            "SELECT story_content, (SELECT COUNT(*) FROM stories WHERE prompt_key = %s) AS uses "
+            "FROM stories WHERE prompt_key = %s ORDER BY id DESC LIMIT 1",
+            (prompt_key, prompt_key)
+        )
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+        # 结束只读事务，生成故事期间不占用事务
+        db.commit()
+
+    if row is None or row[1] % max_reuse == 0:
+        return None
+    return row[0]
+
+
+def find_reusable_story(db, keywords):
+    """返回(可复用的故事或None, 提示词, 缓存键)"""
+    config = current_app.config
+    prompt, prompt_key = story_prompt_key(keywords, config['SPARK_DOMAIN'])
+
+    if config['STORY_CACHE_ENABLED']:
+        story = find_cached_story(db, prompt_key, config['STORY_CACHE_MAX_REUSE'])
+        if story is not None:
+            current_app.logger.info(f"Story cache hit for keywords: {keywords}")
+            return story, prompt, prompt_key
+    return None, prompt, prompt_key
+
+
+def generate_shared_story(keywords, prompt_key):
+    """调用大模型生成故事，相同缓存键的并发请求共享一次调用；不使用数据库连接，失败时抛出StoryGenerationError"""
+    return _story_flights.do(prompt_key, lambda: generate_story(normalize_keywords(keywords)))
+
+
+def get_or_generate_story(db, keywords):
+    """
+    先按关键词集合查找可复用的故事，未命中时生成新故事
+    返回(故事, 提示词, 缓存键)，失败时抛出StoryGenerationError
+    """
+    story, prompt, prompt_key = find_reusable_story(db, keywords)
+    if story is None:
+        story = generate_shared_story(keywords, prompt_key)
+    return story, prompt, prompt_key
+
+
+def story_cache_stats():
+    """返回正在进行中的生成数"""
+    return {'in_flight': _story_flights.in_flight()}
@@ -4,15 +4,25 @@ import base64
 import datetime
 import hashlib
 import hmac
+import logging
+import queue
+import random
+import threading
 import websocket
 import ssl
-import _thread as thread
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from urllib.parse import urlparse
 from wsgiref.handlers import format_date_time
 from time import mktime
 from urllib.parse import urlencode
 from flask import current_app
 
+# 工作线程中没有应用上下文，使用模块日志记录器(会传递给Flask的app日志记录器)
+logger = logging.getLogger(__name__)
+
+# 可以重试的讯飞星火错误码：内部错误、服务繁忙、秒级流控超限、并发流控超限
+RETRYABLE_CODES = frozenset([10010, 10012, 10110, 11202, 11203])
+
 
 class Ws_Param(object):
     """生成讯飞星火API请求URL的参数类"""
@@ -83,108 +93,296 @@ def gen_params(appid, query, domain, temperature=0.8):
     return data
 
 
-def generate_story_with_keywords(keywords):
-    """使用讯飞星火API根据关键词生成故事"""
-    # 从应用配置获取API信息
-    APP_ID = current_app.config['SPARK_APP_ID']
-    API_KEY = current_app.config['SPARK_API_KEY']
-    API_SECRET = current_app.config['SPARK_API_SECRET']
-    SPARK_URL = current_app.config['SPARK_URL']
-    DOMAIN = current_app.config['SPARK_DOMAIN']
-
-    # 用于存储结果的变量
-    story_content = ""
-    story_completed = False
-    error_message = None
-
-    # WebSocket回调函数
-    def on_message(ws, message):
-        nonlocal story_content, story_completed
-        try:
-            data = json.loads(message)
-            code = data['header']['code']
-            if code != 0:
-                current_app.logger.error(f'Request error: {code}, {data}')
-                ws.close()
-            else:
+def build_story_prompt(keywords):
+    """根据关键词生成故事提示词"""
+    return f"请使用以下关键词创作一个有创意的短篇故事：{', '.join(keywords)}。故事应该包含所有这些关键词，并且要有一个有趣的情节和角色。故事长度控制在800-1200字。"
+
+
+class StoryGenerationError(Exception):
+    """故事生成失败，异常信息即返回给客户端的提示文本"""
+
+
+class SparkAPIError(StoryGenerationError):
+    """讯飞星火返回了非0错误码"""
+
+    def __init__(self, code, message):
+        super().__init__(f"生成故事时出错: {code}, {message}")
+        self.code = code
+
+    @property
+    def retryable(self):
+        return self.code in RETRYABLE_CODES
+
+
+class SparkOverloadedError(StoryGenerationError):
+    """排队等待超时，请求被拒绝以保护服务"""
+
+
+class TokenBucket:
+    """令牌桶限流器：每秒补充rate个令牌，最多积攒capacity个"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout):
+        """取一个令牌，timeout秒内取不到返回False"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class SparkClient:
+    """讯飞星火客户端：进程内限制并发会话数和请求速率，排队超时则拒绝，可重试的错误按带抖动的退避重试"""
+
+    def __init__(self, app_id, api_key, api_secret, spark_url, domain, max_concurrency=4, qps=2.0, burst=2,
+                 queue_timeout=10.0, request_timeout=60.0, max_retries=2, retry_backoff=0.5):
+        self.app_id = app_id
+        self.ws_param = Ws_Param(app_id, api_key, api_secret, spark_url)
+        self.domain = domain
+        self.queue_timeout = queue_timeout
+        self.request_timeout = request_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._bucket = TokenBucket(qps, burst)
+        self._lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'completed': 0,
+            'failed': 0,
+            'retries': 0,
+            'shed': 0,
+            'in_flight': 0,
+            'max_queue_wait_ms': 0.0
+        }
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config['SPARK_APP_ID'],
+            config['SPARK_API_KEY'],
+            config['SPARK_API_SECRET'],
+            config['SPARK_URL'],
+            config['SPARK_DOMAIN'],
+            max_concurrency=config['SPARK_MAX_CONCURRENCY'],
+            qps=config['SPARK_QPS'],
+            burst=config['SPARK_BURST'],
+            queue_timeout=config['SPARK_QUEUE_TIMEOUT'],
+            request_timeout=config['SPARK_REQUEST_TIMEOUT'],
+            max_retries=config['SPARK_MAX_RETRIES'],
+            retry_backoff=config['SPARK_RETRY_BACKOFF']
+        )
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._stats[name] += value
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _acquire(self):
+        """占用一个并发名额并取得令牌，排队超过queue_timeout时拒绝请求"""
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._count('shed')
+            raise SparkOverloadedError("生成故事时出错: 服务繁忙，请稍后再试")
+
+        if not self._bucket.acquire(max(0.0, self.queue_timeout - (time.monotonic() - start))):
+            self._slots.release()
+            self._count('shed')
+            raise SparkOverloadedError("生成故事时出错: 服务繁忙，请稍后再试")
+
+        waited = (time.monotonic() - start) * 1000
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['in_flight'] += 1
+            self._stats['max_queue_wait_ms'] = max(self._stats['max_queue_wait_ms'], round(waited, 1))
+
+    def _release(self):
+        self._count('in_flight', -1)
+        self._slots.release()
+
+    def _backoff(self, attempt):
+        """带完全抖动的指数退避时间"""
+        return random.uniform(0, self.retry_backoff * (2 ** attempt))
+
+    def _open_session(self, query, on_chunk=None):
+        """在后台线程中运行一次websocket会话，返回(Future, 连接)，生成结束或出错时Future完成"""
+        future = Future()
+        parts = []
+
+        def on_message(ws, message):
+            try:
+                data = json.loads(message)
+                code = data['header']['code']
+                if code != 0:
+                    logger.error(f'Request error: {code}, {data}')
+                    if not future.done():
+                        future.set_exception(SparkAPIError(code, data['header'].get('message', '')))
+                    ws.close()
+                    return
+
                 choices = data["payload"]["choices"]
-                status = choices["status"]
                 content = choices["text"][0]["content"]
-                story_content += content
-                current_app.logger.debug(f"Received content: {content[:50]}...")
-                if status == 2:
-                    current_app.logger.info("Story generation completed")
-                    story_completed = True
+                if content:
+                    parts.append(content)
+                    if on_chunk is not None:
+                        on_chunk(content)
+                if choices["status"] == 2:
+                    if not future.done():
+                        future.set_result(''.join(parts))
                     ws.close()
-        except Exception as e:
-            current_app.logger.error(f"Error processing message: {e}")
-            current_app.logger.error(f"Received message: {message}")
-            ws.close()
-
-    def on_error(ws, error):
-        nonlocal error_message
-        current_app.logger.error(f"Error: {error}")
-        error_message = str(error)
-
-    def on_close(ws, *args):
-        nonlocal story_completed
-        current_app.logger.info("Connection closed")
-        story_completed = True
-
-    def on_open(ws):
-        def run(*args):
-            try:
-                # 创建请求的prompt
-                query = f"请使用以下关键词创作一个有创意的短篇故事：{', '.join(keywords)}。故事应该包含所有这些关键词，并且要有一个有趣的情节和角色。故事长度控制在800-1200字。"
-                current_app.logger.info(f"Generating story with keywords: {keywords}")
-
-                data = json.dumps(gen_params(APP_ID, query, DOMAIN))
-                ws.send(data)
             except Exception as e:
-                current_app.logger.error(f"Error in on_open: {e}")
+                logger.error(f"Error processing message: {e}")
+                if not future.done():
+                    future.set_exception(StoryGenerationError(f"生成故事时出错: {str(e)}"))
                 ws.close()
 
-        thread.start_new_thread(run, ())
+        def on_error(ws, error):
+            logger.error(f"Spark websocket error: {error}")
+            if not future.done():
+                future.set_exception(StoryGenerationError(f"生成故事时出错: {error}"))
 
-    try:
-        # 创建WebSocket连接参数
-        wsParam = Ws_Param(APP_ID, API_KEY, API_SECRET, SPARK_URL)
-        websocket.enableTrace(False)  # 线上模式不要启用trace
-        wsUrl = wsParam.create_url()
+        def on_close(ws, *args):
+            if not future.done():
+                future.set_exception(StoryGenerationError("无法生成故事，请检查API配置或网络连接"))
 
-        current_app.logger.info(f"Connecting to {SPARK_URL}")
+        def on_open(ws):
+            ws.send(json.dumps(gen_params(self.app_id, query, self.domain)))
 
-        # 创建WebSocket连接
         ws = websocket.WebSocketApp(
-            wsUrl,
+            self.ws_param.create_url(),
             on_message=on_message,
             on_error=on_error,
             on_close=on_close,
             on_open=on_open
         )
+        # 使用SSL但不验证证书
+        threading.Thread(target=ws.run_forever, kwargs={'sslopt': {"cert_reqs": ssl.CERT_NONE}},
+                         name='spark-ws', daemon=True).start()
+        return future, ws
+
+    def generate(self, query):
+        """生成完整回复，失败时抛出StoryGenerationError"""
+        attempt = 0
+        while True:
+            self._acquire()
+            try:
+                future, ws = self._open_session(query)
+                try:
+                    result = future.result(timeout=self.request_timeout)
+                except FutureTimeoutError:
+                    ws.close()
+                    raise StoryGenerationError("生成故事时出错: 请求超时")
+                self._count('completed')
+                return result
+            except SparkAPIError as e:
+                if not e.retryable or attempt >= self.max_retries:
+                    self._count('failed')
+                    raise
+                logger.warning(f"Spark retryable error {e.code}, retrying (attempt {attempt + 1})")
+            except StoryGenerationError:
+                self._count('failed')
+                raise
+            finally:
+                self._release()
 
-        # 启动WebSocket连接，使用SSL但不验证证书
-        ws.run_forever(sslopt={"cert_reqs": ssl.CERT_NONE})
+            # 退避期间不占用并发名额
+            self._count('retries')
+            time.sleep(self._backoff(attempt))
+            attempt += 1
 
-        # 等待故事完成或超时
-        timeout = 60  # 最多等待60秒
-        start_time = time.time()
-        while not story_completed:
-            time.sleep(0.1)
-            if time.time() - start_time > timeout:
-                current_app.logger.error("Story generation timed out")
-                break
+    def stream(self, query):
+        """逐段返回生成内容；还没有返回任何内容时遇到可重试的错误会自动重试"""
+        attempt = 0
+        while True:
+            self._acquire()
+            chunks = queue.Queue()
+            ws = None
+            yielded = False
+            try:
+                future, ws = self._open_session(query, on_chunk=chunks.put)
+                # 所有内容入队之后才会放入结束标记
+                future.add_done_callback(lambda f: chunks.put(None))
+
+                deadline = time.monotonic() + self.request_timeout
+                while True:
+                    try:
+                        chunk = chunks.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        raise StoryGenerationError("生成故事时出错: 请求超时")
+                    if chunk is None:
+                        break
+                    yielded = True
+                    yield chunk
+
+                future.result()
+                self._count('completed')
+                return
+            except SparkAPIError as e:
+                if yielded or not e.retryable or attempt >= self.max_retries:
+                    self._count('failed')
+                    raise
+                logger.warning(f"Spark retryable error {e.code}, retrying (attempt {attempt + 1})")
+            except StoryGenerationError:
+                self._count('failed')
+                raise
+            finally:
+                if ws is not None:
+                    ws.close()
+                self._release()
+
+            self._count('retries')
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+
+_spark_client = None
+_spark_client_lock = threading.Lock()
+
+
+def get_spark_client():
+    """获取进程内共享的讯飞星火客户端，首次使用时按应用配置创建"""
+    global _spark_client
+    if _spark_client is None:
+        with _spark_client_lock:
+            if _spark_client is None:
+                _spark_client = SparkClient.from_config(current_app.config)
+    return _spark_client
+
+
+def generate_story_with_keywords(keywords):
+    """使用讯飞星火API根据关键词生成故事，失败时返回错误提示文本"""
+    try:
+        return generate_story(keywords)
+    except StoryGenerationError as e:
+        return str(e)
 
-    except Exception as e:
-        current_app.logger.error(f"Error generating story: {e}")
-        return f"生成故事时出错: {str(e)}"
 
-    # 检查是否有错误或内容为空
-    if error_message:
-        return f"生成故事时出错: {error_message}"
+def generate_story(keywords):
+    """使用讯飞星火API根据关键词生成故事，失败时抛出StoryGenerationError"""
+    logger.info(f"Generating story with keywords: {keywords}")
+    return get_spark_client().generate(build_story_prompt(keywords))
 
-    if not story_content:
-        return "无法生成故事，请检查API配置或网络连接"
 
-    # 返回生成的故事
-    return story_content
\ No newline at end of file
+def stream_story(keywords):
+    """逐段返回讯飞星火生成的故事内容，失败时抛出StoryGenerationError"""
+    logger.info(f"Streaming story with keywords: {keywords}")
+    return get_spark_client().stream(build_story_prompt(keywords))
@@ -0,0 +1,356 @@
+import json
+import os
+import queue
+import threading
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from app.utils.database import get_db
+from app.utils.response_cache import invalidate_song_responses
+from app.utils.song_pipeline import save_story
+from app.utils.story_cache import find_reusable_story, generate_shared_story
+from app.utils.story_generator import StoryGenerationError
+
+# 任务状态
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+FINISHED_STATUSES = (JOB_DONE, JOB_FAILED)
+
+
+def enqueue_story_job(db, song_id, keywords):
+    """创建故事生成任务，返回任务ID，由调用方提交事务后调用notify_story_job"""
+    cursor = db.cursor()
+    try:
+        cursor.execute(
+            "INSERT INTO story_jobs (song_id, keywords, status) VALUES (%s, %s, %s)",
+            (song_id, json.dumps(keywords, ensure_ascii=False), JOB_PENDING)
+        )
+        return cursor.lastrowid
+    finally:
+        cursor.close()
+
+
+def get_story_job(db, job_id):
+    """读取任务状态，完成的任务附带故事内容"""
+    cursor = db.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            "SELECT j.id AS job_id, j.song_id, j.status, j.attempts, j.error, j.story_id, "
+            "j.created_at, j.started_at, j.finished_at, s.story_content AS story "
+            "FROM story_jobs j LEFT JOIN stories s ON s.id = j.story_id WHERE j.id = %s",
+            (job_id,)
+        )
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+        # 结束只读事务，下次读取能看到其他连接提交的更新
+        db.commit()
+
+
+class StoryJobWorker:
+    """后台故事生成线程池：本进程创建的任务立即通过队列分发，其他进程遗留的任务通过轮询数据库领取"""
+
+    def __init__(self, app, workers=2, poll_interval=2.0, max_attempts=3, stale_seconds=300,
+                 retry_backoff=10.0, max_backoff=600.0):
+        self.app = app
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.stale_seconds = stale_seconds
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+
+        self._queue = queue.Queue()
+        self._finished = threading.Condition()
+        self._threads = []
+        self._stopping = threading.Event()
+        self._last_recover = 0.0
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'story-job-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stopping.set()
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def notify(self, job_id):
+        """通知工作线程有新任务"""
+        self._queue.put(job_id)
+
+    def wait_finished(self, timeout):
+        """等待本进程中任意任务结束，最多等待timeout秒"""
+        with self._finished:
+            self._finished.wait(timeout)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                job_id = self._queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                job_id = None
+
+            try:
+                if job_id is not None:
+                    self._process(job_id)
+                self._drain()
+            except Exception as e:
+                self.app.logger.error(f"Story job worker error: {e}")
+
+    def _drain(self):
+        """依次领取数据库中到期的待处理任务，直到没有可领取的任务，或本进程有新任务通知时，再回到队列等待"""
+        while not self._stopping.is_set() and self._queue.empty():
+            with self.app.app_context():
+                db = get_db()
+                self._recover_stale(db)
+                job_id = self._next_pending(db)
+            if job_id is None:
+                return
+            self._process(job_id)
+
+    def _next_pending(self, db):
+        cursor = db.cursor()
+        try:
+            cursor.execute("SELECT id FROM story_jobs WHERE status = %s AND (not_before IS NULL OR not_before <= NOW()) "
+                           "ORDER BY id LIMIT 1", (JOB_PENDING,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+        finally:
+            cursor.close()
+            db.commit()
+
+    # 第attempts次尝试失败后的重试时间：retry_backoff * 2^(attempts-1)秒之后，不超过max_backoff
+    _RETRY_AT_SQL = "NOW() + INTERVAL LEAST(%s * POW(2, GREATEST(attempts - 1, 0)), %s) SECOND"
+
+    def _recover_stale(self, db):
+        """
+        处理运行超时的任务(工作进程崩溃等)：已用完尝试次数的标记为失败，其余按退避时间放回待处理状态
+        导致工作进程崩溃的任务因此不会无限循环
+        """
+        now = time.monotonic()
+        if now - self._last_recover < self.stale_seconds / 2:
+            return
+        self._last_recover = now
+
+        cursor = db.cursor()
+        try:
+            cursor.execute(
+                "UPDATE story_jobs SET status = %s, error = %s, finished_at = NOW() "
+                "WHERE status = %s AND started_at < NOW() - INTERVAL %s SECOND AND attempts >= %s",
+                (JOB_FAILED, 'Worker stopped while running the job', JOB_RUNNING, self.stale_seconds,
+                 self.max_attempts)
+            )
+            failed = cursor.rowcount
+            cursor.execute(
+                f"UPDATE story_jobs SET status = %s, not_before = {self._RETRY_AT_SQL} "
+                "WHERE status = %s AND started_at < NOW() - INTERVAL %s SECOND",
+                (JOB_PENDING, self.retry_backoff, self.max_backoff, JOB_RUNNING, self.stale_seconds)
+            )
+            recovered = cursor.rowcount
+            db.commit()
+            if failed or recovered:
+                self.app.logger.warning(f"Stale story jobs: {recovered} requeued, {failed} marked failed")
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def _claim(self, db, job_id):
+        """原子地领取任务，多个进程同时领取时只有一个成功；还在退避等待中的任务不能领取"""
+        cursor = db.cursor()
+        try:
+            cursor.execute(
+                "UPDATE story_jobs SET status = %s, attempts = attempts + 1, started_at = NOW(), not_before = NULL "
+                "WHERE id = %s AND status = %s AND (not_before IS NULL OR not_before <= NOW())",
+                (JOB_RUNNING, job_id, JOB_PENDING)
+            )
+            db.commit()
+            return cursor.rowcount == 1
+        finally:
+            cursor.close()
+
+    def _load(self, db, job_id):
+        """读取任务，返回(歌曲ID, 关键词列表, 已尝试次数)"""
+        cursor = db.cursor()
+        try:
+            cursor.execute("SELECT song_id, keywords, attempts FROM story_jobs WHERE id = %s", (job_id,))
+            song_id, keywords, attempts = cursor.fetchone()
+            return song_id, json.loads(keywords), attempts
+        finally:
+            cursor.close()
+            db.commit()
+
+    def _complete(self, db, job_id, song_id, story, prompt, prompt_key):
+        """故事和任务状态在同一个短事务中写入"""
+        cursor = db.cursor()
+        try:
+            story_id = save_story(db, song_id, story, prompt, prompt_key)
+            cursor.execute(
+                "UPDATE story_jobs SET status = %s, story_id = %s, error = NULL, finished_at = NOW() "
+                "WHERE id = %s",
+                (JOB_DONE, story_id, job_id)
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            cursor.close()
+        invalidate_song_responses(song_id)
+
+    def _retry_or_fail(self, db, job_id, attempts, error):
+        """还有重试次数时按指数退避放回待处理状态，到时间后由轮询重试，否则标记失败"""
+        cursor = db.cursor()
+        try:
+            if attempts < self.max_attempts:
+                cursor.execute(f"UPDATE story_jobs SET status = %s, error = %s, not_before = {self._RETRY_AT_SQL} "
+                               "WHERE id = %s",
+                               (JOB_PENDING, str(error), self.retry_backoff, self.max_backoff, job_id))
+            else:
+                cursor.execute("UPDATE story_jobs SET status = %s, error = %s, finished_at = NOW() WHERE id = %s",
+                               (JOB_FAILED, str(error), job_id))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def _process(self, job_id):
+        """
+        领取并执行任务，每段数据库操作各自借出连接，调用大模型期间不占用连接
+        任何异常都会让任务按退避重试或标记失败，不会停留在运行中直到超时回收
+        """
+        try:
+            with self.app.app_context():
+                db = get_db()
+                if not self._claim(db, job_id):
+                    return
+                song_id, keywords, attempts = self._load(db, job_id)
+                story, prompt, prompt_key = find_reusable_story(db, keywords)
+
+            try:
+                # 离开应用上下文时连接已归还连接池
+                with self.app.app_context():
+                    if story is None:
+                        story = generate_shared_story(keywords, prompt_key)
+                with self.app.app_context():
+                    self._complete(get_db(), job_id, song_id, story, prompt, prompt_key)
+            except Exception as e:
+                self.app.logger.error(f"Story job {job_id} failed (attempt {attempts}): {e}")
+                try:
+                    with self.app.app_context():
+                        self._retry_or_fail(get_db(), job_id, attempts, e)
+                except Exception as update_error:
+                    # 状态没能写回时任务仍为运行中，由超时回收放回待处理状态
+                    self.app.logger.error(f"Failed to release story job {job_id}: {update_error}")
+                if not isinstance(e, StoryGenerationError):
+                    raise
+                return
+
+            self.app.logger.info(f"Story job {job_id} completed for song ID: {song_id}")
+        finally:
+            with self._finished:
+                self._finished.notify_all()
+
+
+_story_worker = None
+_story_worker_pid = None
+_story_worker_lock = threading.Lock()
+
+
+def _create_worker(app):
+    return StoryJobWorker(
+        app,
+        workers=app.config['STORY_JOB_WORKERS'],
+        poll_interval=app.config['STORY_JOB_POLL_INTERVAL'],
+        max_attempts=app.config['STORY_JOB_MAX_ATTEMPTS'],
+        stale_seconds=app.config['STORY_JOB_STALE_SECONDS'],
+        retry_backoff=app.config['STORY_JOB_RETRY_BACKOFF'],
+        max_backoff=app.config['STORY_JOB_RETRY_MAX_BACKOFF']
+    )
+
+
+def get_story_worker():
+    """获取本进程的故事任务线程池，首次使用时启动；关闭进程内执行时返回None"""
+    global _story_worker, _story_worker_pid
+    if not current_app.config['STORY_JOBS_IN_PROCESS']:
+        return None
+
+    # 线程不会被fork继承，子进程需要重新启动
+    if _story_worker is None or _story_worker_pid != os.getpid():
+        with _story_worker_lock:
+            if _story_worker is None or _story_worker_pid != os.getpid():
+                _story_worker = _create_worker(current_app._get_current_object())
+                _story_worker.start()
+                _story_worker_pid = os.getpid()
+    return _story_worker
+
+
+def start_story_worker(app):
+    """
+    进程启动时调用(gunicorn的post_worker_init钩子)，不必等到第一个请求才开始处理其他进程遗留的任务
+    关闭进程内执行时不启动，需要单独运行flask story-worker
+    """
+    with app.app_context():
+        return get_story_worker()
+
+
+def _ensure_story_worker():
+    """没有通过gunicorn钩子启动的进程(如开发服务器)在第一个请求时启动任务线程"""
+    # 测试等只给出部分配置的应用不启动
+    if current_app.config.get('STORY_JOBS_IN_PROCESS'):
+        get_story_worker()
+
+
+def notify_story_job(job_id):
+    """事务提交后调用，让本进程的工作线程立即处理任务"""
+    worker = get_story_worker()
+    if worker is not None:
+        worker.notify(job_id)
+
+
+def wait_for_story_job(job_id, timeout):
+    """长轮询等待任务结束，返回最新的任务状态；任务可能由其他进程处理，所以定期重新读取数据库"""
+    db = get_db()
+    worker = get_story_worker()
+    deadline = time.monotonic() + timeout
+
+    while True:
+        job = get_story_job(db, job_id)
+        remaining = deadline - time.monotonic()
+        if job is None or job['status'] in FINISHED_STATUSES or remaining <= 0:
+            return job
+
+        if worker is not None:
+            worker.wait_finished(min(remaining, 1.0))
+        else:
+            time.sleep(min(remaining, 1.0))
+
+
+@click.command('story-worker')
+@with_appcontext
+def story_worker_command():
+    """命令行启动独立的故事生成工作进程"""
+    worker = _create_worker(current_app._get_current_object())
+    worker.start()
+    click.echo(f'故事生成工作进程已启动，线程数: {worker.workers}')
+    try:
+        worker.join()
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+def init_app_story_jobs(app):
+    """注册故事任务的命令行命令和启动任务线程的请求钩子"""
+    app.cli.add_command(story_worker_command)
+    app.before_request(_ensure_story_worker)
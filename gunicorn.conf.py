@@ -0,0 +1,30 @@
+import gc
+import os
+
+# 启动方式: gunicorn -c gunicorn.conf.py
+wsgi_app = 'run:app'
+bind = os.environ.get('GUNICORN_BIND') or '0.0.0.0:5000'
+workers = int(os.environ.get('GUNICORN_WORKERS') or 4)
+threads = int(os.environ.get('GUNICORN_THREADS') or 4)
+timeout = int(os.environ.get('GUNICORN_TIMEOUT') or 120)
+
+# 在主进程中创建应用并预热jieba词典，fork出的工作进程通过写时复制共享，不再各自加载
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+
+def when_ready(server):
+    """应用加载完成后冻结主进程中已有的对象，避免工作进程里的垃圾回收触碰共享内存页引起复制"""
+    if preload_app:
+        gc.freeze()
+        server.log.info(f"Froze {gc.get_freeze_count()} objects before forking workers")
+
+
+def post_fork(server, worker):
+    """数据库连接池、HTTP会话和后台线程都按进程懒加载，工作进程中首次使用时重新创建"""
+    server.log.info(f"Worker {worker.pid} forked")
+
+
+def post_worker_init(worker):
+    """工作进程加载应用后立即启动故事任务线程，重启后遗留的待处理任务不必等到第一个请求才被领取"""
+    from app.utils.story_jobs import start_story_worker
+    start_story_worker(worker.wsgi)
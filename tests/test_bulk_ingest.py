@@ -0,0 +1,139 @@
+import json
+from flask import Flask
+from app.utils import bulk_ingest
+from app.utils.bulk_ingest import BulkIngest, IngestCheckpoint, STATUS_DONE, STATUS_FAILED, STATUS_SAVED
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+
+    def execute(self, sql, params=()):
+        self.db.queries.append((sql, params))
+
+    def fetchone(self):
+        return (self.db.has_story,)
+
+    def fetchall(self):
+        return [(keyword,) for keyword in self.db.keywords]
+
+    def close(self):
+        pass
+
+
+class FakeDB:
+    def __init__(self, keywords=(), has_story=False):
+        self.keywords = list(keywords)
+        self.has_story = has_story
+        self.queries = []
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+def _write_checkpoint(path, *entries):
+    path.write_text(''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries), encoding='utf-8')
+
+
+def test_plan_sends_failed_story_stage_to_story_only(tmp_path, monkeypatch):
+    checkpoint = tmp_path / 'checkpoint.jsonl'
+    _write_checkpoint(checkpoint, {'file_name': '歌手 - 歌曲.mp3', 'status': STATUS_FAILED, 'song_id': 42})
+    # 歌曲已入库，但故事阶段失败的歌曲不应被当作已有歌曲跳过
+    monkeypatch.setattr(bulk_ingest, 'get_db', lambda: FakeDB())
+    monkeypatch.setattr(bulk_ingest, 'find_existing_songs', lambda db, keys, **kwargs: {key: 42 for key in keys})
+
+    ingest = BulkIngest(Flask(__name__), checkpoint_path=str(checkpoint))
+    items, story_only = ingest._plan(['歌手 - 歌曲.mp3'])
+
+    assert items == []
+    assert [(item.file_name, item.song_id) for item in story_only] == [('歌手 - 歌曲.mp3', 42)]
+    assert ingest.stats['existing'] == 0
+    assert ingest.stats['resumed'] == 1
+
+
+def test_plan_retries_failed_entry_without_song_id_from_scratch(tmp_path, monkeypatch):
+    checkpoint = tmp_path / 'checkpoint.jsonl'
+    _write_checkpoint(checkpoint, {'file_name': '歌手 - 歌曲.mp3', 'status': STATUS_FAILED, 'song_id': None})
+    monkeypatch.setattr(bulk_ingest, 'get_db', lambda: FakeDB())
+    monkeypatch.setattr(bulk_ingest, 'find_existing_songs', lambda db, keys, **kwargs: {})
+
+    ingest = BulkIngest(Flask(__name__), checkpoint_path=str(checkpoint))
+    items, story_only = ingest._plan(['歌手 - 歌曲.mp3'])
+
+    assert [item.file_name for item in items] == ['歌手 - 歌曲.mp3']
+    assert story_only == []
+
+
+def _patch_story_jobs(monkeypatch, db):
+    """故事任务只记录创建和通知，返回(创建的任务, 通知的任务ID)"""
+    enqueued = []
+    notified = []
+
+    def enqueue(db_, song_id, keywords):
+        enqueued.append((song_id, list(keywords), db_.commits))
+        return len(enqueued)
+
+    monkeypatch.setattr(bulk_ingest, 'get_db', lambda: db)
+    monkeypatch.setattr(bulk_ingest, 'enqueue_story_job', enqueue)
+    monkeypatch.setattr(bulk_ingest, 'notify_story_job', notified.append)
+    monkeypatch.setattr(bulk_ingest, 'invalidate_song_responses', lambda song_id, lists=False: None)
+    return enqueued, notified
+
+
+def test_run_resumes_failed_story_stage(tmp_path, monkeypatch):
+    checkpoint = tmp_path / 'checkpoint.jsonl'
+    _write_checkpoint(checkpoint, {'file_name': '歌手 - 歌曲.mp3', 'status': STATUS_FAILED, 'song_id': 42})
+    db = FakeDB(keywords=['阳光', '快乐'])
+    enqueued, notified = _patch_story_jobs(monkeypatch, db)
+    monkeypatch.setattr(bulk_ingest, 'find_existing_songs', lambda db, keys, **kwargs: {key: 42 for key in keys})
+
+    stats = BulkIngest(Flask(__name__), checkpoint_path=str(checkpoint)).run(['歌手 - 歌曲.mp3'])
+
+    # 关键词从数据库重新读取，故事交给后台任务生成，任务在事务提交后才通知
+    assert enqueued == [(42, ['阳光', '快乐'], 0)]
+    assert notified == [1]
+    assert db.commits == 1
+    assert stats['stories'] == 1
+    assert stats['done'] == 1
+    assert stats['existing'] == 0
+    assert IngestCheckpoint(str(checkpoint)).get('歌手 - 歌曲.mp3')['status'] == STATUS_DONE
+
+
+def test_resume_skips_song_that_already_has_a_story(tmp_path, monkeypatch):
+    checkpoint = tmp_path / 'checkpoint.jsonl'
+    # 上次运行中故事已经入库，但在记下完成状态之前进程退出
+    _write_checkpoint(checkpoint, {'file_name': '歌手 - 歌曲.mp3', 'status': STATUS_SAVED, 'song_id': 42})
+    db = FakeDB(keywords=['阳光', '快乐'], has_story=True)
+    enqueued, notified = _patch_story_jobs(monkeypatch, db)
+    monkeypatch.setattr(bulk_ingest, 'find_existing_songs', lambda db, keys, **kwargs: {})
+
+    stats = BulkIngest(Flask(__name__), checkpoint_path=str(checkpoint)).run(['歌手 - 歌曲.mp3'])
+
+    assert enqueued == []
+    assert notified == []
+    assert stats['stories'] == 0
+    assert stats['done'] == 1
+    assert IngestCheckpoint(str(checkpoint)).get('歌手 - 歌曲.mp3')['status'] == STATUS_DONE
+
+
+def test_save_enqueues_story_job_in_song_transaction(monkeypatch):
+    db = FakeDB()
+    enqueued, notified = _patch_story_jobs(monkeypatch, db)
+    monkeypatch.setattr(bulk_ingest, 'save_song', lambda db, *args: (7, True))
+    monkeypatch.setattr(bulk_ingest, 'save_song_keywords', lambda db, song_id, term_counts: ['阳光'])
+
+    item = bulk_ingest.IngestItem('歌手 - 歌曲.mp3', '歌手', '歌曲')
+    BulkIngest(Flask(__name__))._save(item)
+
+    # 任务和歌曲在同一个事务中提交，不会出现歌曲已入库但没有故事任务的情况
+    assert enqueued == [(7, ['阳光'], 0)]
+    assert db.commits == 1
+    assert notified == [1]
+    assert (item.song_id, item.story_job_id) == (7, 1)
@@ -0,0 +1,57 @@
+from app.utils.keyword_index import KeywordIndex, MODE_AND, MODE_OR
+
+
+def _index(*rows):
+    index = KeywordIndex()
+    for keyword, song_id, weight in rows:
+        index._add(keyword, song_id, weight)
+    return index
+
+
+def _scores(results):
+    return {song_id: (round(score, 6), sorted(matched)) for score, song_id, matched in results}
+
+
+def test_add_keeps_song_ids_sorted_and_updates_weights():
+    index = _index(('阳光', 5, 1.0), ('阳光', 2, 1.0), ('阳光', 9, 1.0), ('阳光', 2, 3.0))
+    song_ids, weights = index._postings['阳光']
+    assert list(song_ids) == [2, 5, 9]
+    assert list(weights) == [3.0, 1.0, 1.0]
+
+
+def test_and_mode_intersects_postings():
+    index = _index(
+        ('阳光', 1, 1.0), ('阳光', 2, 2.0), ('阳光', 3, 0.5),
+        ('快乐', 2, 1.0), ('快乐', 3, 1.5), ('快乐', 4, 1.0),
+        ('海边', 3, 0.25),
+    )
+    assert _scores(index.search(['阳光', '快乐'], MODE_AND)) == {
+        2: (3.0, ['快乐', '阳光']),
+        3: (2.0, ['快乐', '阳光']),
+    }
+    assert _scores(index.search(['阳光', '快乐', '海边'], MODE_AND)) == {3: (2.25, ['快乐', '海边', '阳光'])}
+
+
+def test_and_mode_with_unknown_keyword_matches_nothing():
+    index = _index(('阳光', 1, 1.0))
+    assert index.search(['阳光', '不存在'], MODE_AND) == []
+
+
+def test_or_mode_unions_postings_and_sums_weights():
+    index = _index(('阳光', 1, 1.0), ('阳光', 2, 2.0), ('快乐', 2, 1.0), ('快乐', 3, 0.5))
+    assert _scores(index.search(['阳光', '快乐', '不存在'], MODE_OR)) == {
+        1: (1.0, ['阳光']),
+        2: (3.0, ['快乐', '阳光']),
+        3: (0.5, ['快乐']),
+    }
+
+
+def test_top_orders_by_score_then_newest_and_pages():
+    index = _index(('阳光', 1, 1.0), ('阳光', 2, 1.0), ('阳光', 3, 2.0), ('阳光', 4, 0.5))
+
+    total, page = index.top(['阳光'], MODE_AND, limit=2, offset=0)
+    assert total == 4
+    assert [song_id for _, song_id, _ in page] == [3, 2]
+
+    _, page = index.top(['阳光'], MODE_AND, limit=2, offset=2)
+    assert [song_id for _, song_id, _ in page] == [1, 4]
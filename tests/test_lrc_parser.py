@@ -0,0 +1,24 @@
+from app.utils.lrc_parser import TimedLyrics, parse_lrc
+
+
+def test_compact_round_trip():
+    timed = parse_lrc('[ti:歌曲]\n[00:01.00]第一行\n[00:03.50][00:10.00]副歌\n[00:05.00]\n')
+    restored = TimedLyrics.from_compact(timed.to_compact())
+
+    assert list(restored.times) == [1000, 3500, 5000, 10000]
+    assert restored.lines == ['第一行', '副歌', '', '副歌']
+
+
+def test_compact_round_trip_keeps_single_empty_line():
+    timed = parse_lrc('[00:01.00]\n')
+    assert timed.lines == ['']
+
+    restored = TimedLyrics.from_compact(timed.to_compact())
+    assert list(restored.times) == [1000]
+    assert restored.lines == ['']
+
+
+def test_compact_round_trip_without_lines():
+    restored = TimedLyrics.from_compact(TimedLyrics().to_compact())
+    assert not restored.timed
+    assert restored.lines == []
@@ -0,0 +1,71 @@
+from app.utils.lyrics_cache import LYRICS_NOT_FOUND
+from app.utils.lyrics_search import build_boolean_query, parse_lyrics_query, search_lyrics
+
+
+class FakeCursor:
+    """记录绑定参数，返回预先给定的结果行"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.params = None
+        self.closed = False
+
+    def execute(self, sql, params):
+        self.params = params
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        self.closed = True
+
+
+class FakeDB:
+    def __init__(self, rows=()):
+        self.cursor_instance = FakeCursor(list(rows))
+
+    def cursor(self, dictionary=False):
+        return self.cursor_instance
+
+
+def test_search_binds_query_placeholder_and_paging():
+    db = FakeDB()
+    search_lyrics(db, ['找到', '歌词'], limit=10, offset=20)
+
+    # 全文条件在评分和过滤中各用一次，占位文本作为参数排除
+    assert db.cursor_instance.params == ('+"找到" +"歌词"', '+"找到" +"歌词"', LYRICS_NOT_FOUND, 10, 20)
+    assert db.cursor_instance.closed
+
+
+def test_search_maps_rows_and_highlights_matches():
+    db = FakeDB([
+        {'id': 2, 'song_name': '有歌词', 'artist_name': '歌手', 'score': 1.23456789,
+         'lyrics': '第一行\n这首歌词写给你\n终于找到你的歌词'},
+    ])
+
+    results = search_lyrics(db, ['找到', '歌词'], max_snippets=1)
+
+    # 命中不同查询词最多的行优先
+    assert results == [{
+        'song_id': 2,
+        'song_name': '有歌词',
+        'artist_name': '歌手',
+        'score': 1.234568,
+        'snippets': [{'line': 3, 'text': '终于找到你的歌词', 'highlights': [[2, 4], [6, 8]]}]
+    }]
+
+
+def test_search_without_terms_does_not_query():
+    db = FakeDB()
+    assert search_lyrics(db, []) == []
+    assert db.cursor_instance.params is None
+
+
+def test_single_character_terms_are_dropped():
+    assert parse_lyrics_query('爱 你 永远') == ['永远']
+    # 只有单个字符时没有可用的查询词，接口返回400
+    assert parse_lyrics_query('爱 你') == []
+
+
+def test_boolean_query_requires_every_term():
+    assert build_boolean_query(parse_lyrics_query('+找到 "歌词" 找到')) == '+"找到" +"歌词"'
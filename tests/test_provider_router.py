@@ -0,0 +1,142 @@
+import threading
+import time
+from flask import Flask
+from app.utils import lyrics_finder, provider_router
+from app.utils.lyrics_finder import LyricsFinder
+from app.utils.provider_router import ProviderRouter, CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN
+
+
+def test_circuit_opens_after_consecutive_failures():
+    router = ProviderRouter(failure_threshold=3, open_seconds=30.0)
+    for _ in range(2):
+        router.record('netease', False, 0.1)
+    assert router.allow('netease')
+
+    router.record('netease', False, 0.1)
+    assert router.snapshot()['netease']['state'] == CIRCUIT_OPEN
+    assert not router.allow('netease')
+    assert router.order(['netease', 'kugou']) == ['kugou']
+
+
+def test_success_resets_consecutive_failures():
+    router = ProviderRouter(failure_threshold=3)
+    router.record('netease', False, 0.1)
+    router.record('netease', False, 0.1)
+    router.record('netease', True, 0.1)
+    router.record('netease', False, 0.1)
+    assert router.snapshot()['netease']['state'] == CIRCUIT_CLOSED
+
+
+def test_half_open_allows_single_probe(monkeypatch):
+    router = ProviderRouter(failure_threshold=1, open_seconds=30.0)
+    now = [1000.0]
+    monkeypatch.setattr(provider_router.time, 'monotonic', lambda: now[0])
+    router.record('netease', False, 0.1)
+
+    now[0] += 31.0
+    assert router.allow('netease')
+    assert router.snapshot()['netease']['state'] == CIRCUIT_HALF_OPEN
+    # 探测请求进行中时不再放行，也不参与排序
+    assert not router.allow('netease')
+    assert router.order(['netease']) == []
+
+
+def test_half_open_probe_result_closes_or_reopens(monkeypatch):
+    router = ProviderRouter(failure_threshold=1, open_seconds=30.0)
+    now = [1000.0]
+    monkeypatch.setattr(provider_router.time, 'monotonic', lambda: now[0])
+
+    router.record('netease', False, 0.1)
+    now[0] += 31.0
+    assert router.allow('netease')
+    router.record('netease', True, 0.1)
+    assert router.snapshot()['netease']['state'] == CIRCUIT_CLOSED
+
+    router.record('netease', False, 0.1)
+    now[0] += 31.0
+    assert router.allow('netease')
+    router.record('netease', False, 0.1)
+    assert router.snapshot()['netease']['state'] == CIRCUIT_OPEN
+    assert not router.allow('netease')
+
+
+def test_order_prefers_fast_reliable_providers():
+    router = ProviderRouter()
+    router.record('slow', True, 2.0)
+    router.record('fast', True, 0.2)
+    router.record('flaky', True, 0.2)
+    router.record('flaky', False, 0.2)
+    # 没有数据的平台优先尝试
+    assert router.order(['slow', 'flaky', 'fast', 'new']) == ['new', 'fast', 'flaky', 'slow']
+
+
+def test_hedge_delay_uses_p95_or_default():
+    router = ProviderRouter()
+    assert router.hedge_delay('netease', 0.5) == 0.5
+    for latency in (0.1, 0.2, 0.3):
+        router.record('netease', True, latency)
+    assert router.hedge_delay('netease', 0.5) == 0.3
+
+
+def _hedged_finder(monkeypatch, router, providers, **config):
+    app = Flask(__name__)
+    app.config.update(LYRICS_SEARCH_DEADLINE=2.0, LYRICS_HEDGE_DELAY=0.5)
+    app.config.update(config)
+    monkeypatch.setattr(lyrics_finder, 'get_provider_router', lambda: router)
+    finder = LyricsFinder()
+    finder.providers = providers
+    return app, finder
+
+
+def test_parallel_search_starts_next_provider_only_after_hedge_delay(monkeypatch):
+    router = ProviderRouter()
+    calls = []
+
+    def best(song_name, artist_name=None):
+        calls.append('best')
+        time.sleep(0.05)
+        return {'lyrics': 'best'}
+
+    def backup(song_name, artist_name=None):
+        calls.append('backup')
+        return {'lyrics': 'backup'}
+
+    app, finder = _hedged_finder(monkeypatch, router, {'best': best, 'backup': backup})
+    with app.app_context():
+        assert finder._search_parallel(['best', 'backup'], '歌曲') == {'lyrics': 'best'}
+    assert calls == ['best']
+
+
+def test_parallel_search_hedges_when_best_provider_is_slow(monkeypatch):
+    router = ProviderRouter()
+    release = threading.Event()
+
+    def best(song_name, artist_name=None):
+        release.wait(2.0)
+        return {'lyrics': 'best'}
+
+    def backup(song_name, artist_name=None):
+        return {'lyrics': 'backup'}
+
+    app, finder = _hedged_finder(monkeypatch, router, {'best': best, 'backup': backup}, LYRICS_HEDGE_DELAY=0.05)
+    with app.app_context():
+        started = time.monotonic()
+        assert finder._search_parallel(['best', 'backup'], '歌曲') == {'lyrics': 'backup'}
+        assert 0.05 <= time.monotonic() - started < 1.0
+    release.set()
+
+
+def test_parallel_search_moves_on_immediately_when_provider_finds_nothing(monkeypatch):
+    router = ProviderRouter()
+
+    def best(song_name, artist_name=None):
+        return None
+
+    def backup(song_name, artist_name=None):
+        return {'lyrics': 'backup'}
+
+    app, finder = _hedged_finder(monkeypatch, router, {'best': best, 'backup': backup}, LYRICS_HEDGE_DELAY=5.0)
+    with app.app_context():
+        started = time.monotonic()
+        assert finder._search_parallel(['best', 'backup'], '歌曲') == {'lyrics': 'backup'}
+        assert time.monotonic() - started < 1.0
@@ -0,0 +1,90 @@
+import threading
+import time
+import pytest
+from app.utils.single_flight import SingleFlight
+
+
+def _run_concurrently(flight, key, fn, callers):
+    """让callers个线程同时对同一个键调用do，返回各自的结果或异常"""
+    results = [None] * callers
+    threads = []
+
+    def call(i):
+        try:
+            results[i] = flight.do(key, fn)
+        except Exception as e:
+            results[i] = e
+
+    for i in range(callers):
+        thread = threading.Thread(target=call, args=(i,))
+        thread.start()
+        threads.append(thread)
+    return threads, results
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait(2.0)
+        return '故事'
+
+    threads, results = _run_concurrently(flight, 'key', fn, 1)
+    started.wait(2.0)
+    more, more_results = _run_concurrently(flight, 'key', fn, 4)
+    # 让其余调用进入等待后再放行，等待中的调用不会再执行fn
+    time.sleep(0.1)
+    assert flight.in_flight() == 1
+    release.set()
+    for thread in threads + more:
+        thread.join(2.0)
+
+    assert calls == [1]
+    assert results + more_results == ['故事'] * 5
+    assert flight.in_flight() == 0
+
+
+def test_waiters_receive_leader_exception():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def fn():
+        started.set()
+        release.wait(2.0)
+        raise ValueError('failed')
+
+    threads, results = _run_concurrently(flight, 'key', fn, 1)
+    started.wait(2.0)
+    more, more_results = _run_concurrently(flight, 'key', fn, 2)
+    time.sleep(0.1)
+    release.set()
+    for thread in threads + more:
+        thread.join(2.0)
+
+    assert all(isinstance(result, ValueError) for result in results + more_results)
+    assert flight.in_flight() == 0
+
+
+def test_key_is_released_after_failure():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError('failed')
+
+    with pytest.raises(ValueError):
+        flight.do('key', fail)
+
+    # 失败后同一个键的下一次调用重新执行
+    assert flight.do('key', lambda: 'ok') == 'ok'
+
+
+def test_different_keys_run_independently():
+    flight = SingleFlight()
+    assert flight.do('a', lambda: 1) == 1
+    assert flight.do('b', lambda: 2) == 2
@@ -0,0 +1,35 @@
+from app.utils.song_pipeline import parse_song_file_name, song_identity_key
+
+
+def test_case_width_and_punctuation_do_not_change_key():
+    key = song_identity_key('周杰伦', 'Hello World')
+    assert song_identity_key('周杰伦 ', 'hello  world') == key
+    assert song_identity_key('周杰伦', 'ＨＥＬＬＯ－ＷＯＲＬＤ') == key
+    assert song_identity_key('周杰伦', 'Hello_World!') == key
+
+
+def test_version_brackets_are_ignored():
+    key = song_identity_key('歌手', '晴天')
+    assert song_identity_key('歌手', '晴天 (Live)') == key
+    assert song_identity_key('歌手', '晴天（伴奏版）') == key
+    assert song_identity_key('歌手', '晴天【Remix】') == key
+
+
+def test_name_entirely_in_brackets_is_kept():
+    assert song_identity_key('歌手', '(Intro)') != song_identity_key('歌手', '(Outro)')
+
+
+def test_artist_and_title_are_not_concatenated():
+    # 分隔符避免字段边界不同的两首歌得到相同的键
+    assert song_identity_key('ab', 'c') != song_identity_key('a', 'bc')
+
+
+def test_different_songs_get_different_keys():
+    assert song_identity_key('歌手', '晴天') != song_identity_key('歌手', '雨天')
+    assert song_identity_key('歌手甲', '晴天') != song_identity_key('歌手乙', '晴天')
+
+
+def test_file_name_parsing_matches_key():
+    assert parse_song_file_name('周杰伦 - 晴天 (Live).mp3') == ('周杰伦', '晴天 (Live)')
+    assert parse_song_file_name('没有分隔符.mp3') is None
+    assert song_identity_key(*parse_song_file_name('周杰伦 - 晴天 (Live).mp3')) == song_identity_key('周杰伦', '晴天')
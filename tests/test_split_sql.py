@@ -0,0 +1,34 @@
+from app.utils.database import split_sql
+
+
+def test_splits_statements_on_trailing_semicolon():
+    script = (
+        "-- 创建表\n"
+        "CREATE TABLE a (\n"
+        "    id INT PRIMARY KEY  -- 主键\n"
+        ");\n"
+        "\n"
+        "CREATE INDEX idx_a ON a (id);\n"
+    )
+    assert split_sql(script) == [
+        "CREATE TABLE a (\n    id INT PRIMARY KEY  -- 主键\n)",
+        "CREATE INDEX idx_a ON a (id)",
+    ]
+
+
+def test_semicolon_inside_line_does_not_split():
+    script = "INSERT INTO t VALUES ('a;b');\nUPDATE t SET v = 'x;'\n  WHERE id = 1;\n"
+    assert split_sql(script) == ["INSERT INTO t VALUES ('a;b')", "UPDATE t SET v = 'x;'\n  WHERE id = 1"]
+
+
+def test_leading_comments_and_blank_lines_are_dropped():
+    assert split_sql("\n-- 注释\n   -- 缩进的注释\n\nSELECT 1;\n-- 结尾注释\n") == ["SELECT 1"]
+
+
+def test_last_statement_without_semicolon_is_kept():
+    assert split_sql("SELECT 1;\nSELECT 2\n") == ["SELECT 1", "SELECT 2"]
+
+
+def test_empty_script():
+    assert split_sql("") == []
+    assert split_sql("-- 只有注释\n") == []
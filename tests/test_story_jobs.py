@@ -0,0 +1,137 @@
+import json
+import pytest
+from flask import Flask, g
+from app.utils import story_jobs
+from app.utils.story_jobs import StoryJobWorker, JOB_DONE, JOB_FAILED, JOB_PENDING
+from app.utils.story_generator import StoryGenerationError
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.rowcount = 1
+
+    def execute(self, sql, params=()):
+        self.db.queries.append((sql, params))
+
+    def fetchone(self):
+        return self.db.job_row
+
+    def close(self):
+        pass
+
+
+class FakeDB:
+    def __init__(self, attempts=1):
+        self.job_row = (42, json.dumps(['阳光', '快乐']), attempts)
+        self.queries = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def updates(self):
+        """返回写入story_jobs的状态和参数"""
+        return [params for sql, params in self.queries if sql.startswith('UPDATE story_jobs SET status')]
+
+
+def _worker(monkeypatch, db, generate, max_attempts=3):
+    def get_db():
+        # 和真实实现一样把连接放在应用上下文中，离开上下文即归还
+        g.db = db
+        return db
+
+    monkeypatch.setattr(story_jobs, 'get_db', get_db)
+    monkeypatch.setattr(story_jobs, 'find_reusable_story', lambda db, keywords: (None, 'prompt', 'key'))
+    monkeypatch.setattr(story_jobs, 'generate_shared_story', generate)
+    monkeypatch.setattr(story_jobs, 'save_story', lambda db, song_id, story, prompt, prompt_key: 7)
+    monkeypatch.setattr(story_jobs, 'invalidate_song_responses', lambda song_id: None)
+    return StoryJobWorker(Flask(__name__), max_attempts=max_attempts, retry_backoff=10.0, max_backoff=600.0)
+
+
+def test_process_releases_connection_while_generating(monkeypatch):
+    db = FakeDB()
+
+    def generate(keywords, prompt_key):
+        assert 'db' not in g
+        return '故事'
+
+    _worker(monkeypatch, db, generate)._process(1)
+
+    # 最后一次状态更新是领取之后的完成
+    assert db.updates()[-1] == (JOB_DONE, 7, 1)
+
+
+def test_generation_error_requeues_with_backoff(monkeypatch):
+    db = FakeDB(attempts=1)
+
+    def generate(keywords, prompt_key):
+        raise StoryGenerationError('timeout')
+
+    _worker(monkeypatch, db, generate)._process(1)
+
+    sql, params = db.queries[-1]
+    assert 'not_before = NOW() + INTERVAL' in sql
+    assert params == (JOB_PENDING, 'timeout', 10.0, 600.0, 1)
+
+
+def test_generation_error_on_last_attempt_marks_failed(monkeypatch):
+    db = FakeDB(attempts=3)
+
+    def generate(keywords, prompt_key):
+        raise StoryGenerationError('timeout')
+
+    _worker(monkeypatch, db, generate, max_attempts=3)._process(1)
+
+    assert db.updates()[-1] == (JOB_FAILED, 'timeout', 1)
+
+
+def test_unexpected_error_releases_job_and_reraises(monkeypatch):
+    db = FakeDB(attempts=1)
+
+    def generate(keywords, prompt_key):
+        raise RuntimeError('boom')
+
+    worker = _worker(monkeypatch, db, generate)
+    with pytest.raises(RuntimeError):
+        worker._process(1)
+
+    # 不会停留在运行中等待超时回收
+    assert db.updates()[-1] == (JOB_PENDING, 'boom', 10.0, 600.0, 1)
+
+
+def test_drain_claims_pending_jobs_until_none_left(monkeypatch):
+    worker = _worker(monkeypatch, FakeDB(), lambda keywords, prompt_key: '故事')
+    pending = [3, 4, 5]
+    processed = []
+    monkeypatch.setattr(worker, '_recover_stale', lambda db: None)
+    monkeypatch.setattr(worker, '_next_pending', lambda db: pending.pop(0) if pending else None)
+    monkeypatch.setattr(worker, '_process', processed.append)
+
+    worker._drain()
+
+    assert processed == [3, 4, 5]
+
+
+def test_drain_yields_to_notified_jobs(monkeypatch):
+    worker = _worker(monkeypatch, FakeDB(), lambda keywords, prompt_key: '故事')
+    processed = []
+    monkeypatch.setattr(worker, '_recover_stale', lambda db: None)
+    monkeypatch.setattr(worker, '_next_pending', lambda db: 3)
+
+    def process(job_id):
+        processed.append(job_id)
+        worker.notify(9)
+
+    monkeypatch.setattr(worker, '_process', process)
+    worker._drain()
+
+    # 本进程有新任务时回到队列，先处理通知的任务
+    assert processed == [3]
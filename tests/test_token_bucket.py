@@ -0,0 +1,59 @@
+from app.utils import story_generator
+from app.utils.story_generator import TokenBucket
+
+
+class FakeClock:
+    """替换time.monotonic和time.sleep，sleep直接推进时间"""
+
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _bucket(monkeypatch, rate, capacity):
+    clock = FakeClock()
+    monkeypatch.setattr(story_generator.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(story_generator.time, 'sleep', clock.sleep)
+    return TokenBucket(rate, capacity), clock
+
+
+def test_burst_up_to_capacity_without_waiting(monkeypatch):
+    bucket, clock = _bucket(monkeypatch, rate=2.0, capacity=3)
+    assert all(bucket.acquire(timeout=0) for _ in range(3))
+    assert not bucket.acquire(timeout=0)
+    assert clock.sleeps == []
+
+
+def test_waits_for_refill_within_timeout(monkeypatch):
+    bucket, clock = _bucket(monkeypatch, rate=2.0, capacity=1)
+    assert bucket.acquire(timeout=0)
+
+    # 每秒补充2个令牌，下一个令牌需要等0.5秒
+    assert bucket.acquire(timeout=1.0)
+    assert clock.sleeps == [0.5]
+
+
+def test_gives_up_when_refill_exceeds_timeout(monkeypatch):
+    bucket, clock = _bucket(monkeypatch, rate=1.0, capacity=1)
+    assert bucket.acquire(timeout=0)
+
+    assert not bucket.acquire(timeout=0.5)
+    assert clock.sleeps == []
+
+
+def test_idle_time_refills_only_up_to_capacity(monkeypatch):
+    bucket, clock = _bucket(monkeypatch, rate=10.0, capacity=2)
+    assert bucket.acquire(timeout=0)
+    assert bucket.acquire(timeout=0)
+
+    clock.now += 60
+    assert bucket.acquire(timeout=0)
+    assert bucket.acquire(timeout=0)
+    assert not bucket.acquire(timeout=0)